@@ -0,0 +1,158 @@
+"""Offline batch-job mode: emit pipeline prompts as batch-request JSONL and ingest batch results.
+
+The pipeline runs in rounds against a BatchClient instead of a live client.
+Requests that already have a response in the ingested results are answered
+from them; every other request is recorded for the next batch file and
+answered with an empty placeholder so the pipeline can continue. Stages that
+depend on earlier responses (e.g. verification after Stage 1) are emitted in
+a later round, once those responses have been ingested. When a round records
+no pending requests, the pipeline can be run to completion from the results.
+"""
+
+import json
+
+from llm_cache import request_key
+
+_SCHEMA_TYPES = {"object", "array", "string", "integer", "number", "boolean"}
+
+
+def config_request_key(model: str, contents: str, config) -> str:
+    """request_key() for a generate_content call, matching call_gemini's cache key."""
+    thinking_config = getattr(config, "thinking_config", None)
+    return request_key(
+        model,
+        config.system_instruction,
+        contents,
+        config.response_schema,
+        config.temperature,
+        getattr(thinking_config, "thinking_budget", None),
+    )
+
+
+def _to_api_schema(schema):
+    """Convert a JSON schema dict to the REST API form (upper-case type names)."""
+    if isinstance(schema, dict):
+        return {
+            k: v.upper() if k == "type" and isinstance(v, str) and v in _SCHEMA_TYPES
+            else _to_api_schema(v)
+            for k, v in schema.items()
+        }
+    if isinstance(schema, list):
+        return [_to_api_schema(v) for v in schema]
+    return schema
+
+
+def _empty_response(schema: dict):
+    """Smallest value satisfying the required fields of a response schema."""
+    if schema.get("type") == "array":
+        return []
+    if schema.get("type") == "object":
+        props = schema.get("properties", {})
+        return {name: _empty_response(props[name]) for name in schema.get("required", [])}
+    return None
+
+
+def build_batch_request(key: str, contents: str, config) -> dict:
+    """One line of a Gemini batch-request JSONL file (the model is set on the batch job)."""
+    generation_config = {
+        "responseMimeType": config.response_mime_type,
+        "responseSchema": _to_api_schema(config.response_schema),
+        "temperature": config.temperature,
+    }
+    thinking_config = getattr(config, "thinking_config", None)
+    if thinking_config is not None:
+        generation_config["thinkingConfig"] = {
+            "thinkingBudget": thinking_config.thinking_budget,
+        }
+    return {
+        "key": key,
+        "request": {
+            "contents": [{"role": "user", "parts": [{"text": contents}]}],
+            "systemInstruction": {"parts": [{"text": config.system_instruction}]},
+            "generationConfig": generation_config,
+        },
+    }
+
+
+def load_batch_results(paths: list[str]) -> dict[str, str]:
+    """Read batch result JSONL files into {key: response_text}.
+
+    Lines carrying an error (or no candidate text) are skipped, so those
+    requests are emitted again in the next round.
+    """
+    results = {}
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                record = json.loads(line)
+                if "error" in record or "response" not in record:
+                    continue
+                candidates = record["response"].get("candidates", [])
+                if not candidates:
+                    continue
+                parts = candidates[0].get("content", {}).get("parts", [])
+                text = "".join(p.get("text", "") for p in parts if not p.get("thought"))
+                if text:
+                    results[record["key"]] = text
+    return results
+
+
+class _BatchResponse:
+    def __init__(self, text: str):
+        self.text = text
+        self.usage_metadata = None
+
+
+class _BatchModels:
+    def __init__(self, owner: "BatchClient"):
+        self._owner = owner
+
+    def generate_content(self, model: str, contents: str, config) -> _BatchResponse:
+        return self._owner._respond(model, contents, config)
+
+
+class _AsyncBatchModels:
+    def __init__(self, owner: "BatchClient"):
+        self._owner = owner
+
+    async def generate_content(self, model: str, contents: str, config) -> _BatchResponse:
+        return self._owner._respond(model, contents, config)
+
+
+class _AsyncBatchNamespace:
+    def __init__(self, owner: "BatchClient"):
+        self.models = _AsyncBatchModels(owner)
+
+
+class BatchClient:
+    """Stand-in for genai.Client that answers from ingested batch results.
+
+    Unknown requests are collected in `pending` and answered with an empty
+    placeholder.
+    """
+
+    def __init__(self, results: dict[str, str]):
+        self.results = results
+        self.pending: dict[str, dict] = {}
+        self.served = 0
+        self.models = _BatchModels(self)
+        self.aio = _AsyncBatchNamespace(self)
+
+    def _respond(self, model: str, contents: str, config) -> _BatchResponse:
+        key = config_request_key(model, contents, config)
+        if key in self.results:
+            self.served += 1
+            return _BatchResponse(self.results[key])
+        if key not in self.pending:
+            self.pending[key] = build_batch_request(key, contents, config)
+        return _BatchResponse(json.dumps(_empty_response(config.response_schema)))
+
+    def write_pending(self, path: str) -> int:
+        """Write pending requests as batch-request JSONL. Returns the count."""
+        with open(path, "w", encoding="utf-8") as f:
+            for request in self.pending.values():
+                f.write(json.dumps(request, ensure_ascii=False) + "\n")
+        return len(self.pending)
@@ -0,0 +1,296 @@
+"""Microbenchmarks for the CPU-side hot paths, with time/memory baselines.
+
+    python bench_hotpaths.py                              # synthetic docs, 10/100/1000
+    python bench_hotpaths.py --save-baseline              # record bench_baseline.json
+    python bench_hotpaths.py --sizes 10 1000 100000       # compare against the baseline
+    python bench_hotpaths.py --jacred /tmp/JacRED/ --inflate 100
+
+Each case runs over the first N docs for every size N: best-of-`--repeat`
+wall time, plus peak traced memory from a separate tracemalloc run. With a
+baseline file present, cases slower or larger than the baseline by more
+than `--tolerance` are flagged and the exit status is 1.
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from data_loader import (
+    build_constraint_table,
+    doc_to_text,
+    format_few_shot_output,
+    load_jacred,
+    select_few_shot,
+)
+from constraint_index import ConstraintIndex
+from evaluation import align_entities, evaluate_relations
+from extraction import _merge_entities_across_passes, _parse_extraction_result
+from prompts import (
+    RELATION_GROUPS,
+    PromptAssembler,
+    build_extraction_prompt,
+    build_group_extraction_prompt,
+)
+from synthetic import (
+    ENTITY_TYPES,
+    RELATIONS,
+    inflate_corpus,
+    synthetic_corpus,
+    synthetic_extraction,
+    synthetic_triples,
+)
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_baseline.json")
+SIZES = [10, 100, 1000]
+REPEAT = 3
+TOLERANCE = 0.25
+# Time regressions are only flagged for cases taking at least this long (timer noise)
+MIN_SEC = 0.005
+
+
+def prepare(docs: list[dict], few_shot: dict, rel_info: dict, seed: int = 0,
+            triples_per_pass: int = 10) -> dict:
+    """Precompute every benchmark input, so cases time only the function under test."""
+    rng = random.Random(seed)
+    extractions = [synthetic_extraction(doc, rng) for doc in docs]
+    parsed = [_parse_extraction_result(result) for result in extractions]
+    passes = []
+    for doc in docs:
+        pass_entities, pass_triples = [], []
+        for _ in RELATION_GROUPS:
+            entities = synthetic_extraction(doc, rng)["entities"]
+            pass_entities.append(entities)
+            pass_triples.append(
+                synthetic_triples(entities, triples_per_pass, rng) if len(entities) >= 2 else []
+            )
+        passes.append((pass_entities, pass_triples))
+    return {
+        "docs": docs,
+        "texts": [doc.get("doc_text") or doc_to_text(doc) for doc in docs],
+        "extractions": extractions,
+        "parsed": parsed,
+        "alignments": [
+            align_entities(entities, doc["vertexSet"])
+            for doc, (entities, _) in zip(docs, parsed)
+        ],
+        "passes": passes,
+        "few_shot_text": few_shot.get("doc_text") or doc_to_text(few_shot),
+        "few_shot_output": format_few_shot_output(few_shot),
+        "rel_info": rel_info,
+        "rel2id": {r: i for i, r in enumerate(RELATIONS)},
+        "ent2id": {t: i for i, t in enumerate(ENTITY_TYPES)},
+    }
+
+
+def _bench_parse(data):
+    for result in data["extractions"]:
+        _parse_extraction_result(result)
+
+
+def _bench_align(data):
+    for doc, (entities, _) in zip(data["docs"], data["parsed"]):
+        align_entities(entities, doc["vertexSet"])
+
+
+def _bench_evaluate(data):
+    for doc, (_, triples), alignment in zip(data["docs"], data["parsed"], data["alignments"]):
+        evaluate_relations(triples, doc.get("labels", []), alignment)
+
+
+def _bench_merge(data):
+    for pass_entities, pass_triples in data["passes"]:
+        _merge_entities_across_passes(pass_entities, pass_triples)
+
+
+def _bench_constraint_table(data):
+    build_constraint_table(data["docs"])
+
+
+def _bench_constraint_index(data):
+    ConstraintIndex.build(data["docs"], data["rel2id"], data["ent2id"])
+
+
+def _bench_extraction_prompt(data):
+    for text in data["texts"]:
+        build_extraction_prompt(text, data["few_shot_text"], data["few_shot_output"])
+
+
+def _bench_group_prompts(data):
+    for text in data["texts"]:
+        for pcodes in RELATION_GROUPS.values():
+            build_group_extraction_prompt(
+                text, data["few_shot_text"], data["few_shot_output"], pcodes
+            )
+
+
+def _bench_assembler(data):
+    assembler = PromptAssembler(data["rel_info"], data["few_shot_text"], data["few_shot_output"])
+    for text in data["texts"]:
+        assembler.extraction(text)
+        for group_name in RELATION_GROUPS:
+            assembler.group_extraction(group_name, text)
+
+
+CASES = {
+    "parse_extraction_result": _bench_parse,
+    "align_entities": _bench_align,
+    "evaluate_relations": _bench_evaluate,
+    "merge_entities_across_passes": _bench_merge,
+    "build_constraint_table": _bench_constraint_table,
+    "constraint_index_build": _bench_constraint_index,
+    "build_extraction_prompt": _bench_extraction_prompt,
+    "build_group_extraction_prompt": _bench_group_prompts,
+    "prompt_assembler": _bench_assembler,
+}
+
+
+def _slice(data: dict, n: int) -> dict:
+    return {k: v[:n] if isinstance(v, list) else v for k, v in data.items()}
+
+
+def measure(fn, data: dict, repeat: int) -> dict:
+    """Best-of-repeat wall time and peak traced memory of fn(data)."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(data)
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        fn(data)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    n = len(data["docs"])
+    return {
+        "docs": n,
+        "sec": round(best, 6),
+        "us_per_doc": round(best / n * 1e6, 2) if n else None,
+        "peak_kb": round(peak / 1024, 1),
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> tuple[int, list[str]]:
+    """(cases compared, messages for cases exceeding the baseline by more than tolerance)."""
+    regressions = []
+    compared = 0
+    for key, current in results.items():
+        base = baseline.get(key)
+        if base is None:
+            continue
+        compared += 1
+        for metric in ("sec", "peak_kb"):
+            if metric == "sec" and base[metric] < MIN_SEC:
+                continue
+            if base[metric] and current[metric] > base[metric] * (1 + tolerance):
+                regressions.append(
+                    f"{key}: {metric} {current[metric]} vs baseline {base[metric]} "
+                    f"({current[metric] / base[metric] - 1:+.0%})"
+                )
+    return compared, regressions
+
+
+def load_corpus(args) -> tuple[str, list[dict], dict, dict]:
+    """(source label, docs, few-shot doc, rel_info) for the chosen data source."""
+    if args.jacred:
+        data = load_jacred(args.jacred, lazy=True)
+        docs = list(data[args.split])
+        if args.inflate > 1:
+            docs = inflate_corpus(docs, args.inflate)
+        source = f"jacred-{args.split}" + (f"x{args.inflate}" if args.inflate > 1 else "")
+        return source, docs, select_few_shot(data["train"]), data["rel_info"]
+
+    docs = synthetic_corpus(
+        max(args.sizes) + 1, seed=args.seed,
+        n_sents=args.sents, n_entities=args.entities, n_labels=args.labels,
+    )
+    source = f"synthetic-s{args.sents}-e{args.entities}-l{args.labels}"
+    rel_info = {r: r for r in RELATIONS}
+    return source, docs[1:], docs[0], rel_info
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES,
+                        help="Numbers of docs to benchmark (default: %(default)s)")
+    parser.add_argument("--cases", nargs="+", choices=list(CASES), default=list(CASES))
+    parser.add_argument("--repeat", type=int, default=REPEAT,
+                        help="Timed runs per case; the best is kept (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--sents", type=int, default=8, help="Synthetic: sentences per doc")
+    parser.add_argument("--entities", type=int, default=15, help="Synthetic: entities per doc")
+    parser.add_argument("--labels", type=int, default=12, help="Synthetic: gold labels per doc")
+    parser.add_argument("--jacred", metavar="PATH", default=None,
+                        help="Benchmark real JacRED docs from this directory instead")
+    parser.add_argument("--split", choices=["train", "dev", "test"], default="dev")
+    parser.add_argument("--inflate", type=int, default=1,
+                        help="With --jacred: repeat the split this many times")
+    parser.add_argument("--baseline", default=BASELINE_PATH,
+                        help="Baseline JSON to compare against / save to (default: %(default)s)")
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="Store these results as the baseline (merged into the file)")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE,
+                        help="Allowed slowdown/memory growth before flagging (default: %(default)s)")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    source, docs, few_shot, rel_info = load_corpus(args)
+    sizes = sorted(n for n in set(args.sizes) if n <= len(docs))
+    if not sizes:
+        sys.exit(f"No size fits the {len(docs)} available docs")
+    print(f"=== Hot-path benchmarks: {source}, sizes {sizes} ===")
+    prepared = prepare(docs[:max(sizes)], few_shot, rel_info, seed=args.seed)
+
+    results = {}
+    print(f"{'case':>30} {'docs':>7} {'total ms':>10} {'us/doc':>10} {'peak KB':>10}")
+    for case in args.cases:
+        for n in sizes:
+            r = measure(CASES[case], _slice(prepared, n), args.repeat)
+            results[f"{source}/{case}/{n}"] = r
+            print(f"{case:>30} {n:>7} {r['sec'] * 1000:>10.2f} "
+                  f"{r['us_per_doc']:>10.1f} {r['peak_kb']:>10.1f}")
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    if args.save_baseline:
+        baseline.setdefault("results", {}).update(results)
+        baseline["meta"] = {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "timestamp": datetime.now().isoformat(),
+        }
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, indent=2)
+        print(f"\nBaseline saved to {args.baseline}")
+        return
+
+    if not baseline:
+        print(f"\nNo baseline at {args.baseline}; run with --save-baseline to record one.")
+        return
+    compared, regressions = compare(results, baseline.get("results", {}), args.tolerance)
+    if regressions:
+        print(f"\n{len(regressions)} regressions (tolerance {args.tolerance:.0%}):")
+        for message in regressions:
+            print(f"  {message}")
+        sys.exit(1)
+    print(f"\nNo regressions in {compared} cases compared against {args.baseline} "
+          f"(tolerance {args.tolerance:.0%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""Per-call token, latency and cost accounting for Gemini calls.
+
+Every call_gemini call appends one record to a CallLog, tagged with the
+pipeline context it ran in (condition, doc, group, verification batch, ...).
+Tags set with call_tags() live in a ContextVar, so they follow asyncio tasks
+and asyncio.to_thread; thread-pool submissions must run in a copied context.
+"""
+
+import threading
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from itertools import count
+
+_TAGS: ContextVar[dict] = ContextVar("call_tags", default={})
+
+# Token counters summed per record (names follow usage_metadata fields)
+TOKEN_FIELDS = ("prompt_tokens", "cached_tokens", "thought_tokens", "output_tokens", "total_tokens")
+
+
+@contextmanager
+def call_tags(**tags):
+    """Add tags to every call made inside the block (nested blocks extend them)."""
+    token = _TAGS.set({**_TAGS.get(), **tags})
+    try:
+        yield
+    finally:
+        _TAGS.reset(token)
+
+
+def current_tags() -> dict:
+    return dict(_TAGS.get())
+
+
+def usage_counts(resp) -> dict:
+    """Token counts from a generate_content response (0 when not reported)."""
+    usage = getattr(resp, "usage_metadata", None)
+
+    def count(name):
+        return getattr(usage, name, None) or 0
+
+    return {
+        "prompt_tokens": count("prompt_token_count"),
+        "cached_tokens": count("cached_content_token_count"),
+        "thought_tokens": count("thoughts_token_count"),
+        "output_tokens": count("candidates_token_count"),
+        "total_tokens": count("total_token_count"),
+    }
+
+
+def _percentile(values: list[float], q: float) -> float | None:
+    """Nearest-rank percentile."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * q // 100))
+    return round(ordered[int(rank) - 1], 3)
+
+
+def summarize_calls(
+    records: list[dict],
+    price_input: float | None = None,
+    price_output: float | None = None,
+) -> dict:
+    """Totals, latency percentiles and (with prices in USD per 1M tokens) cost.
+
+    A record may carry a "share" < 1 when one call served several docs
+    (packed extraction); its counts are scaled accordingly.
+    """
+    summary = {name: 0 for name in TOKEN_FIELDS}
+    latencies = []
+    calls = cache_hits = retries = errors = 0
+    latency_total = 0.0
+    for record in records:
+        share = record.get("share", 1.0)
+        for name in TOKEN_FIELDS:
+            summary[name] += record[name] * share
+        calls += 1
+        cache_hits += record["cache_hit"]
+        retries += record["retries"]
+        errors += record["error"]
+        latency_total += record["latency_sec"] * share
+        if not record["cache_hit"]:
+            latencies.append(record["latency_sec"])
+
+    summary = {name: round(value) for name, value in summary.items()}
+    summary.update({
+        "calls": calls,
+        "cache_hits": cache_hits,
+        "retries": retries,
+        "errors": errors,
+        "latency_sec_total": round(latency_total, 3),
+        "latency_sec_p50": _percentile(latencies, 50),
+        "latency_sec_p95": _percentile(latencies, 95),
+    })
+    if price_input is not None and price_output is not None:
+        # Thinking tokens are billed as output
+        billed_output = summary["thought_tokens"] + summary["output_tokens"]
+        summary["cost_usd"] = round(
+            (summary["prompt_tokens"] * price_input + billed_output * price_output) / 1e6, 6
+        )
+    return summary
+
+
+class CallLog:
+    """Thread-safe list of per-call records, indexed by doc title."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._records: list[dict] = []
+        # doc title -> records tagged with it (a packed call under each of its titles)
+        self._by_doc: dict[str, list[dict]] = {}
+        # call_id = session + sequence, unique across processes (e.g. resumed runs)
+        self._session = uuid.uuid4().hex[:8]
+        self._ids = count()
+
+    def _index(self, record: dict) -> None:
+        docs = record.get("doc")
+        for title in docs if isinstance(docs, tuple) else (docs,):
+            if title is not None:
+                self._by_doc.setdefault(title, []).append(record)
+
+    def record(self, **fields) -> None:
+        """Append a record, tagged with the current call_tags() and a unique call_id."""
+        record = {**current_tags(), **fields, "call_id": f"{self._session}-{next(self._ids)}"}
+        with self._lock:
+            self._records.append(record)
+            self._index(record)
+
+    def records(self, **tags) -> list[dict]:
+        """Records whose tags match all given values."""
+        with self._lock:
+            return [r for r in self._records if _matches(r, tags)]
+
+    def doc_records(self, title: str, **tags) -> list[dict]:
+        """Matching records for one doc.
+
+        A packed call (doc tag is a tuple of titles) is included with a
+        "share" of 1/len(docs), so its usage is split evenly across its docs.
+        """
+        with self._lock:
+            candidates = list(self._by_doc.get(title, ()))
+        records = []
+        for record in candidates:
+            if not _matches(record, tags):
+                continue
+            docs = record["doc"]
+            if isinstance(docs, tuple):
+                record = {**record, "share": 1 / len(docs)}
+            records.append(record)
+        return records
+
+    def pop(self, **tags) -> list[dict]:
+        """Remove and return the records whose tags match all given values."""
+        with self._lock:
+            popped, kept = [], []
+            for r in self._records:
+                (popped if _matches(r, tags) else kept).append(r)
+            self._records = kept
+            self._by_doc = {}
+            for r in kept:
+                self._index(r)
+        return popped
+
+    def clear(self) -> None:
+        with self._lock:
+            self._records.clear()
+            self._by_doc.clear()
+
+
+def _matches(record: dict, tags: dict) -> bool:
+    return all(record.get(k) == v for k, v in tags.items())
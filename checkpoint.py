@@ -0,0 +1,115 @@
+"""Append-only JSONL checkpoint of finished (condition, doc) results for resumable runs."""
+
+import json
+import os
+import threading
+
+
+class Checkpoint:
+    """Per-doc results appended (and fsynced) as each doc finishes.
+
+    The first line holds the run configuration; every other line is
+    {"condition", "doc": per-doc result, "calls": CALL_LOG records}. With
+    resume=True an existing file is reloaded (a torn last line from a crash
+    is dropped) and must have been written with the same configuration.
+    Otherwise the file is started afresh, which for a file that already
+    holds results requires overwrite=True (FileExistsError without it).
+    """
+
+    def __init__(self, path: str, config: dict, resume: bool = False, overwrite: bool = False):
+        self.path = path
+        # Normalized through JSON so it compares equal to the reloaded header
+        self.config = json.loads(json.dumps(config, ensure_ascii=False))
+        self._lock = threading.Lock()
+        self._entries: list[dict] = []
+
+        if resume and os.path.exists(path):
+            saved_config, self._entries = read_checkpoint(path)
+            if saved_config != config:
+                raise ValueError(
+                    f"Checkpoint {path} was written with a different configuration: "
+                    f"{saved_config} != {config}"
+                )
+        elif not resume and not overwrite and has_results(path):
+            raise FileExistsError(f"Checkpoint {path} already holds results")
+        # Also drops a possibly torn trailing line before appending
+        self._rewrite()
+
+    @classmethod
+    def load(cls, path: str) -> "Checkpoint":
+        """Open an existing checkpoint with whatever configuration it was written with."""
+        config, _ = read_checkpoint(path)
+        return cls(path, config, resume=True)
+
+    def _rewrite(self) -> None:
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"config": self.config}, ensure_ascii=False) + "\n")
+            for entry in self._entries:
+                f.write(json.dumps(entry, ensure_ascii=False, default=str) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def completed(self, condition: str) -> dict[str, dict]:
+        """{doc title: per-doc result} already recorded for condition."""
+        with self._lock:
+            return {
+                e["doc"]["title"]: e["doc"] for e in self._entries if e["condition"] == condition
+            }
+
+    def calls(self, condition: str) -> list[dict]:
+        """Call records of condition, each once (packed calls are stored per doc)."""
+        seen = set()
+        records = []
+        with self._lock:
+            for entry in self._entries:
+                if entry["condition"] != condition:
+                    continue
+                for record in entry["calls"]:
+                    if record["call_id"] not in seen:
+                        seen.add(record["call_id"])
+                        records.append({k: v for k, v in record.items() if k != "share"})
+        return records
+
+    def conditions(self) -> list[str]:
+        """Conditions present, in first-seen order."""
+        with self._lock:
+            return list(dict.fromkeys(e["condition"] for e in self._entries))
+
+    def append(self, condition: str, doc_result: dict, calls: list[dict]) -> None:
+        """Durably record one finished doc."""
+        entry = {"condition": condition, "doc": doc_result, "calls": calls}
+        line = json.dumps(entry, ensure_ascii=False, default=str) + "\n"
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+            self._entries.append(json.loads(line))
+
+
+def has_results(path: str) -> bool:
+    """True if path is a checkpoint with at least one recorded doc."""
+    try:
+        with open(path, encoding="utf-8") as f:
+            f.readline()
+            return bool(f.readline().strip())
+    except FileNotFoundError:
+        return False
+
+
+def read_checkpoint(path: str) -> tuple[dict, list[dict]]:
+    """Return (config, entries), ignoring an incomplete final line."""
+    with open(path, encoding="utf-8") as f:
+        lines = f.read().split("\n")
+    config = json.loads(lines[0])["config"]
+    entries = []
+    for line in lines[1:]:
+        if not line:
+            continue
+        try:
+            entries.append(json.loads(line))
+        except json.JSONDecodeError:
+            break
+    return config, entries
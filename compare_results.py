@@ -0,0 +1,160 @@
+"""Compare P/R/F1 across runs from their streaming summaries, without loading details.
+
+    python compare_results.py results_20flash.json results_25flash_t0.json   # deltas vs the first run
+    python compare_results.py results_*.json --versus baseline               # each condition vs baseline, per run
+    python compare_results.py results_a results_b --levels relation doc --conditions relation_split
+
+Runs are given as results stems or files (.json, .summary.tsv,
+.docs.jsonl). A results .json without a summary next to it is converted to
+the streaming layout once (see results_io); after that only the summary
+tables are scanned, row by row.
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from results_io import convert_results, iter_summary, stream_paths
+
+LEVELS = ["aggregate", "relation", "doc"]
+_SUFFIXES = (".summary.tsv", ".docs.jsonl", ".details.jsonl", ".json")
+
+
+def resolve_run(path: str) -> tuple[str, str]:
+    """(run label, summary path) for a results stem or file, converting .json if needed."""
+    stem = path
+    for suffix in _SUFFIXES:
+        if path.endswith(suffix):
+            stem = path[:-len(suffix)]
+            break
+    summary = stream_paths(stem)["summary"]
+    if not os.path.exists(summary):
+        if not os.path.exists(stem + ".json"):
+            raise FileNotFoundError(f"No {summary} or {stem}.json")
+        convert_results(stem + ".json", stem)
+        print(f"Converted {stem}.json -> {summary}")
+    return os.path.basename(stem), summary
+
+
+def load_table(runs: list[tuple[str, str]], conditions=None, levels=None) -> tuple[dict, dict]:
+    """({(run, condition, level, key): metrics}, {(condition, level): keys in first-seen order})."""
+    table = {}
+    keys: dict[tuple[str, str], dict] = {}
+    for label, summary in runs:
+        for row in iter_summary(summary, conditions, levels):
+            table[(label, row["condition"], row["level"], row["key"])] = row
+            keys.setdefault((row["condition"], row["level"]), {})[row["key"]] = None
+    return table, {k: list(v) for k, v in keys.items()}
+
+
+def _delta(metrics, reference) -> dict | None:
+    if metrics is None or reference is None:
+        return None
+    return {m: metrics[m] - reference[m] for m in ("precision", "recall", "f1")}
+
+
+def _fmt_prf(metrics) -> str:
+    if metrics is None:
+        return f"{'-':>6} {'-':>6} {'-':>6}"
+    return f"{metrics['precision']:>6.3f} {metrics['recall']:>6.3f} {metrics['f1']:>6.3f}"
+
+
+def _fmt_delta(delta) -> str:
+    if delta is None:
+        return f"{'-':>7} {'-':>7} {'-':>7}"
+    return f"{delta['precision']:>+7.3f} {delta['recall']:>+7.3f} {delta['f1']:>+7.3f}"
+
+
+def _limit(rows: list, top: int | None) -> list:
+    """Keep the top rows by largest |delta F1| (rows are (key, reference, [deltas]))."""
+    if top is None or len(rows) <= top:
+        return rows
+    def spread(row):
+        return max((abs(d["f1"]) for d in row[2] if d is not None), default=0.0)
+    return sorted(rows, key=spread, reverse=True)[:top]
+
+
+def print_table(title: str, reference_label: str, labels: list[str], rows: list) -> None:
+    width = max([len(str(row[0])) for row in rows] + [10])
+    print(f"\n--- {title} ---")
+    header = f"{'':<{width}} {reference_label[:20]:>20}"
+    header += "".join(f" {('d ' + label)[:23]:>23}" for label in labels)
+    print(header)
+    print(f"{'key':<{width}} {'P':>6} {'R':>6} {'F1':>6}" + f" {'dP':>7} {'dR':>7} {'dF1':>7}" * len(labels))
+    for key, reference, deltas in rows:
+        print(f"{str(key):<{width}} {_fmt_prf(reference)}" + "".join(f" {_fmt_delta(d)}" for d in deltas))
+
+
+def compare_runs(table, keys, labels, levels, top=None):
+    """Each run's deltas against the first run, per condition and level."""
+    reference, others = labels[0], labels[1:]
+    for (condition, level), level_keys in keys.items():
+        if level not in levels:
+            continue
+        rows = []
+        for key in level_keys:
+            ref = table.get((reference, condition, level, key))
+            rows.append((key, ref, [
+                _delta(table.get((label, condition, level, key)), ref) for label in others
+            ]))
+        print_table(f"{condition} / {level}", reference, others, _limit(rows, top))
+
+
+def compare_conditions(table, keys, labels, levels, versus, top=None):
+    """Each condition's deltas against the `versus` condition, within every run."""
+    conditions = list(dict.fromkeys(c for c, _ in keys if c != versus))
+    for label in labels:
+        for level in levels:
+            level_keys = list(dict.fromkeys(
+                key for (_, key_level), ks in keys.items() if key_level == level for key in ks
+            ))
+            if not level_keys:
+                continue
+            rows = []
+            for key in level_keys:
+                ref = table.get((label, versus, level, key))
+                rows.append((key, ref, [
+                    _delta(table.get((label, condition, level, key)), ref)
+                    for condition in conditions
+                ]))
+            print_table(f"{label} / {level}", versus, conditions, _limit(rows, top))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("runs", nargs="+", help="Results stems or files; the first is the reference")
+    parser.add_argument("--conditions", nargs="+", default=None,
+                        help="Only these conditions (default: all)")
+    parser.add_argument("--levels", nargs="+", choices=LEVELS, default=["aggregate"],
+                        help="Summary levels to compare (default: %(default)s)")
+    parser.add_argument("--versus", metavar="CONDITION", default=None,
+                        help="Compare conditions against this one within each run, "
+                             "instead of runs against the first run")
+    parser.add_argument("--top", type=int, default=None,
+                        help="Show only the N keys with the largest |dF1| per table")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    runs = [resolve_run(path) for path in args.runs]
+    labels = [label for label, _ in runs]
+    conditions = None
+    if args.conditions is not None:
+        conditions = set(args.conditions) | ({args.versus} if args.versus else set())
+    table, keys = load_table(runs, conditions, set(args.levels))
+
+    if args.versus is not None:
+        compare_conditions(table, keys, labels, args.levels, args.versus, args.top)
+    elif len(runs) < 2:
+        sys.exit("Give at least two runs, or --versus CONDITION to compare within one run")
+    else:
+        compare_runs(table, keys, labels, args.levels, args.top)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""Precompiled, array-backed domain/range constraint index."""
+
+import json
+import os
+from array import array
+from operator import itemgetter
+
+
+class ConstraintIndex:
+    """Observation counts per (relation id, head type id, tail type id) in one flat array.
+
+    Equivalent to the dict table from build_constraint_table(): a triple is
+    kept if its relation was never observed in training (or is unknown), or
+    if its (head_type, tail_type) pair was observed for that relation at least
+    min_count times.
+    """
+
+    def __init__(self, rel2id: dict, ent2id: dict, counts: array | None = None):
+        self.rel2id = rel2id
+        self.ent2id = ent2id
+        self.n_rel = max(rel2id.values()) + 1
+        self.n_type = max(ent2id.values()) + 1
+        size = self.n_rel * self.n_type * self.n_type
+        self.counts = counts if counts is not None else array("I", bytes(4 * size))
+        # Two sentinel cells past the dense block: always-keep and always-drop
+        self._keep_cell = size
+        self._drop_cell = size + 1
+        self._masks: dict[int, bytearray] = {}
+
+    def _cell(self, rel_id: int, h_id: int, t_id: int) -> int:
+        return (rel_id * self.n_type + h_id) * self.n_type + t_id
+
+    @classmethod
+    def build(cls, train_data, rel2id: dict, ent2id: dict) -> "ConstraintIndex":
+        """Count observed (head_type, tail_type) pairs per relation in training data."""
+        index = cls(rel2id, ent2id)
+        for doc in train_data:
+            vertex_set = doc["vertexSet"]
+            for label in doc.get("labels", []):
+                index.add(
+                    label["r"],
+                    vertex_set[label["h"]][0]["type"],
+                    vertex_set[label["t"]][0]["type"],
+                )
+        return index
+
+    @classmethod
+    def from_table(cls, table: dict, rel2id: dict, ent2id: dict) -> "ConstraintIndex":
+        """Compile a dict table (counts become 1 per observed pair)."""
+        index = cls(rel2id, ent2id)
+        for relation, pairs in table.items():
+            for head_type, tail_type in pairs:
+                index.add(relation, head_type, tail_type)
+        return index
+
+    def add(self, relation: str, head_type: str, tail_type: str, n: int = 1) -> None:
+        """Record n observations of (relation, head_type, tail_type)."""
+        self.counts[self._cell(
+            self.rel2id[relation], self.ent2id[head_type], self.ent2id[tail_type]
+        )] += n
+        self._masks.clear()
+
+    def count(self, relation: str, head_type: str, tail_type: str) -> int:
+        """Training observations of (relation, head_type, tail_type)."""
+        try:
+            return self.counts[self._cell(
+                self.rel2id[relation], self.ent2id[head_type], self.ent2id[tail_type]
+            )]
+        except KeyError:
+            return 0
+
+    def _mask(self, min_count: int) -> bytearray:
+        """Keep/drop byte per cell (plus the two sentinels) for a count threshold."""
+        mask = self._masks.get(min_count)
+        if mask is None:
+            block = self.n_type * self.n_type
+            mask = bytearray(c >= min_count for c in self.counts)
+            for rel_id in range(self.n_rel):
+                start = rel_id * block
+                if not any(self.counts[start:start + block]):
+                    # Never observed: unconstrained, like a missing dict entry
+                    mask[start:start + block] = b"\x01" * block
+            mask += b"\x01\x00"
+            self._masks[min_count] = mask
+        return mask
+
+    def _encode(self, relation: str, head_type: str, tail_type: str) -> int:
+        rel_id = self.rel2id.get(relation)
+        if rel_id is None:
+            return self._keep_cell
+        h_id = self.ent2id.get(head_type)
+        t_id = self.ent2id.get(tail_type)
+        if h_id is None or t_id is None:
+            return self._drop_cell
+        return self._cell(rel_id, h_id, t_id)
+
+    def allows(self, relation: str, head_type: str, tail_type: str, min_count: int = 1) -> bool:
+        """True if a single triple with these labels would pass filter()."""
+        return bool(self._mask(min_count)[self._encode(relation, head_type, tail_type)])
+
+    def filter(self, triples: list, min_count: int = 1) -> list:
+        """Keep triples whose (relation, head_type, tail_type) passes, in one batched lookup."""
+        if not triples:
+            return []
+        cells = [self._encode(t.relation, t.head_type, t.tail_type) for t in triples]
+        keep = itemgetter(*cells)(self._mask(min_count))
+        if len(triples) == 1:
+            keep = (keep,)
+        return [t for t, k in zip(triples, keep) if k]
+
+    def to_table(self) -> dict[str, set[tuple[str, str]]]:
+        """Convert back to the build_constraint_table() dict form."""
+        id2rel = {v: k for k, v in self.rel2id.items()}
+        id2ent = {v: k for k, v in self.ent2id.items()}
+        table: dict[str, set[tuple[str, str]]] = {}
+        for cell, c in enumerate(self.counts):
+            if c:
+                rel_id, rest = divmod(cell, self.n_type * self.n_type)
+                h_id, t_id = divmod(rest, self.n_type)
+                table.setdefault(id2rel[rel_id], set()).add((id2ent[h_id], id2ent[t_id]))
+        return table
+
+    def save(self, path: str, fingerprint: str) -> None:
+        """Persist counts with the training-data fingerprint they were built from."""
+        payload = {
+            "fingerprint": fingerprint,
+            "rel2id": self.rel2id,
+            "ent2id": self.ent2id,
+            "counts": self.counts.tobytes().hex(),
+        }
+        with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+            json.dump(payload, f, ensure_ascii=False)
+        os.replace(f"{path}.tmp", path)
+
+    @classmethod
+    def load(cls, path: str) -> tuple["ConstraintIndex", str]:
+        """Load a saved index. Returns (index, fingerprint)."""
+        with open(path, encoding="utf-8") as f:
+            payload = json.load(f)
+        counts = array("I")
+        counts.frombytes(bytes.fromhex(payload["counts"]))
+        return cls(payload["rel2id"], payload["ent2id"], counts), payload["fingerprint"]
+
+
+def load_or_build_constraint_index(
+    train_data,
+    rel2id: dict,
+    ent2id: dict,
+    path: str,
+    fingerprint: str,
+) -> ConstraintIndex:
+    """Load the persisted index if it matches fingerprint and mappings, else rebuild and save."""
+    if os.path.exists(path):
+        index, saved_fingerprint = ConstraintIndex.load(path)
+        if (saved_fingerprint == fingerprint
+                and index.rel2id == rel2id and index.ent2id == ent2id):
+            return index
+    index = ConstraintIndex.build(train_data, rel2id, ent2id)
+    index.save(path, fingerprint)
+    return index
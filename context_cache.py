@@ -0,0 +1,179 @@
+"""Gemini cached-content contexts for shared prompt prefixes, plus a local stand-in.
+
+The system prompt and few-shot block are identical for every document of a
+(condition, group), so they are uploaded once as a cached context and each
+call only sends the target document.
+"""
+
+import hashlib
+import threading
+from itertools import count
+from types import SimpleNamespace
+
+from google.genai.types import CreateCachedContentConfig, GenerateContentConfig
+
+from rate_limiter import estimate_tokens
+
+DEFAULT_TTL = "3600s"
+
+
+def _prefix_key(model: str, system_prompt: str, prefix: str) -> str:
+    payload = "\0".join([model, system_prompt, prefix])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ContextCache:
+    """Creates and reuses one cached context per (model, system prompt, prefix).
+
+    A prefix whose creation fails (e.g. below the model's minimum cacheable
+    size) is remembered and sent uncached from then on. Also accumulates
+    usage so the input-token and latency savings show up in results.
+    """
+
+    def __init__(self, ttl: str = DEFAULT_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._names: dict[str, str | None] = {}
+        self._stats = {
+            "contexts_created": 0,
+            "contexts_failed": 0,
+            "cached_calls": 0,
+            "uncached_calls": 0,
+            "prompt_tokens": 0,
+            "cached_input_tokens": 0,
+            "cached_latency_sec": 0.0,
+            "uncached_latency_sec": 0.0,
+        }
+
+    def get(self, client, model: str, system_prompt: str, prefix: str) -> str | None:
+        """Cached-content name for the prefix, creating it on first use. None = send uncached."""
+        if not prefix or not hasattr(client, "caches"):
+            return None
+        key = _prefix_key(model, system_prompt, prefix)
+        with self._lock:
+            if key in self._names:
+                return self._names[key]
+            try:
+                cached = client.caches.create(
+                    model=model,
+                    config=CreateCachedContentConfig(
+                        system_instruction=system_prompt,
+                        contents=[prefix],
+                        ttl=self.ttl,
+                    ),
+                )
+                self._names[key] = cached.name
+                self._stats["contexts_created"] += 1
+            except Exception as e:
+                print(f"  [context cache] not cached ({e}); sending prefix inline")
+                self._names[key] = None
+                self._stats["contexts_failed"] += 1
+            return self._names[key]
+
+    def record(self, resp, used_cache: bool, latency: float) -> None:
+        """Accumulate token usage and latency of one generate_content response."""
+        usage = getattr(resp, "usage_metadata", None)
+        with self._lock:
+            kind = "cached" if used_cache else "uncached"
+            self._stats[f"{kind}_calls"] += 1
+            self._stats[f"{kind}_latency_sec"] += latency
+            self._stats["prompt_tokens"] += getattr(usage, "prompt_token_count", None) or 0
+            self._stats["cached_input_tokens"] += (
+                getattr(usage, "cached_content_token_count", None) or 0
+            )
+
+    def stats(self) -> dict:
+        """Usage totals plus derived savings (share of input tokens served from cache)."""
+        with self._lock:
+            stats = dict(self._stats)
+        prompt = stats["prompt_tokens"]
+        stats["cached_token_ratio"] = stats["cached_input_tokens"] / prompt if prompt else 0.0
+        for kind in ("cached", "uncached"):
+            calls = stats[f"{kind}_calls"]
+            stats[f"mean_{kind}_latency_sec"] = (
+                stats[f"{kind}_latency_sec"] / calls if calls else None
+            )
+        return stats
+
+    def clear(self, client) -> None:
+        """Delete every context this cache created."""
+        with self._lock:
+            names = [name for name in self._names.values() if name]
+            self._names.clear()
+        for name in names:
+            try:
+                client.caches.delete(name=name)
+            except Exception as e:
+                print(f"  [context cache] failed to delete {name}: {e}")
+
+
+class _LocalCaches:
+    def __init__(self):
+        self._contexts: dict[str, tuple[str, str]] = {}
+        self._ids = count()
+
+    def create(self, model: str, config):
+        name = f"cachedContents/local-{next(self._ids)}"
+        self._contexts[name] = (config.system_instruction, "".join(config.contents))
+        return SimpleNamespace(name=name)
+
+    def delete(self, name: str) -> None:
+        del self._contexts[name]
+
+
+class _LocalModels:
+    def __init__(self, owner: "LocalCachedContentClient", inner_models):
+        self._owner = owner
+        self._inner = inner_models
+
+    def generate_content(self, model: str, contents: str, config):
+        contents, config, cached_tokens = self._owner._expand(contents, config)
+        resp = self._inner.generate_content(model=model, contents=contents, config=config)
+        return self._owner._annotate(resp, contents, config, cached_tokens)
+
+
+class _AsyncLocalModels(_LocalModels):
+    async def generate_content(self, model: str, contents: str, config):
+        contents, config, cached_tokens = self._owner._expand(contents, config)
+        resp = await self._inner.generate_content(model=model, contents=contents, config=config)
+        return self._owner._annotate(resp, contents, config, cached_tokens)
+
+
+class LocalCachedContentClient:
+    """Wraps any client and emulates cached-content semantics locally.
+
+    caches.create() stores the system instruction and prefix; a call with
+    config.cached_content has them re-inserted before it is forwarded to
+    the wrapped client, and its usage_metadata reports the stored part as
+    cached_content_token_count. Lets the caching path run without the
+    service (run_experiment wraps the replay client with it under
+    --replay --context-cache).
+    """
+
+    def __init__(self, inner):
+        self.inner = inner
+        self.caches = _LocalCaches()
+        self.models = _LocalModels(self, inner.models)
+        self.aio = SimpleNamespace(models=_AsyncLocalModels(self, inner.aio.models))
+
+    def _expand(self, contents: str, config):
+        name = getattr(config, "cached_content", None)
+        if not name:
+            return contents, config, 0
+        system_instruction, prefix = self.caches._contexts[name]
+        expanded = GenerateContentConfig(
+            system_instruction=system_instruction,
+            response_mime_type=config.response_mime_type,
+            response_schema=config.response_schema,
+            temperature=config.temperature,
+            thinking_config=config.thinking_config,
+        )
+        return prefix + contents, expanded, estimate_tokens(system_instruction, prefix)
+
+    def _annotate(self, resp, contents: str, config, cached_tokens: int):
+        usage = getattr(resp, "usage_metadata", None) or SimpleNamespace()
+        resp.usage_metadata = usage
+        if getattr(usage, "prompt_token_count", None) is None:
+            usage.prompt_token_count = estimate_tokens(config.system_instruction or "", contents)
+        usage.cached_content_token_count = cached_tokens
+        return resp
@@ -1,15 +1,147 @@
 """JacRED data loading, document selection, and constraint table construction."""
 
 import json
+import mmap
+import os
+from array import array
 from collections import defaultdict
+from collections.abc import Sequence
 
+SPLITS = ["train", "dev", "test"]
+# Bumped whenever the snapshot layout changes; older snapshots are recompiled
+SNAPSHOT_FORMAT = "jsonl-1"
 
-def load_jacred(base_path: str = "/tmp/JacRED/") -> dict:
-    """Load all JacRED splits and metadata."""
-    data = {}
-    for split in ["train", "dev", "test"]:
-        with open(f"{base_path}{split}.json", encoding="utf-8") as f:
-            data[split] = json.load(f)
+
+def source_fingerprint(path: str) -> str:
+    """Cheap change detector for a source file (size + mtime)."""
+    st = os.stat(path)
+    return f"{st.st_size}:{st.st_mtime_ns}"
+
+
+def compile_snapshot(json_path: str, snapshot_prefix: str) -> None:
+    """Compile a split JSON into a JSON-lines doc file plus a doc-offset index.
+
+    Writes `<prefix>.jsonl` (one doc per line) and `<prefix>.idx.json`
+    holding byte offsets, titles and the per-doc sizes used for selection.
+    Both are plain data, so a tampered snapshot cannot run code when read.
+    """
+    with open(json_path, encoding="utf-8") as f:
+        docs = json.load(f)
+
+    offsets = array("Q", [0])
+    index = {"titles": [], "chars": [], "n_ents": [], "n_labels": []}
+    with open(f"{snapshot_prefix}.jsonl.tmp", "wb") as out:
+        for doc in docs:
+            line = json.dumps(doc, ensure_ascii=False).encode("utf-8") + b"\n"
+            out.write(line)
+            offsets.append(offsets[-1] + len(line))
+            index["titles"].append(doc["title"])
+            index["chars"].append(char_count(doc))
+            index["n_ents"].append(len(doc["vertexSet"]))
+            index["n_labels"].append(len(doc.get("labels", [])))
+    index["offsets"] = offsets.tolist()
+    index["source"] = source_fingerprint(json_path)
+    index["format"] = SNAPSHOT_FORMAT
+
+    os.replace(f"{snapshot_prefix}.jsonl.tmp", f"{snapshot_prefix}.jsonl")
+    with open(f"{snapshot_prefix}.idx.json.tmp", "w", encoding="utf-8") as f:
+        json.dump(index, f, ensure_ascii=False)
+    os.replace(f"{snapshot_prefix}.idx.json.tmp", f"{snapshot_prefix}.idx.json")
+
+
+class SnapshotSplit(Sequence):
+    """Read-only, memory-mapped view of one compiled JacRED split.
+
+    Docs are parsed on access, so random access by index or title costs
+    one document regardless of split size.
+    """
+
+    def __init__(self, snapshot_prefix: str):
+        with open(f"{snapshot_prefix}.idx.json", encoding="utf-8") as f:
+            index = json.load(f)
+        self.source = index["source"]
+        self.format = index.get("format")
+        self.titles = index["titles"]
+        self.chars = index["chars"]
+        self.n_ents = index["n_ents"]
+        self.n_labels = index["n_labels"]
+        self._offsets = array("Q", index["offsets"])
+        self._title_to_idx = {t: i for i, t in enumerate(self.titles)}
+        self._docs_path = f"{snapshot_prefix}.jsonl"
+        self._mm = None
+
+    def _map(self) -> mmap.mmap:
+        if self._mm is None:
+            with open(self._docs_path, "rb") as f:
+                self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._mm
+
+    def __len__(self) -> int:
+        return len(self.titles)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(len(self)))]
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError(idx)
+        return json.loads(self._map()[self._offsets[idx]:self._offsets[idx + 1]])
+
+    def by_title(self, title: str) -> dict:
+        """Return the doc with the given title."""
+        return self[self._title_to_idx[title]]
+
+
+def load_split_snapshot(json_path: str, snapshot_prefix: str) -> SnapshotSplit:
+    """Open a split snapshot, (re)compiling it first if missing or stale."""
+    try:
+        split = SnapshotSplit(snapshot_prefix)
+        if split.format == SNAPSHOT_FORMAT and split.source == source_fingerprint(json_path):
+            return split
+    except FileNotFoundError:
+        pass
+    compile_snapshot(json_path, snapshot_prefix)
+    return SnapshotSplit(snapshot_prefix)
+
+
+class LazyJacred(dict):
+    """JacRED data dict whose splits are opened from snapshots on first access."""
+
+    def __init__(self, base_path: str, snapshot_dir: str):
+        super().__init__()
+        self.base_path = base_path
+        self.snapshot_dir = snapshot_dir
+
+    def __missing__(self, key):
+        if key not in SPLITS:
+            raise KeyError(key)
+        os.makedirs(self.snapshot_dir, exist_ok=True)
+        split = load_split_snapshot(
+            f"{self.base_path}{key}.json", os.path.join(self.snapshot_dir, key)
+        )
+        self[key] = split
+        return split
+
+
+def load_jacred(
+    base_path: str = "/tmp/JacRED/",
+    lazy: bool = False,
+    snapshot_dir: str | None = None,
+) -> dict:
+    """Load all JacRED splits and metadata.
+
+    With lazy=True each split is opened on first access from a memory-mapped
+    snapshot (compiled once under snapshot_dir, default `<base_path>.snapshot/`)
+    instead of being parsed from JSON up front.
+    """
+    if lazy:
+        data = LazyJacred(base_path, snapshot_dir or os.path.join(base_path, ".snapshot"))
+    else:
+        data = {}
+        for split in SPLITS:
+            with open(f"{base_path}{split}.json", encoding="utf-8") as f:
+                data[split] = json.load(f)
 
     with open(f"{base_path}meta/rel2id.json", encoding="utf-8") as f:
         data["rel2id"] = json.load(f)
@@ -29,45 +161,87 @@ def doc_to_text(doc: dict) -> str:
     return "".join(sentences)
 
 
+def sentence_windows(doc: dict, max_chars: int, overlap: int = 1) -> list[tuple[int, int]]:
+    """Split doc["sents"] into [start, end) sentence windows of at most max_chars.
+
+    Consecutive windows share `overlap` sentences so relations spanning a
+    window boundary are still seen together. A sentence longer than
+    max_chars forms a window of its own.
+    """
+    lengths = [sum(len(tok) for tok in sent) for sent in doc["sents"]]
+    windows = []
+    start = 0
+    while start < len(lengths):
+        end, chars = start, 0
+        while end < len(lengths) and (end == start or chars + lengths[end] <= max_chars):
+            chars += lengths[end]
+            end += 1
+        windows.append((start, end))
+        if end == len(lengths):
+            break
+        start = max(start + 1, end - overlap)
+    return windows
+
+
+def window_text(doc: dict, window: tuple[int, int]) -> str:
+    """Plain text of the sentences in one sentence window."""
+    start, end = window
+    return "".join("".join(sent) for sent in doc["sents"][start:end])
+
+
 def char_count(doc: dict) -> int:
     """Count total characters in a document."""
     return sum(len(tok) for sent in doc["sents"] for tok in sent)
 
 
-def select_dev_docs(dev_data: list, n: int = 10) -> list[dict]:
+def _doc_sizes(data: Sequence) -> list[int]:
+    """Per-doc char counts, read from the snapshot index when available."""
+    if isinstance(data, SnapshotSplit):
+        return data.chars
+    return [char_count(doc) for doc in data]
+
+
+def select_dev_docs(dev_data: Sequence, n: int = 10) -> list[dict]:
     """Select n docs stratified by document size."""
-    sorted_docs = sorted(dev_data, key=char_count)
-    total = len(sorted_docs)
+    sizes = _doc_sizes(dev_data)
+    sorted_idx = sorted(range(len(sizes)), key=sizes.__getitem__)
+    total = len(sorted_idx)
     indices = [int(total * (i + 0.5) / n) for i in range(n)]
     selected = []
     for idx in indices:
-        doc = sorted_docs[idx].copy()
+        doc = dev_data[sorted_idx[idx]].copy()
         doc["doc_text"] = doc_to_text(doc)
         selected.append(doc)
     return selected
 
 
-def select_few_shot(train_data: list) -> dict:
+def select_few_shot(train_data: Sequence) -> dict:
     """Select a short, clear document as few-shot example."""
+    if isinstance(train_data, SnapshotSplit):
+        stats = zip(train_data.chars, train_data.n_ents, train_data.n_labels)
+    else:
+        stats = (
+            (char_count(doc), len(doc["vertexSet"]), len(doc.get("labels", [])))
+            for doc in train_data
+        )
+    stats = list(stats)
+
     candidates = []
-    for doc in train_data:
-        n_ents = len(doc["vertexSet"])
-        n_labels = len(doc.get("labels", []))
-        chars = char_count(doc)
+    for idx, (chars, n_ents, n_labels) in enumerate(stats):
         if 150 <= chars <= 250 and 5 <= n_ents <= 12 and 3 <= n_labels <= 15:
-            candidates.append((chars, doc))
+            candidates.append((chars, idx))
 
     candidates.sort(key=lambda x: x[0])
     if not candidates:
         # Fallback: pick shortest doc with at least some labels
-        sorted_train = sorted(train_data, key=char_count)
-        for doc in sorted_train:
-            if len(doc.get("labels", [])) >= 3:
-                doc = doc.copy()
+        sorted_idx = sorted(range(len(stats)), key=lambda i: stats[i][0])
+        for idx in sorted_idx:
+            if stats[idx][2] >= 3:
+                doc = train_data[idx].copy()
                 doc["doc_text"] = doc_to_text(doc)
                 return doc
 
-    doc = candidates[0][1].copy()
+    doc = train_data[candidates[0][1]].copy()
     doc["doc_text"] = doc_to_text(doc)
     return doc
 
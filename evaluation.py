@@ -9,73 +9,107 @@ def _normalize(s: str) -> str:
     return unicodedata.normalize("NFKC", s).strip().lower()
 
 
+# Only substring overlaps of at least this many characters count in pass 3
+MIN_SUBSTRING_OVERLAP = 2
+
+
+def _append_unique(index: dict[str, list[int]], key: str, gold_idx: int) -> None:
+    """Append gold_idx to index[key], keeping each list ascending and duplicate-free."""
+    idxs = index.setdefault(key, [])
+    if not idxs or idxs[-1] != gold_idx:
+        idxs.append(gold_idx)
+
+
+def _first_unused(idxs: list[int] | None, used_gold: set[int]) -> int | None:
+    """Lowest gold index in idxs that is not yet aligned."""
+    for gold_idx in idxs or ():
+        if gold_idx not in used_gold:
+            return gold_idx
+    return None
+
+
+class MentionIndex:
+    """Hash indexes over one document's gold mentions, built once per document.
+
+    - exact: mention name -> gold indices
+    - normalized: normalized mention -> gold indices
+    - containing: every substring (len >= MIN_SUBSTRING_OVERLAP) of a
+      normalized mention -> gold indices whose mentions contain it
+    Gold index lists are ascending, matching the scan order of the original
+    nested loops.
+    """
+
+    def __init__(self, gold_vertex_set: list[list[dict]]):
+        self.exact: dict[str, list[int]] = {}
+        self.normalized: dict[str, list[int]] = {}
+        self.containing: dict[str, list[int]] = {}
+        for gold_idx, mentions in enumerate(gold_vertex_set):
+            for m in mentions:
+                _append_unique(self.exact, m["name"], gold_idx)
+                norm = _normalize(m["name"])
+                _append_unique(self.normalized, norm, gold_idx)
+                for start in range(len(norm)):
+                    for end in range(start + MIN_SUBSTRING_OVERLAP, len(norm) + 1):
+                        _append_unique(self.containing, norm[start:end], gold_idx)
+
+    def substring_match(self, pred_norm: str, used_gold: set[int]) -> int | None:
+        """Pass-3 match: unused gold with the longest substring overlap, lowest index on ties."""
+        n = len(pred_norm)
+        if n < MIN_SUBSTRING_OVERLAP:
+            return None
+        # A gold mention containing the prediction overlaps by len(pred), the maximum
+        best = _first_unused(self.containing.get(pred_norm), used_gold)
+        if best is not None:
+            return best
+        # Otherwise the overlap is the length of a gold mention inside the prediction
+        for length in range(n - 1, MIN_SUBSTRING_OVERLAP - 1, -1):
+            found = [
+                _first_unused(self.normalized.get(pred_norm[start:start + length]), used_gold)
+                for start in range(n - length + 1)
+            ]
+            found = [gold_idx for gold_idx in found if gold_idx is not None]
+            if found:
+                return min(found)
+        return None
+
+
 def align_entities(
     predicted_entities: list[dict],
     gold_vertex_set: list[list[dict]],
+    mention_index: MentionIndex | None = None,
 ) -> dict[str, int]:
     """Map predicted entity names to gold vertexSet indices.
 
     Returns {predicted_entity_id: gold_vertex_index}.
-    Uses 3-pass matching: exact -> normalized -> substring.
+    Uses 3-pass greedy matching: exact -> normalized -> substring (prefer
+    longest overlap). Each pass is a hash lookup into a MentionIndex, which
+    can be passed in to reuse it across calls for the same document.
     """
+    index = mention_index or MentionIndex(gold_vertex_set)
     alignment = {}
     used_gold = set()
 
-    # Build lookup: gold index -> list of mention names
-    gold_mentions = {}
-    for idx, mentions in enumerate(gold_vertex_set):
-        gold_mentions[idx] = [m["name"] for m in mentions]
-
     pred_list = [(e["id"], e["name"]) for e in predicted_entities]
 
+    def assign(pred_id, gold_idx):
+        if gold_idx is not None:
+            alignment[pred_id] = gold_idx
+            used_gold.add(gold_idx)
+
     # Pass 1: Exact match
     for pred_id, pred_name in pred_list:
-        if pred_id in alignment:
-            continue
-        for gold_idx, names in gold_mentions.items():
-            if gold_idx in used_gold:
-                continue
-            if pred_name in names:
-                alignment[pred_id] = gold_idx
-                used_gold.add(gold_idx)
-                break
+        if pred_id not in alignment:
+            assign(pred_id, _first_unused(index.exact.get(pred_name), used_gold))
 
     # Pass 2: Normalized match
     for pred_id, pred_name in pred_list:
-        if pred_id in alignment:
-            continue
-        pred_norm = _normalize(pred_name)
-        for gold_idx, names in gold_mentions.items():
-            if gold_idx in used_gold:
-                continue
-            for gname in names:
-                if _normalize(gname) == pred_norm:
-                    alignment[pred_id] = gold_idx
-                    used_gold.add(gold_idx)
-                    break
-            if pred_id in alignment:
-                break
+        if pred_id not in alignment:
+            assign(pred_id, _first_unused(index.normalized.get(_normalize(pred_name)), used_gold))
 
     # Pass 3: Substring match (prefer longest overlap)
     for pred_id, pred_name in pred_list:
-        if pred_id in alignment:
-            continue
-        pred_norm = _normalize(pred_name)
-        best_gold = None
-        best_overlap = 0
-        for gold_idx, names in gold_mentions.items():
-            if gold_idx in used_gold:
-                continue
-            for gname in names:
-                gnorm = _normalize(gname)
-                if pred_norm in gnorm or gnorm in pred_norm:
-                    overlap = min(len(pred_norm), len(gnorm))
-                    if overlap > best_overlap:
-                        best_overlap = overlap
-                        best_gold = gold_idx
-        if best_gold is not None and best_overlap >= 2:
-            alignment[pred_id] = best_gold
-            used_gold.add(best_gold)
+        if pred_id not in alignment:
+            assign(pred_id, index.substring_match(_normalize(pred_name), used_gold))
 
     return alignment
 
@@ -84,10 +118,13 @@ def evaluate_relations(
     predicted_triples: list[Triple],
     gold_labels: list[dict],
     entity_alignment: dict[str, int],
+    include_details: bool = True,
 ) -> dict:
     """Compute P, R, F1 by comparing predicted triples against gold labels.
 
-    Returns dict with precision, recall, f1, tp, fp, fn, and detail lists.
+    Returns dict with precision, recall, f1, tp, fp, fn, and (unless
+    include_details=False) fp_details/fn_details lists. For many docs at
+    once use scoring.ScoringEngine.
     """
     # Build gold set: {(head_idx, tail_idx, relation)}
     gold_set = set()
@@ -106,12 +143,13 @@ def evaluate_relations(
 
         if h_idx is None or t_idx is None:
             fp += 1
-            fp_details.append({
-                "head": triple.head_name,
-                "relation": triple.relation,
-                "tail": triple.tail_name,
-                "reason": "entity_not_aligned",
-            })
+            if include_details:
+                fp_details.append({
+                    "head": triple.head_name,
+                    "relation": triple.relation,
+                    "tail": triple.tail_name,
+                    "reason": "entity_not_aligned",
+                })
             continue
 
         key = (h_idx, t_idx, triple.relation)
@@ -120,33 +158,36 @@ def evaluate_relations(
             matched_gold.add(key)
         else:
             fp += 1
-            fp_details.append({
-                "head": triple.head_name,
-                "relation": triple.relation,
-                "tail": triple.tail_name,
-                "reason": "wrong_relation",
-            })
+            if include_details:
+                fp_details.append({
+                    "head": triple.head_name,
+                    "relation": triple.relation,
+                    "tail": triple.tail_name,
+                    "reason": "wrong_relation",
+                })
 
     fn = len(gold_set) - len(matched_gold)
-    fn_details = []
-    for h, t, r in gold_set:
-        if (h, t, r) not in matched_gold:
-            fn_details.append({"head_idx": h, "tail_idx": t, "relation": r})
 
     precision = tp / (tp + fp) if (tp + fp) > 0 else 0.0
     recall = tp / (tp + fn) if (tp + fn) > 0 else 0.0
     f1 = 2 * precision * recall / (precision + recall) if (precision + recall) > 0 else 0.0
 
-    return {
+    metrics = {
         "precision": precision,
         "recall": recall,
         "f1": f1,
         "tp": tp,
         "fp": fp,
         "fn": fn,
-        "fp_details": fp_details,
-        "fn_details": fn_details,
     }
+    if include_details:
+        metrics["fp_details"] = fp_details
+        metrics["fn_details"] = [
+            {"head_idx": h, "tail_idx": t, "relation": r}
+            for h, t, r in gold_set
+            if (h, t, r) not in matched_gold
+        ]
+    return metrics
 
 
 def aggregate_results(per_doc: list[dict]) -> dict:
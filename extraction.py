@@ -1,25 +1,42 @@
-"""Extraction logic for Baseline and RelationSplit conditions."""
+"""Extraction logic for Baseline, RelationSplit and EntityFirst conditions."""
 
+import asyncio
+import re
+import time
 import unicodedata
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
 from dataclasses import dataclass, field
+from sys import intern
 
 from google import genai
 
-from schemas import EXTRACTION_SCHEMA, VERIFICATION_SCHEMA
+from schemas import (
+    ENTITY_SCHEMA,
+    EXTRACTION_SCHEMA,
+    PACKED_EXTRACTION_SCHEMA,
+    VERIFICATION_SCHEMA,
+    build_group_extraction_schema,
+    build_relation_schema,
+)
 from prompts import (
-    build_system_prompt,
-    build_extraction_prompt,
+    PromptAssembler,
+    build_verification_candidate,
     build_verification_prompt,
-    build_group_system_prompt,
-    build_group_extraction_prompt,
     RELATION_GROUPS,
 )
-from llm_client import call_gemini
-from data_loader import format_few_shot_output
+from llm_client import call_gemini, call_gemini_async
+from rate_limiter import estimate_tokens
+from constraint_index import ConstraintIndex
+from data_loader import format_few_shot_output, sentence_windows, window_text
+from type_routing import detect_entity_types, route_groups
 
 
-@dataclass
+@dataclass(slots=True)
 class Triple:
+    # Slotted (no per-instance __dict__); ids and P-codes are interned, names are
+    # shared with the entity dicts, so a triple costs little beyond its evidence
     head: str        # entity id (e.g. "e0")
     head_name: str
     head_type: str
@@ -42,11 +59,11 @@ def _parse_extraction_result(result: dict) -> tuple[list[dict], list[Triple]]:
         if not head_ent or not tail_ent:
             continue
         triples.append(Triple(
-            head=rel["head"],
+            head=intern(rel["head"]),
             head_name=head_ent.get("name", ""),
             head_type=head_ent.get("type", ""),
-            relation=rel["relation"],
-            tail=rel["tail"],
+            relation=intern(rel["relation"]),
+            tail=intern(rel["tail"]),
             tail_name=tail_ent.get("name", ""),
             tail_type=tail_ent.get("type", ""),
             evidence=rel.get("evidence", ""),
@@ -66,9 +83,12 @@ def filter_invalid_entity_types(triples: list[Triple], valid_types: set[str]) ->
 
 def apply_domain_range_constraints(
     triples: list[Triple],
-    constraint_table: dict[str, set[tuple[str, str]]],
+    constraint_table: dict[str, set[tuple[str, str]]] | ConstraintIndex,
 ) -> list[Triple]:
     """Remove triples where (head_type, tail_type) is not observed in training data."""
+    if isinstance(constraint_table, ConstraintIndex):
+        return constraint_table.filter(triples)
+
     filtered = []
     for t in triples:
         allowed = constraint_table.get(t.relation)
@@ -80,6 +100,36 @@ def apply_domain_range_constraints(
     return filtered
 
 
+VALID_ENTITY_TYPES = {"PER", "ORG", "LOC", "ART", "DAT", "TIM", "MON", "%"}
+
+
+def _filter_triples(triples: list[Triple], schema_info: dict) -> list[Triple]:
+    """Apply the label and entity-type filters shared by all conditions."""
+    valid_rels = set(schema_info["rel_info"].keys())
+    triples = filter_invalid_labels(triples, valid_rels)
+    return filter_invalid_entity_types(triples, VALID_ENTITY_TYPES)
+
+
+_assemblers: dict[tuple, PromptAssembler] = {}
+
+
+def _assembler(few_shot: dict, schema_info: dict) -> PromptAssembler:
+    """Shared PromptAssembler for a (few-shot doc, relation schema) pair."""
+    rel_info = schema_info["rel_info"]
+    key = (few_shot["title"], tuple(rel_info.items()))
+    assembler = _assemblers.get(key)
+    if assembler is None:
+        assembler = _assemblers[key] = PromptAssembler(
+            rel_info, few_shot["doc_text"], format_few_shot_output(few_shot)
+        )
+    return assembler
+
+
+def _baseline_prompts(doc: dict, few_shot: dict, schema_info: dict) -> tuple[str, str, str]:
+    """Build (system_prompt, prefix, suffix) for the one-shot baseline call."""
+    return _assembler(few_shot, schema_info).extraction(doc["doc_text"], mode="baseline")
+
+
 def run_baseline(
     doc: dict,
     few_shot: dict,
@@ -87,21 +137,246 @@ def run_baseline(
     schema_info: dict,
 ) -> tuple[list[dict], list[Triple]]:
     """Condition 1: Single LLM call extraction."""
-    system_prompt = build_system_prompt(schema_info["rel_info"])
-    few_shot_output = format_few_shot_output(few_shot)
-    user_prompt = build_extraction_prompt(
-        doc["doc_text"], few_shot["doc_text"], few_shot_output, mode="baseline"
+    system_prompt, prefix, user_prompt = _baseline_prompts(doc, few_shot, schema_info)
+
+    result = call_gemini(
+        client, system_prompt, user_prompt, EXTRACTION_SCHEMA, cached_prefix=prefix
     )
+    entities, triples = _parse_extraction_result(result)
+
+    return entities, _filter_triples(triples, schema_info)
 
-    result = call_gemini(client, system_prompt, user_prompt, EXTRACTION_SCHEMA)
+
+async def run_baseline_async(
+    doc: dict,
+    few_shot: dict,
+    client: genai.Client,
+    schema_info: dict,
+) -> tuple[list[dict], list[Triple]]:
+    """Async variant of run_baseline."""
+    system_prompt, prefix, user_prompt = _baseline_prompts(doc, few_shot, schema_info)
+
+    result = await call_gemini_async(
+        client, system_prompt, user_prompt, EXTRACTION_SCHEMA, cached_prefix=prefix
+    )
     entities, triples = _parse_extraction_result(result)
 
-    valid_rels = set(schema_info["rel_info"].keys())
-    valid_types = {"PER", "ORG", "LOC", "ART", "DAT", "TIM", "MON", "%"}
-    triples = filter_invalid_labels(triples, valid_rels)
-    triples = filter_invalid_entity_types(triples, valid_types)
+    return entities, _filter_triples(triples, schema_info)
 
-    return entities, triples
+
+# Default character budget for the documents packed into one baseline call
+PACK_MAX_CHARS = 2000
+PACK_MAX_DOCS = 8
+
+
+def pack_documents(
+    docs: list[dict],
+    max_chars: int = PACK_MAX_CHARS,
+    max_docs: int = PACK_MAX_DOCS,
+) -> list[list[int]]:
+    """Group doc indices, in order, so each pack's doc_text fits within max_chars.
+
+    A doc longer than max_chars gets a pack of its own.
+    """
+    packs = []
+    current, current_chars = [], 0
+    for i, doc in enumerate(docs):
+        chars = len(doc["doc_text"])
+        if current and (current_chars + chars > max_chars or len(current) >= max_docs):
+            packs.append(current)
+            current, current_chars = [], 0
+        current.append(i)
+        current_chars += chars
+    if current:
+        packs.append(current)
+    return packs
+
+
+def _packed_prompts(docs: list[dict], few_shot: dict, schema_info: dict):
+    """(doc_ids, system_prompt, prefix, suffix) for one packed baseline call."""
+    doc_ids = [f"d{i + 1}" for i in range(len(docs))]
+    prompts = _assembler(few_shot, schema_info).packed_extraction(
+        doc_ids, [doc["doc_text"] for doc in docs]
+    )
+    return doc_ids, *prompts
+
+
+def _unpack_results(
+    result: dict,
+    doc_ids: list[str],
+    schema_info: dict,
+) -> list[tuple[list[dict], list[Triple]]]:
+    """Split a packed response into per-doc (entities, triples), in doc_ids order."""
+    by_id = {entry.get("doc_id"): entry for entry in result.get("documents", [])}
+    unpacked = []
+    for doc_id in doc_ids:
+        entry = by_id.get(doc_id)
+        if entry is None:
+            if by_id:
+                print(f"  [packed] no output for {doc_id}")
+            entry = {}
+        entities, triples = _parse_extraction_result(entry)
+        unpacked.append((entities, _filter_triples(triples, schema_info)))
+    return unpacked
+
+
+def run_baseline_packed(
+    docs: list[dict],
+    few_shot: dict,
+    client: genai.Client,
+    schema_info: dict,
+) -> list[tuple[list[dict], list[Triple]]]:
+    """Condition 1 for several short docs in a single call (see pack_documents).
+
+    Returns (entities, triples) per doc in input order. A single doc is sent
+    as a regular run_baseline call.
+    """
+    if len(docs) == 1:
+        return [run_baseline(docs[0], few_shot, client, schema_info)]
+    doc_ids, system_prompt, prefix, user_prompt = _packed_prompts(docs, few_shot, schema_info)
+
+    result = call_gemini(
+        client, system_prompt, user_prompt, PACKED_EXTRACTION_SCHEMA, cached_prefix=prefix
+    )
+    return _unpack_results(result, doc_ids, schema_info)
+
+
+async def run_baseline_packed_async(
+    docs: list[dict],
+    few_shot: dict,
+    client: genai.Client,
+    schema_info: dict,
+) -> list[tuple[list[dict], list[Triple]]]:
+    """Async variant of run_baseline_packed."""
+    if len(docs) == 1:
+        return [await run_baseline_async(docs[0], few_shot, client, schema_info)]
+    doc_ids, system_prompt, prefix, user_prompt = _packed_prompts(docs, few_shot, schema_info)
+
+    result = await call_gemini_async(
+        client, system_prompt, user_prompt, PACKED_EXTRACTION_SCHEMA, cached_prefix=prefix
+    )
+    return _unpack_results(result, doc_ids, schema_info)
+
+
+# Default sentence-window size for chunked baseline extraction of long docs
+CHUNK_MAX_CHARS = 1000
+CHUNK_OVERLAP_SENTS = 1
+
+
+def _window_prompts(doc: dict, few_shot: dict, schema_info: dict, windows: list) -> list:
+    """(system_prompt, prefix, suffix) for each sentence window of doc."""
+    assembler = _assembler(few_shot, schema_info)
+    return [
+        assembler.extraction(window_text(doc, window), mode="baseline")
+        for window in windows
+    ]
+
+
+def _finalize_chunked(
+    windows: list[tuple[int, int]],
+    window_results: list[tuple[dict, float]],
+    schema_info: dict,
+) -> tuple[list[dict], list[Triple], dict]:
+    """Merge per-window results like relation-split passes and filter the union."""
+    all_window_entities = []
+    all_window_triples = []
+    per_window = []
+    for (start, end), (result, latency) in zip(windows, window_results):
+        entities, triples = _parse_extraction_result(result)
+        all_window_entities.append(entities)
+        all_window_triples.append(triples)
+        per_window.append({
+            "sentences": [start, end],
+            "entities": len(entities),
+            "triples": len(triples),
+            "latency_sec": round(latency, 3),
+        })
+
+    merged_entities, merged_triples = _merge_entities_across_passes(
+        all_window_entities, all_window_triples
+    )
+    stats = {
+        "windows": len(windows),
+        "per_window": per_window,
+        "total_union": len(merged_triples),
+    }
+    return merged_entities, _filter_triples(merged_triples, schema_info), stats
+
+
+def _timed_call(
+    client: genai.Client, tags: dict, system_prompt: str, prefix: str, user_prompt: str
+):
+    """Run one extraction call and return (result, latency_sec)."""
+    start = time.perf_counter()
+    result = call_gemini(
+        client, system_prompt, user_prompt, EXTRACTION_SCHEMA, cached_prefix=prefix, tags=tags
+    )
+    return result, time.perf_counter() - start
+
+
+async def _timed_call_async(
+    client: genai.Client, tags: dict, system_prompt: str, prefix: str, user_prompt: str
+):
+    """Async counterpart of _timed_call."""
+    start = time.perf_counter()
+    result = await call_gemini_async(
+        client, system_prompt, user_prompt, EXTRACTION_SCHEMA, cached_prefix=prefix, tags=tags
+    )
+    return result, time.perf_counter() - start
+
+
+def run_baseline_chunked(
+    doc: dict,
+    few_shot: dict,
+    client: genai.Client,
+    schema_info: dict,
+    max_chars: int = CHUNK_MAX_CHARS,
+    overlap: int = CHUNK_OVERLAP_SENTS,
+    max_workers: int | None = None,
+) -> tuple[list[dict], list[Triple], dict]:
+    """Condition 1 over overlapping sentence windows of a long doc.
+
+    Windows (see sentence_windows) are extracted concurrently on a thread
+    pool and merged in window order with _merge_entities_across_passes, so
+    per-call latency is bounded by the window size. A doc that fits in one
+    window is sent as a regular run_baseline call.
+    """
+    windows = sentence_windows(doc, max_chars, overlap)
+    if len(windows) == 1:
+        entities, triples = run_baseline(doc, few_shot, client, schema_info)
+        return entities, triples, {}
+
+    window_prompts = _window_prompts(doc, few_shot, schema_info, windows)
+    with ThreadPoolExecutor(max_workers=max_workers or len(windows)) as executor:
+        # Each window runs in a copy of the caller's context so call tags carry over
+        futures = [
+            executor.submit(copy_context().run, _timed_call, client, {"window": k}, *prompts)
+            for k, prompts in enumerate(window_prompts)
+        ]
+        window_results = [f.result() for f in futures]
+
+    return _finalize_chunked(windows, window_results, schema_info)
+
+
+async def run_baseline_chunked_async(
+    doc: dict,
+    few_shot: dict,
+    client: genai.Client,
+    schema_info: dict,
+    max_chars: int = CHUNK_MAX_CHARS,
+    overlap: int = CHUNK_OVERLAP_SENTS,
+) -> tuple[list[dict], list[Triple], dict]:
+    """Async variant of run_baseline_chunked. Windows run concurrently."""
+    windows = sentence_windows(doc, max_chars, overlap)
+    if len(windows) == 1:
+        entities, triples = await run_baseline_async(doc, few_shot, client, schema_info)
+        return entities, triples, {}
+
+    window_results = await asyncio.gather(*(
+        _timed_call_async(client, {"window": k}, *prompts)
+        for k, prompts in enumerate(_window_prompts(doc, few_shot, schema_info, windows))
+    ))
+    return _finalize_chunked(windows, list(window_results), schema_info)
 
 
 def run_proposed(
@@ -113,38 +388,38 @@ def run_proposed(
 ) -> tuple[list[dict], list[Triple], dict]:
     """Condition 2: Two-stage Generate + Verify."""
     # Stage 1: Recall-oriented extraction
-    system_prompt = build_system_prompt(schema_info["rel_info"])
-    few_shot_output = format_few_shot_output(few_shot)
-    user_prompt = build_extraction_prompt(
-        doc["doc_text"], few_shot["doc_text"], few_shot_output, mode="recall"
+    system_prompt, prefix, user_prompt = _assembler(few_shot, schema_info).extraction(
+        doc["doc_text"], mode="recall"
     )
 
-    result = call_gemini(client, system_prompt, user_prompt, EXTRACTION_SCHEMA)
+    result = call_gemini(
+        client, system_prompt, user_prompt, EXTRACTION_SCHEMA, cached_prefix=prefix,
+        tags={"stage": "extract"},
+    )
     entities, candidates = _parse_extraction_result(result)
-
-    valid_rels = set(schema_info["rel_info"].keys())
-    valid_types = {"PER", "ORG", "LOC", "ART", "DAT", "TIM", "MON", "%"}
-    candidates = filter_invalid_labels(candidates, valid_rels)
-    candidates = filter_invalid_entity_types(candidates, valid_types)
+    candidates = _filter_triples(candidates, schema_info)
 
     stage1_count = len(candidates)
 
-    # Stage 2: Verification in batches
+    # Constraint violations would be dropped anyway; prune them before
+    # spending verification calls on them
+    candidates = apply_domain_range_constraints(candidates, constraint_table)
+    constrained_count = len(candidates)
+
+    # Stage 2: Verification in token-budgeted, concurrent batches
     entity_id_to_name = {e["id"]: e["name"] for e in entities}
-    verified = _verify_candidates(
-        doc, candidates, entity_id_to_name, client, schema_info, batch_size=10
+    final, verify_calls = _verify_candidates(
+        doc, candidates, entity_id_to_name, client, schema_info
     )
 
-    stage2_count = len(verified)
-
-    # Post-processing: domain/range constraints
-    final = apply_domain_range_constraints(verified, constraint_table)
-    final_count = len(final)
-
+    # Same key meanings as before constraints moved ahead of verification:
+    # stage2_kept is the post-verify and after_constraints the final count
     stats = {
         "stage1_candidates": stage1_count,
-        "stage2_kept": stage2_count,
-        "after_constraints": final_count,
+        "pre_verify_candidates": constrained_count,
+        "verify_calls": verify_calls,
+        "stage2_kept": len(final),
+        "after_constraints": len(final),
     }
     return entities, final, stats
 
@@ -154,103 +429,242 @@ def _normalize_name(name: str) -> str:
     return unicodedata.normalize("NFKC", name).strip().lower()
 
 
+# Separators that vary between mentions of one name (ジョー・ギブス / ジョー_ギブス / ジョー ギブス)
+_ALIAS_SEPARATORS = re.compile(r"[\s・･_\-‐‑–—―=＝]")
+# Trailing disambiguation qualifier, e.g. "ジョー・ギブス (音楽プロデューサー)"
+_ALIAS_QUALIFIER = re.compile(r"\s*\([^()]*\)$")
+
+
+def _alias_keys(name: str) -> tuple[str, str | None]:
+    """(name key, qualifier-stripped key or None) used to merge an entity.
+
+    The name key is the normalized name with separators removed. The second
+    key is only set for names with a trailing qualifier ("東京 (曲)" -> "東京").
+    """
+    norm = _normalize_name(name)
+    key = _ALIAS_SEPARATORS.sub("", norm) or norm
+    if norm.endswith(")"):
+        base = _ALIAS_QUALIFIER.sub("", norm)
+        if base:
+            return key, _ALIAS_SEPARATORS.sub("", base) or base
+    return key, None
+
+
 def _merge_entities_across_passes(
     all_pass_entities: list[list[dict]],
     all_pass_triples: list[list[Triple]],
 ) -> tuple[list[dict], list[Triple]]:
-    """Merge entities from multiple passes, deduplicating by normalized name.
+    """Merge entities from multiple passes with a union-find over alias keys.
 
-    Returns merged entity list and triples with updated entity references.
+    Entities with the same name key (see _alias_keys) merge regardless of
+    type, as names always did. A qualified name also merges with other
+    qualified names of the same type and base, and with the entities named
+    by its base when all of those have its type, so "東京 (曲)" (ART) never
+    joins "東京" once "東京" is also a LOC. Each set is represented by its
+    earliest entity. Triples are deduplicated by (head, relation, tail) and
+    the kept ones copied with the merged ids; the input lists are unchanged.
     """
-    # Map normalized name -> merged entity
-    norm_to_entity: dict[str, dict] = {}
+    flat: list[tuple[int, dict]] = [
+        (pass_idx, ent)
+        for pass_idx, entities in enumerate(all_pass_entities)
+        for ent in entities
+    ]
+    parent = list(range(len(flat)))
+
+    def find(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    def union(i: int, j: int) -> None:
+        ri, rj = find(i), find(j)
+        if ri != rj:
+            # The earlier entity stays the representative
+            parent[max(ri, rj)] = min(ri, rj)
+
+    key_owner: dict[str, int] = {}
+    keys_by_name: dict[str, tuple[str, str | None]] = {}
+    qualified: list[tuple[int, str]] = []
+    for i, (_, ent) in enumerate(flat):
+        name = ent["name"]
+        keys = keys_by_name.get(name)
+        if keys is None:
+            keys = keys_by_name[name] = _alias_keys(name)
+        key, base = keys
+        union(i, key_owner.setdefault(key, i))
+        if base is not None:
+            qualified.append((i, base))
+
+    if qualified:
+        # Types per name-key set, taken before any qualifier links are made
+        set_types: dict[int, set[str]] = {}
+        for i, (_, ent) in enumerate(flat):
+            set_types.setdefault(find(i), set()).add(ent["type"])
+        homogeneous = {root: next(iter(types)) for root, types in set_types.items()
+                       if len(types) == 1}
+        typed_owner: dict[tuple[str, str], int] = {}
+        links = []
+        for i, base in qualified:
+            ent_type = flat[i][1]["type"]
+            if homogeneous.get(find(i)) != ent_type:
+                continue
+            links.append((i, typed_owner.setdefault((ent_type, base), i)))
+            j = key_owner.get(base)
+            if j is not None and homogeneous.get(find(j)) == ent_type:
+                links.append((i, j))
+        for i, j in links:
+            union(i, j)
+
+    merged_entities = []
+    root_ids: dict[int, str] = {}
     # Map (pass_index, old_id) -> new_id
     id_remap: dict[tuple[int, str], str] = {}
-    next_id = 0
-
-    for pass_idx, entities in enumerate(all_pass_entities):
-        for ent in entities:
-            norm = _normalize_name(ent["name"])
-            if norm in norm_to_entity:
-                # Reuse existing merged entity
-                merged = norm_to_entity[norm]
-                id_remap[(pass_idx, ent["id"])] = merged["id"]
-            else:
-                new_eid = f"e{next_id}"
-                next_id += 1
-                merged = {
-                    "id": new_eid,
-                    "name": ent["name"],
-                    "type": ent["type"],
-                }
-                norm_to_entity[norm] = merged
-                id_remap[(pass_idx, ent["id"])] = new_eid
-
-    merged_entities = list(norm_to_entity.values())
-
-    # Remap triple entity references
-    merged_triples = []
-    for pass_idx, triples in enumerate(all_pass_triples):
-        for t in triples:
-            new_head = id_remap.get((pass_idx, t.head), t.head)
-            new_tail = id_remap.get((pass_idx, t.tail), t.tail)
-            merged_triples.append(Triple(
-                head=new_head,
-                head_name=t.head_name,
-                head_type=t.head_type,
-                relation=t.relation,
-                tail=new_tail,
-                tail_name=t.tail_name,
-                tail_type=t.tail_type,
-                evidence=t.evidence,
-            ))
-
-    # Deduplicate triples by (head, relation, tail)
+    for i, (pass_idx, ent) in enumerate(flat):
+        root = find(i)
+        new_eid = root_ids.get(root)
+        if new_eid is None:
+            new_eid = root_ids[root] = intern(f"e{len(merged_entities)}")
+            root_ent = flat[root][1]
+            merged_entities.append(
+                {"id": new_eid, "name": root_ent["name"], "type": root_ent["type"]}
+            )
+        id_remap[(pass_idx, ent["id"])] = new_eid
+
     seen = set()
     deduped = []
-    for t in merged_triples:
-        key = (t.head, t.relation, t.tail)
-        if key not in seen:
-            seen.add(key)
-            deduped.append(t)
+    for pass_idx, triples in enumerate(all_pass_triples):
+        for t in triples:
+            head = id_remap.get((pass_idx, t.head), t.head)
+            tail = id_remap.get((pass_idx, t.tail), t.tail)
+            key = (head, t.relation, tail)
+            if key not in seen:
+                seen.add(key)
+                deduped.append(Triple(
+                    head, t.head_name, t.head_type, t.relation,
+                    tail, t.tail_name, t.tail_type, t.evidence,
+                ))
 
     return merged_entities, deduped
 
 
-def run_relation_split(
+def group_schema_constraints(group_pcodes: list[str], valid_relations: set[str]) -> list[str]:
+    """The relation enum a group's response schema is restricted to: its valid P-codes.
+
+    Entity types are left unrestricted (see build_group_extraction_schema).
+    """
+    return [p for p in group_pcodes if p in valid_relations]
+
+
+# (group_name, relations, pcodes) -> schema
+_group_schemas: dict[tuple, dict] = {}
+
+
+def _group_schema(group_name: str, schema_info: dict, pcodes: list[str] | None = None) -> dict:
+    """Compiled response schema for one relation group, built once per relation set.
+
+    pcodes restricts the schema to a routed subset of the group's relations.
+    """
+    key = (
+        group_name, tuple(schema_info["rel_info"]),
+        tuple(pcodes) if pcodes is not None else None,
+    )
+    if key not in _group_schemas:
+        relations = group_schema_constraints(
+            pcodes or RELATION_GROUPS[group_name], set(schema_info["rel_info"])
+        )
+        if relations:
+            schema = build_group_extraction_schema(relations)
+        else:
+            # Nothing to restrict to (enums must not be empty)
+            schema = EXTRACTION_SCHEMA
+        _group_schemas[key] = schema
+    return _group_schemas[key]
+
+
+def _group_prompts(
     doc: dict,
     few_shot: dict,
-    client: genai.Client,
     schema_info: dict,
-    constraint_table: dict,
-) -> tuple[list[dict], list[Triple], dict]:
-    """Relation-Split Multi-Pass Extraction.
+    routes: dict[str, list[str] | None] | None = None,
+) -> list[tuple[str, dict, str, str, str]]:
+    """Build (group_name, schema, system_prompt, prefix, suffix) per relation group.
 
-    Iterates over relation groups, extracting with group-specific prompts,
-    then merges and applies constraints.
+    routes maps the groups to run to their P-code subset (None = whole
+    group); without routes every group runs in full.
     """
-    few_shot_output = format_few_shot_output(few_shot)
+    if routes is None:
+        routes = dict.fromkeys(RELATION_GROUPS)
+    assembler = _assembler(few_shot, schema_info)
+    return [
+        (
+            group_name,
+            _group_schema(group_name, schema_info, pcodes),
+            *assembler.group_extraction(group_name, doc["doc_text"], pcodes),
+        )
+        for group_name, pcodes in routes.items()
+    ]
 
+
+def _route_document(
+    doc: dict,
+    few_shot: dict,
+    schema_info: dict,
+    constraint_table,
+) -> tuple[dict[str, list[str] | None], dict]:
+    """Type-aware routing of one document: (routes for _group_prompts, routing stats).
+
+    Stats report the groups skipped, relations pruned from the remaining
+    prompts, and the calls and estimated prompt tokens saved against
+    running every group in full.
+    """
+    types = detect_entity_types(doc["doc_text"])
+    feasible = route_groups(types, set(schema_info["rel_info"]), constraint_table)
+    # A group keeping all its relations uses the unrouted prompt and schema
+    routes = {
+        group_name: None if pcodes == RELATION_GROUPS[group_name] else pcodes
+        for group_name, pcodes in feasible.items()
+    }
+
+    assembler = _assembler(few_shot, schema_info)
+    full_tokens = sum(
+        estimate_tokens(*assembler.group_extraction(group_name, doc["doc_text"]))
+        for group_name in RELATION_GROUPS
+    )
+    routed_tokens = sum(
+        estimate_tokens(*assembler.group_extraction(group_name, doc["doc_text"], pcodes))
+        for group_name, pcodes in routes.items()
+    )
+    stats = {
+        "detected_types": sorted(types),
+        "skipped_groups": [g for g in RELATION_GROUPS if g not in routes],
+        "pruned_relations": sorted(
+            p for g, pcodes in routes.items() if pcodes is not None
+            for p in RELATION_GROUPS[g] if p in schema_info["rel_info"] and p not in pcodes
+        ),
+        "calls_saved": len(RELATION_GROUPS) - len(routes),
+        "prompt_tokens_saved": full_tokens - routed_tokens,
+    }
+    return routes, stats
+
+
+def _finalize_relation_split(
+    group_results: list[tuple[str, dict, float]],
+    schema_info: dict,
+    constraint_table: dict,
+) -> tuple[list[dict], list[Triple], dict]:
+    """Parse per-group results, merge across passes, and apply filters/constraints."""
     all_pass_entities = []
     all_pass_triples = []
     per_group_counts = {}
 
-    for group_name, group_pcodes in RELATION_GROUPS.items():
-        # Build group-specific prompts
-        system_prompt = build_group_system_prompt(
-            group_name, group_pcodes, schema_info["rel_info"]
-        )
-        user_prompt = build_group_extraction_prompt(
-            doc["doc_text"], few_shot["doc_text"], few_shot_output, group_pcodes
-        )
-
-        # Call LLM
-        result = call_gemini(client, system_prompt, user_prompt, EXTRACTION_SCHEMA)
+    for group_name, result, latency in group_results:
         entities, triples = _parse_extraction_result(result)
 
         per_group_counts[group_name] = {
             "entities": len(entities),
             "triples": len(triples),
+            "latency_sec": round(latency, 3),
         }
 
         all_pass_entities.append(entities)
@@ -264,10 +678,7 @@ def run_relation_split(
     total_union = len(merged_triples)
 
     # Apply filters
-    valid_rels = set(schema_info["rel_info"].keys())
-    valid_types = {"PER", "ORG", "LOC", "ART", "DAT", "TIM", "MON", "%"}
-    merged_triples = filter_invalid_labels(merged_triples, valid_rels)
-    merged_triples = filter_invalid_entity_types(merged_triples, valid_types)
+    merged_triples = _filter_triples(merged_triples, schema_info)
 
     # Apply domain/range constraints
     final_triples = apply_domain_range_constraints(merged_triples, constraint_table)
@@ -281,45 +692,401 @@ def run_relation_split(
     return merged_entities, final_triples, stats
 
 
-def _verify_candidates(
+def _timed_group_call(
+    client: genai.Client,
+    group_name: str,
+    schema: dict,
+    system_prompt: str,
+    prefix: str,
+    user_prompt: str,
+) -> tuple[str, dict, float]:
+    """Run one group pass and return (group_name, result, latency_sec)."""
+    start = time.perf_counter()
+    result = call_gemini(
+        client, system_prompt, user_prompt, schema, cached_prefix=prefix,
+        tags={"group": group_name},
+    )
+    return group_name, result, time.perf_counter() - start
+
+
+async def _timed_group_call_async(
+    client: genai.Client,
+    group_name: str,
+    schema: dict,
+    system_prompt: str,
+    prefix: str,
+    user_prompt: str,
+) -> tuple[str, dict, float]:
+    """Async counterpart of _timed_group_call."""
+    start = time.perf_counter()
+    result = await call_gemini_async(
+        client, system_prompt, user_prompt, schema, cached_prefix=prefix,
+        tags={"group": group_name},
+    )
+    return group_name, result, time.perf_counter() - start
+
+
+def run_relation_split(
     doc: dict,
-    candidates: list[Triple],
-    entity_id_to_name: dict,
+    few_shot: dict,
     client: genai.Client,
     schema_info: dict,
-    batch_size: int = 10,
-) -> list[Triple]:
-    """Stage 2: Batch-verify candidates."""
-    if not candidates:
-        return []
-
-    verified = []
-    for i in range(0, len(candidates), batch_size):
-        batch = candidates[i : i + batch_size]
-        batch_dicts = [
-            {
-                "head": t.head,
-                "relation": t.relation,
-                "tail": t.tail,
-                "evidence": t.evidence,
-            }
-            for t in batch
-        ]
+    constraint_table: dict,
+    max_workers: int | None = None,
+    route: bool = False,
+) -> tuple[list[dict], list[Triple], dict]:
+    """Relation-Split Multi-Pass Extraction.
+
+    Runs the relation-group passes concurrently on a thread pool (one worker
+    per group unless max_workers is given), then merges the results in
+    RELATION_GROUPS order and applies constraints. With route=True, groups
+    and relations infeasible for the document's detected entity types are
+    skipped (see type_routing).
+    """
+    routes, routing = None, None
+    if route:
+        routes, routing = _route_document(doc, few_shot, schema_info, constraint_table)
+    group_prompts = _group_prompts(doc, few_shot, schema_info, routes)
 
-        verify_prompt = build_verification_prompt(
-            doc["doc_text"], batch_dicts, entity_id_to_name, schema_info["rel_info"]
+    group_results = []
+    if group_prompts:
+        with ThreadPoolExecutor(max_workers=max_workers or len(group_prompts)) as executor:
+            # Each pass runs in a copy of the caller's context so call tags carry over
+            futures = [
+                executor.submit(copy_context().run, _timed_group_call, client, *prompts)
+                for prompts in group_prompts
+            ]
+            # Collect in submission order so the merge stays deterministic
+            group_results = [f.result() for f in futures]
+
+    entities, triples, stats = _finalize_relation_split(
+        group_results, schema_info, constraint_table
+    )
+    if routing is not None:
+        stats["routing"] = routing
+    return entities, triples, stats
+
+
+async def run_relation_split_async(
+    doc: dict,
+    few_shot: dict,
+    client: genai.Client,
+    schema_info: dict,
+    constraint_table: dict,
+    route: bool = False,
+) -> tuple[list[dict], list[Triple], dict]:
+    """Async variant of run_relation_split. Group passes run concurrently."""
+    routes, routing = None, None
+    if route:
+        routes, routing = _route_document(doc, few_shot, schema_info, constraint_table)
+    group_results = await asyncio.gather(*(
+        _timed_group_call_async(client, *prompts)
+        for prompts in _group_prompts(doc, few_shot, schema_info, routes)
+    ))
+
+    entities, triples, stats = _finalize_relation_split(
+        list(group_results), schema_info, constraint_table
+    )
+    if routing is not None:
+        stats["routing"] = routing
+    return entities, triples, stats
+
+
+# ConstraintIndex -> {(group_name, relations): roles}; entries go away with the index.
+# Dict tables are not cached (reading them directly is as cheap as the lookup)
+_group_roles: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+
+def _group_role_types(
+    group_name: str,
+    schema_info: dict,
+    constraint_table,
+) -> tuple[list[str], set[str] | None, set[str] | None]:
+    """(relations, allowed head types, allowed tail types) for one group's relation pass.
+
+    Types are None when a group relation is unobserved in training, i.e.
+    any entity may fill that role.
+    """
+    key = (group_name, tuple(schema_info["rel_info"]))
+    cache = None
+    table = constraint_table
+    if isinstance(constraint_table, ConstraintIndex):
+        cache = _group_roles.setdefault(constraint_table, {})
+        if key in cache:
+            return cache[key]
+        table = constraint_table.to_table()
+    relations = group_schema_constraints(RELATION_GROUPS[group_name], set(schema_info["rel_info"]))
+    head_types: set[str] | None = set()
+    tail_types: set[str] | None = set()
+    for pcode in relations:
+        allowed = table.get(pcode)
+        if not allowed:
+            head_types = tail_types = None
+            break
+        for head_type, tail_type in allowed:
+            head_types.add(head_type)
+            tail_types.add(tail_type)
+    roles = (relations, head_types, tail_types)
+    if cache is not None:
+        cache[key] = roles
+    return roles
+
+
+def _entity_inventory(result: dict) -> list[dict]:
+    """Entities of the entity pass, deduplicated by normalized name and re-id'd e0, e1, ..."""
+    seen: set[str] = set()
+    entities = []
+    for ent in result.get("entities", []):
+        norm = _normalize_name(ent.get("name", ""))
+        if not norm or norm in seen:
+            continue
+        seen.add(norm)
+        entities.append({"id": f"e{len(entities)}", "name": ent["name"], "type": ent["type"]})
+    return entities
+
+
+def _relation_pass_prompts(
+    doc: dict,
+    few_shot: dict,
+    schema_info: dict,
+    constraint_table,
+    entities: list[dict],
+) -> tuple[list[tuple[str, dict, str, str, str]], list[str]]:
+    """(group_name, schema, system_prompt, prefix, suffix) per relation pass, and skipped groups.
+
+    head/tail enums hold the inventory ids whose type the group's relations
+    allow in that role; a group with no relation or no possible head or
+    tail is skipped without a call.
+    """
+    assembler = _assembler(few_shot, schema_info)
+    prompts, skipped = [], []
+    for group_name in RELATION_GROUPS:
+        relations, head_types, tail_types = _group_role_types(
+            group_name, schema_info, constraint_table
         )
+        head_ids = [e["id"] for e in entities if head_types is None or e["type"] in head_types]
+        tail_ids = [e["id"] for e in entities if tail_types is None or e["type"] in tail_types]
+        if not relations or not head_ids or not tail_ids:
+            skipped.append(group_name)
+            continue
+        prompts.append((
+            group_name,
+            build_relation_schema(relations, head_ids, tail_ids),
+            *assembler.group_relation_extraction(group_name, doc["doc_text"], entities),
+        ))
+    return prompts, skipped
+
 
-        system_prompt = (
-            "あなたは関係抽出の検証者です。"
-            "提示された関係候補が文書の内容に基づいて正しいかどうかを判定してください。"
+def _finalize_entity_first(
+    entities: list[dict],
+    entity_latency: float,
+    group_results: list[tuple[str, dict, float]],
+    skipped: list[str],
+    schema_info: dict,
+    constraint_table,
+) -> tuple[list[dict], list[Triple], dict]:
+    """Concatenate the relation passes over the shared inventory and apply filters/constraints."""
+    per_group_counts = {}
+    seen = set()
+    triples = []
+    for group_name, result, latency in group_results:
+        _, group_triples = _parse_extraction_result(
+            {"entities": entities, "relations": result.get("relations", [])}
         )
+        per_group_counts[group_name] = {
+            "triples": len(group_triples),
+            "latency_sec": round(latency, 3),
+        }
+        # Entity ids are shared across passes, so merging is plain deduplication
+        for t in group_triples:
+            key = (t.head, t.relation, t.tail)
+            if key not in seen:
+                seen.add(key)
+                triples.append(t)
+
+    total_union = len(triples)
+    triples = _filter_triples(triples, schema_info)
+    final_triples = apply_domain_range_constraints(triples, constraint_table)
+
+    stats = {
+        "entities": len(entities),
+        "entity_latency_sec": round(entity_latency, 3),
+        "per_group": per_group_counts,
+        "skipped_groups": skipped,
+        "total_union": total_union,
+        "after_constraints": len(final_triples),
+    }
+    return entities, final_triples, stats
+
+
+def run_entity_first(
+    doc: dict,
+    few_shot: dict,
+    client: genai.Client,
+    schema_info: dict,
+    constraint_table: dict,
+    max_workers: int | None = None,
+) -> tuple[list[dict], list[Triple], dict]:
+    """Entity-First Relation-Split Extraction.
 
-        result = call_gemini(client, system_prompt, verify_prompt, VERIFICATION_SCHEMA)
+    One entity pass builds a fixed entity inventory; the relation-group
+    passes then run concurrently with relations-only schemas over that
+    inventory, so entities are generated once instead of once per group.
+    """
+    system_prompt, prefix, suffix = _assembler(few_shot, schema_info).entity_extraction(
+        doc["doc_text"]
+    )
+    start = time.perf_counter()
+    result = call_gemini(
+        client, system_prompt, suffix, ENTITY_SCHEMA, cached_prefix=prefix,
+        tags={"stage": "entities"},
+    )
+    entity_latency = time.perf_counter() - start
+    entities = _entity_inventory(result)
+
+    pass_prompts, skipped = _relation_pass_prompts(
+        doc, few_shot, schema_info, constraint_table, entities
+    )
+    group_results = []
+    if pass_prompts:
+        with ThreadPoolExecutor(max_workers=max_workers or len(pass_prompts)) as executor:
+            futures = [
+                executor.submit(copy_context().run, _timed_group_call, client, *prompts)
+                for prompts in pass_prompts
+            ]
+            group_results = [f.result() for f in futures]
+
+    return _finalize_entity_first(
+        entities, entity_latency, group_results, skipped, schema_info, constraint_table
+    )
+
+
+async def run_entity_first_async(
+    doc: dict,
+    few_shot: dict,
+    client: genai.Client,
+    schema_info: dict,
+    constraint_table: dict,
+) -> tuple[list[dict], list[Triple], dict]:
+    """Async variant of run_entity_first. Relation passes run concurrently."""
+    system_prompt, prefix, suffix = _assembler(few_shot, schema_info).entity_extraction(
+        doc["doc_text"]
+    )
+    start = time.perf_counter()
+    result = await call_gemini_async(
+        client, system_prompt, suffix, ENTITY_SCHEMA, cached_prefix=prefix,
+        tags={"stage": "entities"},
+    )
+    entity_latency = time.perf_counter() - start
+    entities = _entity_inventory(result)
 
-        decisions = {d["candidate_index"]: d["keep"] for d in result.get("decisions", [])}
-        for j, triple in enumerate(batch):
-            if decisions.get(j, True):  # Default to keep if missing
-                verified.append(triple)
+    pass_prompts, skipped = _relation_pass_prompts(
+        doc, few_shot, schema_info, constraint_table, entities
+    )
+    group_results = await asyncio.gather(*(
+        _timed_group_call_async(client, *prompts) for prompts in pass_prompts
+    ))
 
-    return verified
+    return _finalize_entity_first(
+        entities, entity_latency, list(group_results), skipped, schema_info, constraint_table
+    )
+
+
+VERIFY_SYSTEM_PROMPT = (
+    "あなたは関係抽出の検証者です。"
+    "提示された関係候補が文書の内容に基づいて正しいかどうかを判定してください。"
+)
+# Estimated prompt tokens per verification call (system + document + candidates)
+VERIFY_TOKEN_BUDGET = 6000
+# Upper bound on candidates per call, so the decision list stays reliable
+VERIFY_MAX_CANDIDATES = 40
+VERIFY_MAX_WORKERS = 4
+
+
+def _candidate_dict(t: Triple) -> dict:
+    return {"head": t.head, "relation": t.relation, "tail": t.tail, "evidence": t.evidence}
+
+
+def _verification_batches(
+    doc_text: str,
+    candidates: list[Triple],
+    entity_id_to_name: dict,
+    rel_info: dict,
+    token_budget: int = VERIFY_TOKEN_BUDGET,
+    max_candidates: int = VERIFY_MAX_CANDIDATES,
+) -> list[list[Triple]]:
+    """Split candidates, in order, into batches whose prompts fit token_budget.
+
+    Every batch pays for the system prompt and the document once; each
+    candidate adds its own entry. A batch always holds at least one candidate.
+    """
+    fixed = estimate_tokens(
+        VERIFY_SYSTEM_PROMPT,
+        build_verification_prompt(doc_text, [], entity_id_to_name, rel_info),
+    )
+    batches: list[list[Triple]] = []
+    batch: list[Triple] = []
+    used = fixed
+    for t in candidates:
+        cost = estimate_tokens(build_verification_candidate(
+            len(batch), _candidate_dict(t), entity_id_to_name, rel_info
+        ))
+        if batch and (used + cost > token_budget or len(batch) >= max_candidates):
+            batches.append(batch)
+            batch, used = [], fixed
+        batch.append(t)
+        used += cost
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def _verify_batch(
+    doc_text: str,
+    batch: list[Triple],
+    entity_id_to_name: dict,
+    client: genai.Client,
+    rel_info: dict,
+    batch_idx: int,
+) -> list[Triple]:
+    """Verify one batch; candidates without a decision are kept."""
+    verify_prompt = build_verification_prompt(
+        doc_text, [_candidate_dict(t) for t in batch], entity_id_to_name, rel_info
+    )
+    result = call_gemini(
+        client, VERIFY_SYSTEM_PROMPT, verify_prompt, VERIFICATION_SCHEMA,
+        tags={"stage": "verify", "verify_batch": batch_idx},
+    )
+    decisions = {d["candidate_index"]: d["keep"] for d in result.get("decisions", [])}
+    return [t for j, t in enumerate(batch) if decisions.get(j, True)]
+
+
+def _verify_candidates(
+    doc: dict,
+    candidates: list[Triple],
+    entity_id_to_name: dict,
+    client: genai.Client,
+    schema_info: dict,
+    token_budget: int = VERIFY_TOKEN_BUDGET,
+    max_workers: int = VERIFY_MAX_WORKERS,
+) -> tuple[list[Triple], int]:
+    """Stage 2: verify candidates in token-budgeted batches run concurrently.
+
+    Returns (kept triples in candidate order, number of verification calls).
+    """
+    if not candidates:
+        return [], 0
+
+    batches = _verification_batches(
+        doc["doc_text"], candidates, entity_id_to_name, schema_info["rel_info"], token_budget
+    )
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(batches))) as executor:
+        futures = [
+            executor.submit(
+                copy_context().run, _verify_batch, doc["doc_text"], batch,
+                entity_id_to_name, client, schema_info["rel_info"], k,
+            )
+            for k, batch in enumerate(batches)
+        ]
+        verified = [t for f in futures for t in f.result()]
+    return verified, len(batches)
@@ -0,0 +1,223 @@
+"""Persistent knowledge-graph store (SQLite) fed incrementally by extraction runs.
+
+Entities are nodes keyed by (normalized name, type), triples are edges
+(head, relation, tail), and every edge keeps its provenance: the document,
+condition and source (e.g. model) it was extracted under, with evidence.
+Re-adding a (doc, condition, source) replaces its earlier provenance, so
+re-running a document does not duplicate it.
+
+    python kg_store.py kg.sqlite                          # counts
+    python kg_store.py kg.sqlite --entity 東京            # neighbourhood
+    python kg_store.py kg.sqlite --entity 東京 --relation P131 --direction in
+"""
+
+import argparse
+import sqlite3
+import threading
+
+from extraction import Triple, _normalize_name
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS entities ("
+    " id INTEGER PRIMARY KEY,"
+    " norm TEXT NOT NULL,"
+    " type TEXT NOT NULL,"
+    " name TEXT NOT NULL,"
+    " UNIQUE (norm, type))",
+    "CREATE INDEX IF NOT EXISTS idx_entities_name ON entities(name)",
+    "CREATE TABLE IF NOT EXISTS triples ("
+    " id INTEGER PRIMARY KEY,"
+    " head INTEGER NOT NULL REFERENCES entities(id),"
+    " relation TEXT NOT NULL,"
+    " tail INTEGER NOT NULL REFERENCES entities(id),"
+    " UNIQUE (head, relation, tail))",
+    "CREATE INDEX IF NOT EXISTS idx_triples_tail_relation ON triples(tail, relation)",
+    "CREATE TABLE IF NOT EXISTS provenance ("
+    " triple_id INTEGER NOT NULL REFERENCES triples(id),"
+    " doc TEXT NOT NULL,"
+    " condition TEXT NOT NULL,"
+    " source TEXT NOT NULL,"
+    " evidence TEXT NOT NULL,"
+    " UNIQUE (triple_id, doc, condition, source))",
+    "CREATE INDEX IF NOT EXISTS idx_provenance_doc ON provenance(doc, condition, source)",
+)
+# UNIQUE (head, relation, tail) doubles as the (head, relation) index and
+# UNIQUE (norm, type) as the normalized-name index
+
+
+class KGStore:
+    """Entity/triple/provenance tables with bulk, transactional upserts.
+
+    Safe to share between threads; several processes may write to the
+    same file (each write is one BEGIN IMMEDIATE transaction).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = sqlite3.connect(path, timeout=60, isolation_level=None, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        for statement in _SCHEMA:
+            self._conn.execute(statement)
+
+    def _entity_id(self, name: str, entity_type: str) -> int:
+        norm = _normalize_name(name)
+        self._conn.execute(
+            "INSERT OR IGNORE INTO entities (norm, type, name) VALUES (?, ?, ?)",
+            (norm, entity_type, name),
+        )
+        return self._conn.execute(
+            "SELECT id FROM entities WHERE norm = ? AND type = ?", (norm, entity_type)
+        ).fetchone()[0]
+
+    def _add(self, doc: str, condition: str, entities: list[dict],
+             triples: list[Triple], source: str) -> int:
+        """Insert one document's output; runs inside the caller's transaction."""
+        stale = [row[0] for row in self._conn.execute(
+            "SELECT triple_id FROM provenance WHERE doc = ? AND condition = ? AND source = ?",
+            (doc, condition, source),
+        )]
+        self._conn.execute(
+            "DELETE FROM provenance WHERE doc = ? AND condition = ? AND source = ?",
+            (doc, condition, source),
+        )
+
+        ids: dict[tuple[str, str], int] = {}
+        nodes = [(e["name"], e["type"]) for e in entities]
+        for t in triples:
+            nodes += [(t.head_name, t.head_type), (t.tail_name, t.tail_type)]
+        for node in nodes:
+            if node not in ids:
+                ids[node] = self._entity_id(*node)
+
+        provenance = []
+        for t in triples:
+            edge = (ids[(t.head_name, t.head_type)], t.relation, ids[(t.tail_name, t.tail_type)])
+            self._conn.execute(
+                "INSERT OR IGNORE INTO triples (head, relation, tail) VALUES (?, ?, ?)", edge
+            )
+            triple_id = self._conn.execute(
+                "SELECT id FROM triples WHERE head = ? AND relation = ? AND tail = ?", edge
+            ).fetchone()[0]
+            provenance.append((triple_id, doc, condition, source, t.evidence))
+        self._conn.executemany(
+            "INSERT OR IGNORE INTO provenance (triple_id, doc, condition, source, evidence)"
+            " VALUES (?, ?, ?, ?, ?)",
+            provenance,
+        )
+
+        # Edges only this document had asserted before are dropped with it
+        self._conn.executemany(
+            "DELETE FROM triples WHERE id = ? AND NOT EXISTS"
+            " (SELECT 1 FROM provenance WHERE triple_id = triples.id)",
+            [(triple_id,) for triple_id in stale],
+        )
+        return len(provenance)
+
+    def add_documents(self, rows, source: str = "") -> int:
+        """Upsert (doc, condition, entities, triples) rows in one transaction. Returns triples added."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                added = sum(
+                    self._add(doc, condition, entities, triples, source)
+                    for doc, condition, entities, triples in rows
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return added
+
+    def add_document(self, doc: str, condition: str, entities: list[dict],
+                     triples: list[Triple], source: str = "") -> int:
+        """Upsert one document's extraction output. Returns triples added."""
+        return self.add_documents([(doc, condition, entities, triples)], source)
+
+    def find_entities(self, name: str) -> list[dict]:
+        """Entities whose normalized name equals name's, of any type."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, name, type FROM entities WHERE norm = ?", (_normalize_name(name),)
+            ).fetchall()
+        return [{"id": r[0], "name": r[1], "type": r[2]} for r in rows]
+
+    def neighbours(self, name: str, relation: str | None = None, direction: str = "both",
+                   limit: int | None = None) -> list[dict]:
+        """Edges around the entities named name: direction "out" (as head), "in" (as tail) or both.
+
+        Each edge carries the number of documents asserting it and one evidence.
+        """
+        if direction not in ("out", "in", "both"):
+            raise ValueError(f"direction must be 'out', 'in' or 'both', not {direction!r}")
+        sides = {"out": ["head"], "in": ["tail"], "both": ["head", "tail"]}[direction]
+        ids = [e["id"] for e in self.find_entities(name)]
+        if not ids:
+            return []
+        marks = ",".join("?" * len(ids))
+        parts, params = [], []
+        for side in sides:
+            sql = (
+                "SELECT h.name, h.type, t.relation, tl.name, tl.type,"
+                " COUNT(DISTINCT p.doc), MIN(p.evidence)"
+                " FROM triples t"
+                " JOIN entities h ON h.id = t.head JOIN entities tl ON tl.id = t.tail"
+                " JOIN provenance p ON p.triple_id = t.id"
+                f" WHERE t.{side} IN ({marks})"
+            )
+            params += ids
+            if relation is not None:
+                sql += " AND t.relation = ?"
+                params.append(relation)
+            parts.append(sql + " GROUP BY t.id")
+        sql = " UNION ".join(parts) + " ORDER BY 6 DESC, 3"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [
+            {"head": r[0], "head_type": r[1], "relation": r[2], "tail": r[3], "tail_type": r[4],
+             "docs": r[5], "evidence": r[6]}
+            for r in rows
+        ]
+
+    def counts(self) -> dict[str, int]:
+        """Numbers of entities, triples, provenance rows and documents."""
+        with self._lock:
+            return {
+                "entities": self._conn.execute("SELECT COUNT(*) FROM entities").fetchone()[0],
+                "triples": self._conn.execute("SELECT COUNT(*) FROM triples").fetchone()[0],
+                "provenance": self._conn.execute("SELECT COUNT(*) FROM provenance").fetchone()[0],
+                "documents": self._conn.execute(
+                    "SELECT COUNT(DISTINCT doc) FROM provenance"
+                ).fetchone()[0],
+            }
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("path", help="KG store file")
+    parser.add_argument("--entity", default=None, help="Show the edges around this entity")
+    parser.add_argument("--relation", default=None, help="Only edges with this P-code")
+    parser.add_argument("--direction", choices=["out", "in", "both"], default="both")
+    parser.add_argument("--limit", type=int, default=50)
+    args = parser.parse_args()
+
+    store = KGStore(args.path)
+    if args.entity is None:
+        print(store.counts())
+    else:
+        for e in store.neighbours(args.entity, args.relation, args.direction, args.limit):
+            print(f"{e['head']} ({e['head_type']}) -[{e['relation']}]-> "
+                  f"{e['tail']} ({e['tail_type']})  docs={e['docs']}  {e['evidence']}")
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,76 @@
 """Gemini API client with structured output support and retry logic."""
 
+import asyncio
 import json
 import time
+from contextlib import contextmanager
+from contextvars import ContextVar
 
 from google import genai
 from google.genai.types import GenerateContentConfig, ThinkingConfig
 
+from call_accounting import CallLog, usage_counts
+from context_cache import DEFAULT_TTL, ContextCache
+from llm_cache import DEFAULT_MAX_BYTES, ResponseCache, request_key
+from rate_limiter import (
+    QuotaScheduler,
+    backoff_delay,
+    estimate_tokens,
+    is_rate_limit_error,
+    retry_after_from_error,
+)
+from replay_backend import RecordingClient, ReplayClient, ReplayMiss, load_recording
+
 MODEL = "gemini-3-flash-preview"
+THINKING_BUDGET = 2048
+
+# Per-context overrides of MODEL / THINKING_BUDGET / temperature (see model_settings)
+_SETTINGS: ContextVar[dict] = ContextVar("model_settings", default={})
+
+
+@contextmanager
+def model_settings(**settings):
+    """Run every call inside the block with other settings (model, thinking_budget, temperature).
+
+    thinking_budget=None sends no thinking config (for models without
+    thinking); temperature replaces each call's own temperature. Nested
+    blocks extend the outer settings. Like call_tags, the settings follow
+    the context into copy_context() threads and asyncio tasks.
+    """
+    unknown = set(settings) - {"model", "thinking_budget", "temperature"}
+    if unknown:
+        raise TypeError(f"Unknown model settings: {sorted(unknown)}")
+    token = _SETTINGS.set({**_SETTINGS.get(), **settings})
+    try:
+        yield
+    finally:
+        _SETTINGS.reset(token)
+
+
+def current_model() -> str:
+    return _SETTINGS.get().get("model", MODEL)
+
+
+def _thinking_budget() -> int | None:
+    return _SETTINGS.get().get("thinking_budget", THINKING_BUDGET)
+
+
+def _temperature(temperature: float) -> float:
+    return _SETTINGS.get().get("temperature", temperature)
+
+# Response cache shared by all calls; None disables caching (see configure_cache)
+_cache: ResponseCache | None = None
+_refresh_cache = False
+
+# Shared by every call (threads and asyncio tasks alike). Without configured
+# limits it only enforces server-requested pauses after rate-limit errors.
+SCHEDULER = QuotaScheduler()
+
+# One record per call_gemini call (tokens, latency, retries, tags); see call_accounting
+CALL_LOG = CallLog()
+
+# Cached-content contexts for shared prompt prefixes; None sends prefixes inline
+CONTEXT_CACHE: ContextCache | None = None
 
 
 def load_api_key(env_path: str) -> str:
@@ -19,9 +83,167 @@ def load_api_key(env_path: str) -> str:
     raise ValueError("GEMINI_API_KEY not found in .env file")
 
 
-def create_client(api_key: str) -> genai.Client:
-    """Create Gemini client."""
-    return genai.Client(api_key=api_key)
+def create_client(
+    api_key: str | None,
+    record_path: str | None = None,
+    replay_paths: list[str] | None = None,
+    replay_latency: float | str | None = None,
+):
+    """Create Gemini client, or a record/replay backend (see replay_backend).
+
+    With replay_paths, no live client is created: responses come from those
+    recordings (api_key is unused). With record_path, the live client's
+    responses are appended to that recording.
+    """
+    if replay_paths:
+        return ReplayClient(load_recording(replay_paths), latency=replay_latency)
+    client = genai.Client(api_key=api_key)
+    if record_path:
+        return RecordingClient(client, record_path)
+    return client
+
+
+def configure_cache(
+    path: str | None,
+    max_bytes: int = DEFAULT_MAX_BYTES,
+    refresh: bool = False,
+) -> ResponseCache | None:
+    """Enable the on-disk response cache at path (None disables it).
+
+    With refresh=True cached entries are ignored on read but still
+    overwritten with the fresh responses.
+    """
+    global _cache, _refresh_cache
+    if _cache is not None:
+        _cache.close()
+    _cache = ResponseCache(path, max_bytes) if path else None
+    _refresh_cache = refresh
+    return _cache
+
+
+def get_cache() -> ResponseCache | None:
+    """Return the active response cache, if any."""
+    return _cache
+
+
+def configure_context_cache(enabled: bool = True, ttl: str = DEFAULT_TTL) -> ContextCache | None:
+    """Enable (or disable) cached-content contexts for call_gemini's cached_prefix."""
+    global CONTEXT_CACHE
+    CONTEXT_CACHE = ContextCache(ttl) if enabled else None
+    return CONTEXT_CACHE
+
+
+def _cache_lookup(
+    system_prompt: str,
+    user_prompt: str,
+    response_schema: dict,
+    temperature: float,
+    use_cache: bool,
+) -> tuple[str | None, dict | None]:
+    """Return (cache_key, cached_result). The key is None when caching is off."""
+    if _cache is None or not use_cache:
+        return None, None
+    key = request_key(
+        current_model(), system_prompt, user_prompt, response_schema, temperature,
+        _thinking_budget(),
+    )
+    if _refresh_cache:
+        return key, None
+    return key, _cache.get(key)
+
+
+def configure_rate_limits(
+    rpm: int | None,
+    tpm: int | None,
+    model: str = MODEL,
+) -> QuotaScheduler:
+    """Set requests-per-minute / tokens-per-minute quotas for model (None = unlimited)."""
+    SCHEDULER.set_limits(model, rpm, tpm)
+    return SCHEDULER
+
+
+def _total_tokens(resp) -> int | None:
+    """Total token count reported by the server, if available."""
+    usage = getattr(resp, "usage_metadata", None)
+    return getattr(usage, "total_token_count", None)
+
+
+def _retry_wait(attempt: int, error: Exception) -> float:
+    """Backoff for a failed attempt; rate-limit errors pause every caller of the model."""
+    retry_after = retry_after_from_error(error)
+    wait = backoff_delay(attempt, retry_after)
+    if retry_after is not None or is_rate_limit_error(error):
+        SCHEDULER.pause(current_model(), wait)
+    return wait
+
+
+def _build_config(
+    system_prompt: str | None,
+    response_schema: dict,
+    temperature: float,
+    cached_content: str | None = None,
+) -> GenerateContentConfig:
+    """Build the structured-output generation config shared by sync and async calls.
+
+    With cached_content the system prompt lives in the cached context and
+    must not be repeated in the config.
+    """
+    budget = _thinking_budget()
+    thinking = {} if budget is None else {"thinking_config": ThinkingConfig(thinking_budget=budget)}
+    if cached_content:
+        return GenerateContentConfig(
+            cached_content=cached_content,
+            response_mime_type="application/json",
+            response_schema=response_schema,
+            temperature=temperature,
+            **thinking,
+        )
+    return GenerateContentConfig(
+        system_instruction=system_prompt,
+        response_mime_type="application/json",
+        response_schema=response_schema,
+        temperature=temperature,
+        **thinking,
+    )
+
+
+def _prepare_request(
+    cached_name: str | None,
+    system_prompt: str,
+    cached_prefix: str,
+    user_prompt: str,
+    response_schema: dict,
+    temperature: float,
+) -> tuple[str, GenerateContentConfig]:
+    """(contents, config) for a call, via the cached context when one exists."""
+    if cached_name:
+        return user_prompt, _build_config(None, response_schema, temperature, cached_name)
+    return cached_prefix + user_prompt, _build_config(system_prompt, response_schema, temperature)
+
+
+def _log_call(
+    tags: dict | None,
+    start: float,
+    retries: int = 0,
+    resp=None,
+    cache_hit: bool = False,
+    error: bool = False,
+) -> None:
+    """Append one call's usage and wall-clock latency (including retries) to CALL_LOG."""
+    CALL_LOG.record(
+        **(tags or {}),
+        model=current_model(),
+        cache_hit=cache_hit,
+        error=error,
+        retries=retries,
+        latency_sec=time.perf_counter() - start,
+        **usage_counts(resp),
+    )
+
+
+def _record_context_usage(resp, cached_name: str | None, latency: float) -> None:
+    if CONTEXT_CACHE is not None:
+        CONTEXT_CACHE.record(resp, cached_name is not None, latency)
 
 
 def call_gemini(
@@ -31,28 +253,133 @@ def call_gemini(
     response_schema: dict,
     temperature: float = 0.2,
     max_retries: int = 3,
+    use_cache: bool = True,
+    cached_prefix: str = "",
+    tags: dict | None = None,
 ) -> dict:
-    """Call Gemini with structured JSON output. Returns parsed dict."""
-    config = GenerateContentConfig(
-        system_instruction=system_prompt,
-        response_mime_type="application/json",
-        response_schema=response_schema,
-        temperature=temperature,
-        thinking_config=ThinkingConfig(thinking_budget=2048),
+    """Call Gemini with structured JSON output. Returns parsed dict.
+
+    The user content is cached_prefix + user_prompt. When CONTEXT_CACHE is
+    enabled, the system prompt and cached_prefix are sent once as a cached
+    context and each call only carries user_prompt.
+
+    Responses are served from / written to the response cache when one is
+    configured; use_cache=False bypasses it for this call. Each attempt
+    first reserves request/token quota from SCHEDULER.
+
+    Token usage, latency and retries are logged to CALL_LOG under the
+    current call_tags() plus `tags`.
+    """
+    model = current_model()
+    temperature = _temperature(temperature)
+    start = time.perf_counter()
+    key, cached = _cache_lookup(
+        system_prompt, cached_prefix + user_prompt, response_schema, temperature, use_cache
+    )
+    if cached is not None:
+        _log_call(tags, start, cache_hit=True)
+        return cached
+
+    cached_name = None
+    if CONTEXT_CACHE is not None:
+        cached_name = CONTEXT_CACHE.get(client, model, system_prompt, cached_prefix)
+    contents, config = _prepare_request(
+        cached_name, system_prompt, cached_prefix, user_prompt, response_schema, temperature
     )
+    reserved = estimate_tokens(system_prompt, cached_prefix, user_prompt)
 
     for attempt in range(max_retries):
+        SCHEDULER.acquire(model, reserved)
         try:
+            attempt_start = time.perf_counter()
             resp = client.models.generate_content(
-                model=MODEL,
-                contents=user_prompt,
+                model=model,
+                contents=contents,
                 config=config,
             )
-            return json.loads(resp.text)
+            result = json.loads(resp.text)
+            _record_context_usage(resp, cached_name, time.perf_counter() - attempt_start)
+            SCHEDULER.record_usage(model, reserved, _total_tokens(resp))
+            break
+        except ReplayMiss:
+            # Deterministic: retrying would find the same recording missing
+            _log_call(tags, start, retries=attempt, error=True)
+            raise
         except Exception as e:
             if attempt < max_retries - 1:
-                wait = 2 ** (attempt + 1)
-                print(f"  [retry {attempt+1}/{max_retries}] {e}, waiting {wait}s...")
+                wait = _retry_wait(attempt, e)
+                print(f"  [retry {attempt+1}/{max_retries}] {e}, waiting {wait:.1f}s...")
                 time.sleep(wait)
             else:
+                _log_call(tags, start, retries=attempt, error=True)
                 raise
+
+    _log_call(tags, start, retries=attempt, resp=resp)
+    if key is not None:
+        _cache.put(key, result)
+    return result
+
+
+async def call_gemini_async(
+    client: genai.Client,
+    system_prompt: str,
+    user_prompt: str,
+    response_schema: dict,
+    temperature: float = 0.2,
+    max_retries: int = 3,
+    use_cache: bool = True,
+    cached_prefix: str = "",
+    tags: dict | None = None,
+) -> dict:
+    """Async variant of call_gemini using the client's aio interface."""
+    model = current_model()
+    temperature = _temperature(temperature)
+    start = time.perf_counter()
+    key, cached = _cache_lookup(
+        system_prompt, cached_prefix + user_prompt, response_schema, temperature, use_cache
+    )
+    if cached is not None:
+        _log_call(tags, start, cache_hit=True)
+        return cached
+
+    cached_name = None
+    if CONTEXT_CACHE is not None:
+        # Context creation is a one-off blocking call per prefix
+        cached_name = await asyncio.to_thread(
+            CONTEXT_CACHE.get, client, model, system_prompt, cached_prefix
+        )
+    contents, config = _prepare_request(
+        cached_name, system_prompt, cached_prefix, user_prompt, response_schema, temperature
+    )
+    reserved = estimate_tokens(system_prompt, cached_prefix, user_prompt)
+
+    for attempt in range(max_retries):
+        await SCHEDULER.acquire_async(model, reserved)
+        try:
+            attempt_start = time.perf_counter()
+            resp = await client.aio.models.generate_content(
+                model=model,
+                contents=contents,
+                config=config,
+            )
+            result = json.loads(resp.text)
+            _record_context_usage(resp, cached_name, time.perf_counter() - attempt_start)
+            SCHEDULER.record_usage(model, reserved, _total_tokens(resp))
+            break
+        except ReplayMiss:
+            # Deterministic: retrying would find the same recording missing
+            _log_call(tags, start, retries=attempt, error=True)
+            raise
+        except Exception as e:
+            if attempt < max_retries - 1:
+                wait = _retry_wait(attempt, e)
+                print(f"  [retry {attempt+1}/{max_retries}] {e}, waiting {wait:.1f}s...")
+                await asyncio.sleep(wait)
+            else:
+                _log_call(tags, start, retries=attempt, error=True)
+                raise
+
+    _log_call(tags, start, retries=attempt, resp=resp)
+    if key is not None:
+        _cache.put(key, result)
+    return result
@@ -98,21 +98,10 @@ def build_system_prompt(rel_info: dict) -> str:
 - headとtailにはentitiesのidを指定してください。"""
 
 
-def build_extraction_prompt(
-    doc_text: str,
-    few_shot_text: str,
-    few_shot_output: dict,
-    mode: str = "baseline",
-) -> str:
-    """Build user prompt for extraction."""
+def build_few_shot_block(few_shot_text: str, few_shot_output: dict) -> str:
+    """Build the static few-shot example block that opens every extraction prompt."""
     few_shot_json = json.dumps(few_shot_output, ensure_ascii=False, indent=2)
 
-    mode_instruction = ""
-    if mode == "recall":
-        mode_instruction = """
-重要: できるだけ多くの関係を漏れなく抽出してください。確信度が低い場合でも、可能性がある関係は候補として含めてください。
-後の検証ステップで精度を高めるため、この段階では再現率（recall）を優先してください。"""
-
     return f"""## 例
 入力文書:
 {few_shot_text}
@@ -120,10 +109,66 @@ def build_extraction_prompt(
 出力:
 {few_shot_json}
 
-## 対象文書
+"""
+
+
+def build_target_block(doc_text: str, instruction: str) -> str:
+    """Build the per-document block that follows the few-shot example."""
+    return f"""## 対象文書
 {doc_text}
 
-上記の文書からエンティティと関係を抽出してください。{mode_instruction}"""
+上記の文書からエンティティと関係を抽出してください。{instruction}"""
+
+
+PACKED_TARGET_INSTRUCTION = """
+各文書は独立に扱い、文書をまたぐ関係は抽出しないでください。
+出力のdocuments配列には、文書ごとに見出しのdoc_idとその文書のentities・relationsを1件ずつ含めてください。"""
+
+
+def build_packed_target_block(doc_ids: list[str], doc_texts: list[str]) -> str:
+    """Build the target block for several documents extracted in one call."""
+    sections = "\n\n".join(
+        f"### doc_id: {doc_id}\n{doc_text}" for doc_id, doc_text in zip(doc_ids, doc_texts)
+    )
+    return f"""## 対象文書（{len(doc_ids)}件）
+{sections}
+
+上記の各文書からエンティティと関係を抽出してください。{PACKED_TARGET_INSTRUCTION}"""
+
+
+def _mode_instruction(mode: str) -> str:
+    if mode == "recall":
+        return """
+重要: できるだけ多くの関係を漏れなく抽出してください。確信度が低い場合でも、可能性がある関係は候補として含めてください。
+後の検証ステップで精度を高めるため、この段階では再現率（recall）を優先してください。"""
+    return ""
+
+
+def build_extraction_prompt(
+    doc_text: str,
+    few_shot_text: str,
+    few_shot_output: dict,
+    mode: str = "baseline",
+) -> str:
+    """Build user prompt for extraction."""
+    return (
+        build_few_shot_block(few_shot_text, few_shot_output)
+        + build_target_block(doc_text, _mode_instruction(mode))
+    )
+
+
+def build_verification_candidate(i: int, candidate: dict, entity_map: dict, rel_info: dict) -> str:
+    """One candidate entry of the verification prompt."""
+    head_name = entity_map.get(candidate["head"], candidate["head"])
+    tail_name = entity_map.get(candidate["tail"], candidate["tail"])
+    rel_code = candidate["relation"]
+    rel_name = rel_info.get(rel_code, "不明")
+    ja_desc = RELATION_JAPANESE.get(rel_code, "")
+    return (
+        f"候補{i}: {head_name} --[{rel_code}: {rel_name}]--> {tail_name}\n"
+        f"  根拠: {candidate.get('evidence', '(なし)')}\n"
+        f"  関係の定義: {ja_desc}"
+    )
 
 
 def build_verification_prompt(
@@ -133,18 +178,10 @@ def build_verification_prompt(
     rel_info: dict,
 ) -> str:
     """Build verification prompt for Stage 2."""
-    candidate_lines = []
-    for i, c in enumerate(candidates):
-        head_name = entity_map.get(c["head"], c["head"])
-        tail_name = entity_map.get(c["tail"], c["tail"])
-        rel_code = c["relation"]
-        rel_name = rel_info.get(rel_code, "不明")
-        ja_desc = RELATION_JAPANESE.get(rel_code, "")
-        candidate_lines.append(
-            f"候補{i}: {head_name} --[{rel_code}: {rel_name}]--> {tail_name}\n"
-            f"  根拠: {c.get('evidence', '(なし)')}\n"
-            f"  関係の定義: {ja_desc}"
-        )
+    candidate_lines = [
+        build_verification_candidate(i, c, entity_map, rel_info)
+        for i, c in enumerate(candidates)
+    ]
 
     return f"""以下の文書と、そこから抽出された関係候補を検証してください。
 
@@ -196,6 +233,21 @@ def build_group_system_prompt(group_name: str, group_pcodes: list[str], rel_info
 - headとtailにはentitiesのidを指定してください。"""
 
 
+def filter_few_shot_output(few_shot_output: dict, group_pcodes: list[str]) -> dict:
+    """Restrict few-shot relations to a group's P-codes (entities are kept as-is)."""
+    group_pcode_set = set(group_pcodes)
+    return {
+        "entities": few_shot_output.get("entities", []),
+        "relations": [
+            r for r in few_shot_output.get("relations", [])
+            if r.get("relation") in group_pcode_set
+        ],
+    }
+
+
+GROUP_TARGET_INSTRUCTION = "指定された関係タイプのみを対象としてください。"
+
+
 def build_group_extraction_prompt(
     doc_text: str,
     few_shot_text: str,
@@ -203,31 +255,218 @@ def build_group_extraction_prompt(
     group_pcodes: list[str],
 ) -> str:
     """Build extraction prompt filtered for a specific relation group."""
-    group_pcode_set = set(group_pcodes)
-
     # Filter few-shot output to only include relations from current group
-    filtered_output = {"entities": few_shot_output.get("entities", [])}
-    filtered_relations = [
-        r for r in few_shot_output.get("relations", [])
-        if r.get("relation") in group_pcode_set
-    ]
+    filtered_output = filter_few_shot_output(few_shot_output, group_pcodes)
+
+    return (
+        build_few_shot_block(few_shot_text, filtered_output)
+        + build_target_block(doc_text, GROUP_TARGET_INSTRUCTION)
+    )
 
-    if filtered_relations:
-        filtered_output["relations"] = filtered_relations
-    else:
-        # Show entities only if no matching relations in few-shot
-        filtered_output["relations"] = []
 
-    few_shot_json = json.dumps(filtered_output, ensure_ascii=False, indent=2)
+def _entity_type_lines() -> str:
+    return "\n".join(f"  - {etype}: {desc}" for etype, desc in ENTITY_TYPES_JAPANESE.items())
+
+
+def build_entity_system_prompt() -> str:
+    """System prompt for the entity-only pass of entity-first extraction."""
+    return f"""あなたは日本語文書から固有表現（エンティティ）を抽出する専門家です。
+
+## タスク
+与えられた日本語文書から、エンティティ（固有表現）をすべて抽出してください。関係は抽出しません。
+抽出したエンティティは、後続の関係抽出で共通のエンティティ一覧として使われます。
+
+## エンティティタイプ（8種類）
+{_entity_type_lines()}
 
+## ルール
+- エンティティには上記のタイプのみ使用してください。
+- 同一のエンティティは1回だけ、e0, e1, ... の一意なidを付けて出力してください。
+- 関係の主語・目的語になりうるエンティティを漏れなく含めてください。"""
+
+
+def build_entity_target_block(doc_text: str) -> str:
+    """Per-document block of the entity-only pass."""
+    return f"""## 対象文書
+{doc_text}
+
+上記の文書からエンティティを抽出してください。"""
+
+
+def format_entity_inventory(entities: list[dict]) -> str:
+    """Entity list shown to relation-only passes, one `- id: name (type)` line each."""
+    return "\n".join(f"- {e['id']}: {e['name']} ({e['type']})" for e in entities)
+
+
+def build_group_relation_system_prompt(
+    group_name: str,
+    group_pcodes: list[str],
+    rel_info: dict,
+) -> str:
+    """System prompt for a relation-only group pass over a given entity list."""
+    relation_lines = []
+    for pcode in group_pcodes:
+        eng_name = rel_info.get(pcode, "")
+        ja_desc = RELATION_JAPANESE.get(pcode, "")
+        if eng_name:
+            relation_lines.append(f"  - {pcode} ({eng_name}): {ja_desc}")
+
+    focus_instruction = GROUP_FOCUS_INSTRUCTIONS.get(group_name, "")
+
+    return f"""あなたは日本語文書から知識グラフの関係を抽出する専門家です。
+
+## タスク
+与えられた日本語文書とエンティティ一覧から、エンティティ間の関係を抽出してください。
+{focus_instruction}
+
+## 対象関係タイプ（このパスで抽出する関係のみ）
+{chr(10).join(relation_lines)}
+
+## ルール
+- headとtailには、エンティティ一覧のidのみを指定してください。新しいエンティティは追加しないでください。
+- 関係には上記のPコード（{', '.join(group_pcodes)}）のみ使用してください。他の関係タイプは抽出しないでください。
+- 各関係には、根拠となる文書中のテキストをevidenceとして付与してください。"""
+
+
+def build_relation_few_shot_block(
+    few_shot_text: str,
+    few_shot_output: dict,
+    group_pcodes: list[str],
+) -> str:
+    """Few-shot block of a relation-only pass: document, entity list, group relations."""
+    filtered = filter_few_shot_output(few_shot_output, group_pcodes)
+    relations_json = json.dumps(
+        {"relations": filtered["relations"]}, ensure_ascii=False, indent=2
+    )
     return f"""## 例
 入力文書:
 {few_shot_text}
 
+エンティティ一覧:
+{format_entity_inventory(filtered["entities"])}
+
 出力:
-{few_shot_json}
+{relations_json}
 
-## 対象文書
+"""
+
+
+def build_relation_target_block(doc_text: str, entities: list[dict]) -> str:
+    """Per-document block of a relation-only pass."""
+    return f"""## 対象文書
 {doc_text}
 
-上記の文書からエンティティと関係を抽出してください。指定された関係タイプのみを対象としてください。"""
+## エンティティ一覧
+{format_entity_inventory(entities)}
+
+上記の文書から、エンティティ一覧のエンティティ間の関係を抽出してください。{GROUP_TARGET_INSTRUCTION}"""
+
+
+class PromptAssembler:
+    """Memoizes the static prompt parts for one (rel_info, few-shot) pair.
+
+    System prompts and few-shot blocks are built once per relation group
+    (None = all relations); per document only the target block is new.
+    Prompts come back as (system_prompt, prefix, suffix) where prefix is
+    the shared few-shot block and prefix + suffix is exactly the prompt
+    built by build_extraction_prompt / build_group_extraction_prompt.
+    """
+
+    def __init__(self, rel_info: dict, few_shot_text: str, few_shot_output: dict):
+        self.rel_info = rel_info
+        self.few_shot_text = few_shot_text
+        self.few_shot_output = few_shot_output
+        # Keyed by group_name (None = all relations) or (group_name, pcodes) for routed subsets
+        self._system_prompts: dict[str | tuple | None, str] = {}
+        self._few_shot_blocks: dict[str | tuple | None, str] = {}
+        # Entity-first parts, keyed by ("entities", None) or ("relations", group_name)
+        self._entity_first: dict[tuple[str, str | None], tuple[str, str]] = {}
+
+    def system_prompt(self, group_name: str | None = None, pcodes: list[str] | None = None) -> str:
+        key = group_name if pcodes is None else (group_name, tuple(pcodes))
+        if key not in self._system_prompts:
+            if group_name is None:
+                prompt = build_system_prompt(self.rel_info)
+            else:
+                prompt = build_group_system_prompt(
+                    group_name, pcodes or RELATION_GROUPS[group_name], self.rel_info
+                )
+            self._system_prompts[key] = prompt
+        return self._system_prompts[key]
+
+    def few_shot_block(self, group_name: str | None = None, pcodes: list[str] | None = None) -> str:
+        key = group_name if pcodes is None else (group_name, tuple(pcodes))
+        if key not in self._few_shot_blocks:
+            output = self.few_shot_output
+            if group_name is not None:
+                output = filter_few_shot_output(output, pcodes or RELATION_GROUPS[group_name])
+            self._few_shot_blocks[key] = build_few_shot_block(self.few_shot_text, output)
+        return self._few_shot_blocks[key]
+
+    def extraction(self, doc_text: str, mode: str = "baseline") -> tuple[str, str, str]:
+        """(system_prompt, prefix, suffix) for the all-relations extraction prompt."""
+        return (
+            self.system_prompt(),
+            self.few_shot_block(),
+            build_target_block(doc_text, _mode_instruction(mode)),
+        )
+
+    def packed_extraction(self, doc_ids: list[str], doc_texts: list[str]) -> tuple[str, str, str]:
+        """(system_prompt, prefix, suffix) for several documents in one call."""
+        return (
+            self.system_prompt(),
+            self.few_shot_block(),
+            build_packed_target_block(doc_ids, doc_texts),
+        )
+
+    def group_extraction(
+        self,
+        group_name: str,
+        doc_text: str,
+        pcodes: list[str] | None = None,
+    ) -> tuple[str, str, str]:
+        """(system_prompt, prefix, suffix) for one relation group's prompt.
+
+        pcodes restricts the prompt to a subset of the group's relations
+        (type-aware routing); None lists the whole group.
+        """
+        return (
+            self.system_prompt(group_name, pcodes),
+            self.few_shot_block(group_name, pcodes),
+            build_target_block(doc_text, GROUP_TARGET_INSTRUCTION),
+        )
+
+    def _entity_first_parts(self, kind: str, group_name: str | None) -> tuple[str, str]:
+        key = (kind, group_name)
+        if key not in self._entity_first:
+            if kind == "entities":
+                few_shot_output = {"entities": self.few_shot_output.get("entities", [])}
+                self._entity_first[key] = (
+                    build_entity_system_prompt(),
+                    build_few_shot_block(self.few_shot_text, few_shot_output),
+                )
+            else:
+                pcodes = RELATION_GROUPS[group_name]
+                self._entity_first[key] = (
+                    build_group_relation_system_prompt(group_name, pcodes, self.rel_info),
+                    build_relation_few_shot_block(
+                        self.few_shot_text, self.few_shot_output, pcodes
+                    ),
+                )
+        return self._entity_first[key]
+
+    def entity_extraction(self, doc_text: str) -> tuple[str, str, str]:
+        """(system_prompt, prefix, suffix) for the entity-only pass."""
+        return (*self._entity_first_parts("entities", None), build_entity_target_block(doc_text))
+
+    def group_relation_extraction(
+        self,
+        group_name: str,
+        doc_text: str,
+        entities: list[dict],
+    ) -> tuple[str, str, str]:
+        """(system_prompt, prefix, suffix) for a relation-only group pass over entities."""
+        return (
+            *self._entity_first_parts("relations", group_name),
+            build_relation_target_block(doc_text, entities),
+        )
@@ -0,0 +1,199 @@
+"""Per-model request/token rate limiting and quota-aware retry backoff."""
+
+import asyncio
+import random
+import re
+import threading
+import time
+from collections import deque
+
+# Rough upper bound for Japanese text; Gemini tokenizes most kana/kanji at <= 1 token/char
+CHARS_PER_TOKEN = 1.0
+WINDOW_SEC = 60.0
+
+
+def estimate_tokens(*texts: str) -> int:
+    """Cheap token estimate for quota reservation (reconciled after the call)."""
+    return int(sum(len(t) for t in texts) / CHARS_PER_TOKEN) + 1
+
+
+def backoff_delay(
+    attempt: int,
+    retry_after: float | None = None,
+    base: float = 2.0,
+    cap: float = 60.0,
+) -> float:
+    """Delay before retry number attempt+1.
+
+    Honors a server-provided retry_after (plus up to 1s jitter) and otherwise
+    uses exponential backoff with equal jitter, so concurrent callers that
+    failed together do not retry in lockstep.
+    """
+    if retry_after is not None:
+        return retry_after + random.uniform(0, 1.0)
+    delay = min(cap, base * 2 ** attempt)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def _parse_seconds(value) -> float | None:
+    """Parse '37s', '1.5', or 12 into seconds."""
+    if value is None:
+        return None
+    match = re.match(r"^\s*(\d+(?:\.\d+)?)\s*s?\s*$", str(value))
+    return float(match.group(1)) if match else None
+
+
+def retry_after_from_error(error: Exception) -> float | None:
+    """Extract a server retry hint from a Gemini API error, if present.
+
+    Checks the HTTP Retry-After header first, then google.rpc.RetryInfo
+    ("retryDelay": "37s") in the error details.
+    """
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if headers is not None:
+        seconds = _parse_seconds(headers.get("retry-after"))
+        if seconds is not None:
+            return seconds
+
+    details = getattr(error, "details", None)
+    if isinstance(details, dict):
+        details = details.get("error", details).get("details", [])
+    for detail in details or []:
+        if isinstance(detail, dict) and "retryDelay" in detail:
+            return _parse_seconds(detail["retryDelay"])
+    return None
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """True for quota errors (HTTP 429 / RESOURCE_EXHAUSTED)."""
+    return getattr(error, "code", None) == 429 or "RESOURCE_EXHAUSTED" in str(error)
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at rate_per_sec up to capacity.
+
+    reserve() always debits immediately (the balance may go negative) and
+    returns how long the caller must wait, so waiters are served in
+    reservation order instead of racing for refills.
+    """
+
+    def __init__(self, capacity: float, rate_per_sec: float):
+        self.capacity = capacity
+        self.rate_per_sec = rate_per_sec
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate_per_sec)
+        self.updated = now
+
+    def reserve(self, amount: float, now: float) -> float:
+        self._refill(now)
+        self.tokens -= amount
+        if self.tokens >= 0:
+            return 0.0
+        return -self.tokens / self.rate_per_sec
+
+    def adjust(self, delta: float, now: float) -> None:
+        """Credit (positive) or debit (negative) tokens after the fact."""
+        self._refill(now)
+        self.tokens = min(self.capacity, self.tokens + delta)
+
+
+class QuotaScheduler:
+    """Shared scheduler holding a request bucket and a token bucket per model.
+
+    Callers reserve capacity before each call, report actual token usage
+    afterwards, and report rate-limit errors so every caller of that model
+    pauses until the server's retry hint has elapsed.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._limits: dict[str, tuple[int | None, int | None]] = {}
+        self._request_buckets: dict[str, TokenBucket] = {}
+        self._token_buckets: dict[str, TokenBucket] = {}
+        self._paused_until: dict[str, float] = {}
+        self._history: dict[str, deque] = {}
+
+    def set_limits(self, model: str, rpm: int | None, tpm: int | None) -> None:
+        """Set requests-per-minute and tokens-per-minute quotas for model (None = unlimited)."""
+        with self._lock:
+            self._limits[model] = (rpm, tpm)
+            self._request_buckets.pop(model, None)
+            self._token_buckets.pop(model, None)
+            if rpm:
+                self._request_buckets[model] = TokenBucket(rpm, rpm / WINDOW_SEC)
+            if tpm:
+                self._token_buckets[model] = TokenBucket(tpm, tpm / WINDOW_SEC)
+            self._history.setdefault(model, deque())
+
+    def reserve(self, model: str, tokens: int) -> float:
+        """Reserve one request and `tokens` tokens. Returns seconds to wait first."""
+        with self._lock:
+            now = time.monotonic()
+            pause = max(0.0, self._paused_until.get(model, 0.0) - now)
+            if model not in self._limits:
+                return pause
+            wait = pause
+            if model in self._request_buckets:
+                wait = max(wait, self._request_buckets[model].reserve(1, now))
+            if model in self._token_buckets:
+                wait = max(wait, self._token_buckets[model].reserve(tokens, now))
+            self._history[model].append((now + wait, tokens, 1))
+            return wait
+
+    def acquire(self, model: str, tokens: int) -> None:
+        """Blocking reserve()."""
+        wait = self.reserve(model, tokens)
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self, model: str, tokens: int) -> None:
+        """Non-blocking reserve() for asyncio callers."""
+        wait = self.reserve(model, tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def record_usage(self, model: str, reserved: int, actual: int | None) -> None:
+        """Reconcile a reservation with the token count the server reported."""
+        if actual is None:
+            return
+        with self._lock:
+            if model not in self._limits:
+                return
+            now = time.monotonic()
+            if model in self._token_buckets:
+                self._token_buckets[model].adjust(reserved - actual, now)
+            # Correction entry: counted as tokens but not as a request
+            self._history[model].append((now, actual - reserved, 0))
+
+    def pause(self, model: str, seconds: float) -> None:
+        """Hold back all callers of model for `seconds` (e.g. after a 429)."""
+        with self._lock:
+            until = time.monotonic() + seconds
+            self._paused_until[model] = max(self._paused_until.get(model, 0.0), until)
+
+    def utilization(self) -> dict:
+        """Per-model fraction of RPM/TPM quota used over the last minute."""
+        with self._lock:
+            now = time.monotonic()
+            report = {}
+            for model, (rpm, tpm) in self._limits.items():
+                history = self._history[model]
+                while history and history[0][0] < now - WINDOW_SEC:
+                    history.popleft()
+                recent = [entry for entry in history if entry[0] <= now]
+                requests = sum(n for _, _, n in recent)
+                tokens = sum(t for _, t, _ in recent)
+                report[model] = {
+                    "rpm_limit": rpm,
+                    "tpm_limit": tpm,
+                    "requests_last_min": requests,
+                    "tokens_last_min": tokens,
+                    "request_utilization": requests / rpm if rpm else None,
+                    "token_utilization": tokens / tpm if tpm else None,
+                    "paused_sec": max(0.0, self._paused_until.get(model, 0.0) - now),
+                }
+            return report
@@ -0,0 +1,178 @@
+"""Record/replay backend: run the pipeline offline from captured Gemini responses.
+
+RecordingClient wraps a live client and appends every response (text, token
+usage and latency) to a JSONL recording, keyed by the same request hash as
+the response cache. ReplayClient serves those responses again without
+network or quota, optionally sleeping to simulate API latency, so every
+stage of the pipeline can be run and timed offline.
+
+Neither client exposes `caches`, so cached-content contexts are not used
+while recording or replaying (prompts are always sent inline).
+"""
+
+import asyncio
+import json
+import threading
+import time
+from types import SimpleNamespace
+
+from batch_mode import config_request_key
+
+# usage_metadata fields kept in a recording
+USAGE_FIELDS = (
+    "prompt_token_count",
+    "cached_content_token_count",
+    "thoughts_token_count",
+    "candidates_token_count",
+    "total_token_count",
+)
+
+
+class ReplayMiss(KeyError):
+    """Raised for a request that has no response in the recording."""
+
+
+def _usage_dict(resp) -> dict:
+    usage = getattr(resp, "usage_metadata", None)
+    return {name: getattr(usage, name, None) for name in USAGE_FIELDS}
+
+
+def load_recording(paths: list[str]) -> dict[str, dict]:
+    """Read recording JSONL files into {key: record}; later records win."""
+    records = {}
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # Torn last line of an interrupted recording
+                    continue
+                records[record["key"]] = record
+    return records
+
+
+class _RecordingModels:
+    def __init__(self, owner: "RecordingClient"):
+        self._owner = owner
+
+    def generate_content(self, model: str, contents: str, config):
+        start = time.perf_counter()
+        resp = self._owner.inner.models.generate_content(
+            model=model, contents=contents, config=config
+        )
+        self._owner._record(model, contents, config, resp, time.perf_counter() - start)
+        return resp
+
+
+class _AsyncRecordingModels:
+    def __init__(self, owner: "RecordingClient"):
+        self._owner = owner
+
+    async def generate_content(self, model: str, contents: str, config):
+        start = time.perf_counter()
+        resp = await self._owner.inner.aio.models.generate_content(
+            model=model, contents=contents, config=config
+        )
+        self._owner._record(model, contents, config, resp, time.perf_counter() - start)
+        return resp
+
+
+class RecordingClient:
+    """Client wrapper that appends every successful response to a recording file."""
+
+    def __init__(self, inner, path: str):
+        self.inner = inner
+        self.path = path
+        self.recorded = 0
+        self._lock = threading.Lock()
+        self.models = _RecordingModels(self)
+        self.aio = SimpleNamespace(models=_AsyncRecordingModels(self))
+
+    def _record(self, model: str, contents: str, config, resp, latency: float) -> None:
+        record = {
+            "key": config_request_key(model, contents, config),
+            "model": model,
+            "text": resp.text,
+            "usage": _usage_dict(resp),
+            "latency_sec": round(latency, 4),
+        }
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+            self.recorded += 1
+
+
+class _ReplayModels:
+    def __init__(self, owner: "ReplayClient"):
+        self._owner = owner
+
+    def generate_content(self, model: str, contents: str, config):
+        record = self._owner._lookup(model, contents, config)
+        time.sleep(self._owner._delay(record))
+        return self._owner._response(record)
+
+
+class _AsyncReplayModels:
+    def __init__(self, owner: "ReplayClient"):
+        self._owner = owner
+
+    async def generate_content(self, model: str, contents: str, config):
+        record = self._owner._lookup(model, contents, config)
+        await asyncio.sleep(self._owner._delay(record))
+        return self._owner._response(record)
+
+
+class ReplayClient:
+    """Stand-in for genai.Client answering from a recording.
+
+    latency: None answers immediately, a number sleeps that many seconds
+    per call, and "recorded" sleeps for each response's recorded latency.
+    Async calls sleep with asyncio.sleep, so concurrency behaves as it
+    would against the live API. Requests missing from the recording raise
+    ReplayMiss.
+    """
+
+    def __init__(self, records: dict[str, dict], latency: float | str | None = None):
+        if isinstance(latency, str) and latency != "recorded":
+            raise ValueError(f"latency must be a number, 'recorded' or None, not {latency!r}")
+        self.records = records
+        self.latency = latency
+        self.served = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self.models = _ReplayModels(self)
+        self.aio = SimpleNamespace(models=_AsyncReplayModels(self))
+
+    def _lookup(self, model: str, contents: str, config) -> dict:
+        key = config_request_key(model, contents, config)
+        record = self.records.get(key)
+        with self._lock:
+            if record is None:
+                self.misses += 1
+            else:
+                self.served += 1
+        if record is None:
+            raise ReplayMiss(f"No recorded response for request {key[:12]}")
+        return record
+
+    def _delay(self, record: dict) -> float:
+        if self.latency == "recorded":
+            return record.get("latency_sec", 0.0)
+        return self.latency or 0.0
+
+    @staticmethod
+    def _response(record: dict) -> SimpleNamespace:
+        return SimpleNamespace(
+            text=record["text"],
+            usage_metadata=SimpleNamespace(**record.get("usage", {})),
+        )
+
+
+def parse_latency(value: str) -> float | str:
+    """argparse type for --replay-latency: seconds or "recorded"."""
+    return value if value == "recorded" else float(value)
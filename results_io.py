@@ -0,0 +1,120 @@
+"""Streaming results layout: per-doc JSONL, detail JSONL and a columnar summary table.
+
+For a results stem such as "results" (next to results.json):
+
+    results.docs.jsonl     first line {"experiment": ...}, then one line per
+                           (condition, doc): metrics, per-relation counts,
+                           stats and usage, without fp/fn details
+    results.details.jsonl  one line per (condition, doc) with fp_details/fn_details
+    results.summary.tsv    one row per (condition, level, key) with
+                           tp/fp/fn/precision/recall/f1; level is "aggregate"
+                           (key "all"), "relation" (P-code) or "doc" (title)
+
+Every file can be read line by line, so comparing many runs never loads a
+whole results file or any detail list.
+"""
+
+import csv
+import json
+import os
+
+DETAIL_FIELDS = ("fp_details", "fn_details")
+SUMMARY_COLUMNS = ("condition", "level", "key", "tp", "fp", "fn", "precision", "recall", "f1")
+_METRICS = SUMMARY_COLUMNS[3:]
+
+
+def stream_paths(stem: str) -> dict[str, str]:
+    """{"docs", "details", "summary"} file paths for a results stem."""
+    return {
+        "docs": f"{stem}.docs.jsonl",
+        "details": f"{stem}.details.jsonl",
+        "summary": f"{stem}.summary.tsv",
+    }
+
+
+def _summary_row(condition: str, level: str, key: str, metrics: dict) -> list:
+    return [condition, level, key] + [metrics.get(m, 0) for m in _METRICS]
+
+
+def write_results_stream(output: dict, stem: str) -> dict[str, str]:
+    """Write a run_experiment-style output dict in the streaming layout. Returns the paths."""
+    paths = stream_paths(stem)
+    with open(paths["docs"], "w", encoding="utf-8") as docs_f, \
+            open(paths["details"], "w", encoding="utf-8") as details_f, \
+            open(paths["summary"], "w", encoding="utf-8", newline="") as summary_f:
+        summary = csv.writer(summary_f, delimiter="\t", lineterminator="\n")
+        summary.writerow(SUMMARY_COLUMNS)
+        docs_f.write(json.dumps({"experiment": output.get("experiment", {})},
+                                ensure_ascii=False, default=str) + "\n")
+
+        for condition, results in output.get("conditions", {}).items():
+            aggregate = results["aggregate"]
+            summary.writerow(_summary_row(condition, "aggregate", "all", aggregate))
+            for relation, metrics in aggregate.get("per_relation", {}).items():
+                summary.writerow(_summary_row(condition, "relation", relation, metrics))
+
+            for doc in results["per_doc"]:
+                summary.writerow(_summary_row(condition, "doc", doc["title"], doc))
+                line = {"condition": condition}
+                line.update((k, v) for k, v in doc.items() if k not in DETAIL_FIELDS)
+                docs_f.write(json.dumps(line, ensure_ascii=False, default=str) + "\n")
+                if any(field in doc for field in DETAIL_FIELDS):
+                    details = {"condition": condition, "title": doc["title"]}
+                    details.update((field, doc.get(field, [])) for field in DETAIL_FIELDS)
+                    details_f.write(json.dumps(details, ensure_ascii=False) + "\n")
+    return paths
+
+
+def convert_results(json_path: str, stem: str | None = None) -> dict[str, str]:
+    """Convert a results_*.json file to the streaming layout (stem defaults to its own)."""
+    with open(json_path, encoding="utf-8") as f:
+        output = json.load(f)
+    return write_results_stream(output, stem or os.path.splitext(json_path)[0])
+
+
+def _number(value: str) -> int | float:
+    return float(value) if "." in value or "e" in value else int(value)
+
+
+def iter_summary(path: str, conditions=None, levels=None):
+    """Yield summary rows as dicts with numeric metrics, optionally filtered."""
+    with open(path, encoding="utf-8", newline="") as f:
+        for row in csv.DictReader(f, delimiter="\t"):
+            if conditions is not None and row["condition"] not in conditions:
+                continue
+            if levels is not None and row["level"] not in levels:
+                continue
+            for metric in _METRICS:
+                row[metric] = _number(row[metric])
+            yield row
+
+
+def iter_doc_results(path: str, condition: str | None = None):
+    """Yield the per-doc lines of a docs.jsonl file (the experiment header is skipped)."""
+    with open(path, encoding="utf-8") as f:
+        next(f, None)
+        for line in f:
+            doc = json.loads(line)
+            if condition is None or doc["condition"] == condition:
+                yield doc
+
+
+def read_experiment(path: str) -> dict:
+    """The experiment block from the first line of a docs.jsonl file."""
+    with open(path, encoding="utf-8") as f:
+        return json.loads(f.readline())["experiment"]
+
+
+def iter_details(path: str, condition: str | None = None, title: str | None = None):
+    """Yield {"condition", "title", "fp_details", "fn_details"} lines of a details.jsonl file."""
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            # Filter on the raw line before parsing the detail lists
+            if title is not None and json.dumps(title, ensure_ascii=False) not in line:
+                continue
+            details = json.loads(line)
+            if condition is not None and details["condition"] != condition:
+                continue
+            if title is not None and details["title"] != title:
+                continue
+            yield details
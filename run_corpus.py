@@ -0,0 +1,362 @@
+"""Corpus runner: whole JacRED splits processed by work-queue workers.
+
+    python run_corpus.py init --split dev --conditions baseline relation_split
+    python run_corpus.py work --processes 4     # on every machine sharing the directory
+    python run_corpus.py status
+    python run_corpus.py merge                  # -> results_corpus.json
+
+Workers lease (condition, doc) tasks from a SQLite queue, append each result
+to their own shard checkpoint and only then mark the task done. A task whose
+worker dies is leased again once its heartbeat stops; merge keeps exactly one
+result per task, the one from the worker the queue recorded as finishing it.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import socket
+import sys
+import traceback
+import uuid
+from datetime import datetime
+from glob import glob
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from data_loader import doc_to_text, load_jacred, select_few_shot, source_fingerprint
+from constraint_index import load_or_build_constraint_index
+from call_accounting import call_tags, summarize_calls
+from llm_client import (
+    CALL_LOG,
+    MODEL,
+    configure_cache,
+    configure_rate_limits,
+    create_client,
+    load_api_key,
+)
+from checkpoint import Checkpoint, read_checkpoint
+from kg_store import KGStore
+from results_io import write_results_stream
+from scoring import ScoringEngine
+from work_queue import DEFAULT_LEASE_SEC, DEFAULT_MAX_ATTEMPTS, Heartbeat, WorkQueue
+from run_experiment import (
+    CACHE_MAX_MB,
+    CACHE_PATH,
+    CONDITIONS,
+    DEFAULT_CONDITIONS,
+    ENV_PATH,
+    JACRED_PATH,
+    _extract,
+    _print_comparison,
+    _score_doc,
+    finalize_from_checkpoint,
+)
+
+RUN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus_run")
+RESULTS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results_corpus.json")
+
+
+def _queue_path(run_dir):
+    return os.path.join(run_dir, "queue.sqlite")
+
+
+def _shard_dir(run_dir):
+    return os.path.join(run_dir, "shards")
+
+
+def _constraint_index(data, jacred_path):
+    return load_or_build_constraint_index(
+        data["train"], data["rel2id"], data["ent2id"],
+        path=os.path.join(jacred_path, ".snapshot", "constraint_index.json"),
+        fingerprint=source_fingerprint(os.path.join(jacred_path, "train.json")),
+    )
+
+
+def init(args):
+    """Create (or extend) the queue with one task per (doc, condition) of the split."""
+    os.makedirs(_shard_dir(args.run_dir), exist_ok=True)
+    data = load_jacred(args.jacred_path, lazy=True)
+    split = data[args.split]
+    few_shot = select_few_shot(data["train"])
+    # Compile snapshots and the constraint index once, so workers only read them
+    _constraint_index(data, args.jacred_path)
+
+    num_docs = len(split) if args.limit is None else min(args.limit, len(split))
+    config = {
+        "model": MODEL,
+        "jacred_path": args.jacred_path,
+        "split": args.split,
+        "few_shot_doc": few_shot["title"],
+        "conditions": args.conditions,
+        "chunk_chars": args.chunk_chars,
+        "price_input": args.price_input,
+        "price_output": args.price_output,
+    }
+    # Doc-major order, so partial progress covers every condition on the same docs
+    tasks = [
+        (extraction_fn, i, split.titles[i])
+        for i in range(num_docs) for extraction_fn in args.conditions
+    ]
+    queue = WorkQueue(_queue_path(args.run_dir))
+    added = queue.init(config, tasks)
+    print(f"Queue {queue.path}: {added} tasks added "
+          f"({num_docs} {args.split} docs x {len(args.conditions)} conditions)")
+    print(f"  {queue.counts()}")
+    queue.close()
+
+
+def _process_task(task, config, split, few_shot, client, schema_info, constraint_table,
+                  kg_store=None):
+    """Extract and score one (condition, doc) task. Returns (doc_result, call records)."""
+    doc = split[task["doc_index"]].copy()
+    doc["doc_text"] = doc_to_text(doc)
+    extraction_fn = task["condition"]
+    tags = {"condition": extraction_fn, "task": task["id"], "attempt": task["attempt"]}
+    with call_tags(**tags, doc=doc["title"]):
+        entities, triples, stats = _extract(
+            doc, few_shot, client, schema_info, extraction_fn, constraint_table,
+            config["chunk_chars"],
+        )
+    if kg_store is not None:
+        # Idempotent per (doc, condition, model), so a redone task replaces its rows
+        kg_store.add_document(doc["title"], extraction_fn, entities, triples, config["model"])
+    doc_result = _score_doc(
+        task["doc_index"], len(split), doc, entities, triples, stats, ScoringEngine()
+    )
+    calls = CALL_LOG.doc_records(doc["title"], **tags)
+    doc_result["usage"] = summarize_calls(calls, config["price_input"], config["price_output"])
+    return doc_result, calls
+
+
+def work_loop(args):
+    """Lease and process tasks until the queue has nothing left for this worker."""
+    # Unique per run: a restarted worker reusing a PID must not truncate the old shard
+    worker = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+    queue = WorkQueue(_queue_path(args.run_dir))
+    config = queue.config()
+
+    data = load_jacred(config["jacred_path"], lazy=True)
+    split = data[config["split"]]
+    few_shot = select_few_shot(data["train"])
+    if few_shot["title"] != config["few_shot_doc"]:
+        raise ValueError(
+            f"Few-shot doc changed since init: {few_shot['title']} != {config['few_shot_doc']}"
+        )
+    schema_info = {
+        "rel_info": data["rel_info"],
+        "ent2id": data["ent2id"],
+        "rel2id": data["rel2id"],
+    }
+    constraint_table = _constraint_index(data, config["jacred_path"])
+
+    client = create_client(load_api_key(args.env_path))
+    if not args.no_cache:
+        # SQLite in WAL mode; shared by every worker pointed at the same file
+        configure_cache(args.cache_path, args.cache_max_mb * 1024 * 1024)
+    if args.rpm or args.tpm:
+        configure_rate_limits(args.rpm, args.tpm)
+
+    # Shared by every worker pointed at the same file, like the response cache
+    kg_store = KGStore(args.kg_store) if args.kg_store else None
+    shard = Checkpoint(
+        os.path.join(_shard_dir(args.run_dir), f"{worker}.jsonl"),
+        {**config, "worker": worker},
+    )
+    print(f"[{worker}] started")
+    done = 0
+    while True:
+        task = queue.lease(worker, args.lease_sec, args.max_attempts)
+        if task is None:
+            break
+        try:
+            with Heartbeat(queue, task["id"], worker, args.lease_sec) as heartbeat:
+                doc_result, calls = _process_task(
+                    task, config, split, few_shot, client, schema_info, constraint_table,
+                    kg_store,
+                )
+            # Durable in the shard before the queue says done; a crash in
+            # between only means the task is redone
+            shard.append(task["condition"], doc_result, calls)
+            if heartbeat.lost or not queue.complete(task["id"], worker):
+                print(f"[{worker}] lease on task {task['id']} expired; result superseded")
+            else:
+                done += 1
+        except KeyboardInterrupt:
+            queue.release(task["id"], worker)
+            raise
+        except Exception as e:
+            print(f"[{worker}] task {task['id']} ({task['condition']}, {task['title']}) "
+                  f"failed on attempt {task['attempt']}: {e}")
+            queue.fail(task["id"], worker, traceback.format_exc(), args.max_attempts)
+        finally:
+            CALL_LOG.clear()
+    print(f"[{worker}] finished: {done} tasks done")
+    queue.close()
+    if kg_store is not None:
+        kg_store.close()
+
+
+def work(args):
+    """Run --processes worker processes on this machine."""
+    if args.processes <= 1:
+        work_loop(args)
+        return
+    procs = [
+        multiprocessing.Process(target=work_loop, args=(args,))
+        for _ in range(args.processes)
+    ]
+    for proc in procs:
+        proc.start()
+    for proc in procs:
+        proc.join()
+
+
+def status(args):
+    queue = WorkQueue(_queue_path(args.run_dir))
+    config = queue.config()
+    counts = queue.counts()
+    total = sum(counts.values())
+    print(f"{config['split']} x {config['conditions']}: {total} tasks")
+    for name in ("pending", "leased", "done", "failed"):
+        print(f"  {name:>8}: {counts.get(name, 0)}")
+    queue.close()
+
+
+def merge(args):
+    """Combine the shards into one checkpoint plus a results file."""
+    queue = WorkQueue(_queue_path(args.run_dir))
+    config = queue.config()
+    done_by = queue.done_by()
+    counts = queue.counts()
+    queue.close()
+
+    # One entry per task, from the worker the queue recorded as finishing it
+    entries = {}
+    superseded = 0
+    shard_paths = sorted(glob(os.path.join(_shard_dir(args.run_dir), "*.jsonl")))
+    for path in shard_paths:
+        shard_config, shard_entries = read_checkpoint(path)
+        for entry in shard_entries:
+            key = (entry["condition"], entry["doc"]["title"])
+            if done_by.get(key) == shard_config["worker"]:
+                entries[key] = entry
+            else:
+                superseded += 1
+
+    data = load_jacred(config["jacred_path"], lazy=True)
+    order = {title: i for i, title in enumerate(data[config["split"]].titles)}
+    # Rebuilt from the shards on every merge, so replacing the previous one is intended
+    merged = Checkpoint(os.path.join(args.run_dir, "merged.checkpoint.jsonl"), {
+        "model": config["model"],
+        "few_shot_doc": config["few_shot_doc"],
+        "pack_chars": 0,
+        "chunk_chars": config["chunk_chars"],
+        "docs": sorted({title for _, title in entries}, key=order.get),
+    }, overwrite=True)
+    for key in sorted(entries, key=lambda k: (config["conditions"].index(k[0]), order[k[1]])):
+        merged.append(key[0], entries[key]["doc"], entries[key]["calls"])
+
+    print(f"=== Merging {len(shard_paths)} shards: {len(entries)} results "
+          f"({superseded} superseded duplicates dropped) ===")
+    if counts.get("done", 0) != sum(counts.values()):
+        print(f"  Warning: queue not finished: {counts}")
+
+    condition_results = finalize_from_checkpoint(
+        merged, config["price_input"], config["price_output"]
+    )
+    _print_comparison(condition_results)
+    output = {
+        "experiment": {
+            "model": config["model"],
+            "split": config["split"],
+            "num_docs": len(merged.config["docs"]),
+            "few_shot_doc": config["few_shot_doc"],
+            "chunk_chars": config["chunk_chars"],
+            "workers": len(shard_paths),
+            "queue": counts,
+            "timestamp": datetime.now().isoformat(),
+        },
+        "conditions": condition_results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(output, f, ensure_ascii=False, indent=2, default=str)
+    print(f"\nResults saved to {args.output}")
+    paths = write_results_stream(output, os.path.splitext(args.output)[0])
+    print(f"Streaming results: {paths['docs']}, {paths['summary']}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--run-dir", default=RUN_DIR,
+        help="Directory holding queue.sqlite and the worker shards (default: %(default)s)",
+    )
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("init", help="Create the task queue for a split")
+    p.add_argument("--split", choices=["dev", "test"], default="dev")
+    p.add_argument(
+        "--conditions", nargs="+", choices=list(CONDITIONS), default=DEFAULT_CONDITIONS,
+        help="Conditions to run (default: %(default)s)",
+    )
+    p.add_argument("--jacred-path", default=JACRED_PATH)
+    p.add_argument(
+        "--limit", type=int, default=None,
+        help="Only enqueue the first N docs of the split",
+    )
+    p.add_argument(
+        "--chunk-chars", type=int, default=0,
+        help="Baseline: extract docs longer than this many characters as sentence windows",
+    )
+    p.add_argument("--price-input", type=float, default=None,
+                   help="USD per 1M input tokens, for cost_usd in the usage blocks")
+    p.add_argument("--price-output", type=float, default=None,
+                   help="USD per 1M output (incl. thinking) tokens")
+
+    p = sub.add_parser("work", help="Process tasks until the queue is drained")
+    p.add_argument(
+        "--processes", type=int, default=1,
+        help="Worker processes to start on this machine (default: %(default)s)",
+    )
+    p.add_argument(
+        "--lease-sec", type=float, default=DEFAULT_LEASE_SEC,
+        help="Lease length; renewed by heartbeats every third of it (default: %(default)s)",
+    )
+    p.add_argument(
+        "--max-attempts", type=int, default=DEFAULT_MAX_ATTEMPTS,
+        help="Attempts per task before it is marked failed (default: %(default)s)",
+    )
+    p.add_argument("--env-path", default=ENV_PATH)
+    p.add_argument("--cache-path", default=CACHE_PATH)
+    p.add_argument("--cache-max-mb", type=int, default=CACHE_MAX_MB)
+    p.add_argument("--no-cache", action="store_true")
+    p.add_argument(
+        "--rpm", type=int, default=None,
+        help="Requests-per-minute quota of each worker process (default: unlimited)",
+    )
+    p.add_argument(
+        "--tpm", type=int, default=None,
+        help="Tokens-per-minute quota of each worker process (default: unlimited)",
+    )
+    p.add_argument(
+        "--kg-store", metavar="PATH", default=None,
+        help="Upsert every task's extracted entities and triples into this SQLite KG store",
+    )
+
+    sub.add_parser("status", help="Show task counts per status")
+
+    p = sub.add_parser("merge", help="Combine worker shards into one results file")
+    p.add_argument("--output", default=RESULTS_PATH)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    {"init": init, "work": work, "status": status, "merge": merge}[args.command](args)
+
+
+if __name__ == "__main__":
+    main()
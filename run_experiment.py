@@ -1,24 +1,300 @@
 """Main experiment script: Baseline vs RelationSplit on JacRED dev subset."""
 
+import argparse
+import asyncio
 import json
 import sys
 import os
 from datetime import datetime
+from itertools import count
 
 sys.path.insert(0, os.path.dirname(__file__))
 
-from data_loader import load_jacred, select_dev_docs, select_few_shot, build_constraint_table
-from llm_client import load_api_key, create_client
-from extraction import run_baseline, run_relation_split
-from evaluation import align_entities, evaluate_relations, aggregate_results
+from data_loader import load_jacred, select_dev_docs, select_few_shot, source_fingerprint
+from constraint_index import load_or_build_constraint_index
+from call_accounting import call_tags, summarize_calls
+from llm_client import (
+    CALL_LOG,
+    MODEL,
+    SCHEDULER,
+    current_model,
+    configure_cache,
+    configure_context_cache,
+    configure_rate_limits,
+    create_client,
+    load_api_key,
+)
+from extraction import (
+    pack_documents,
+    run_baseline,
+    run_baseline_async,
+    run_baseline_chunked,
+    run_baseline_chunked_async,
+    run_baseline_packed,
+    run_baseline_packed_async,
+    run_entity_first,
+    run_entity_first_async,
+    run_proposed,
+    run_relation_split,
+    run_relation_split_async,
+)
+from batch_mode import BatchClient, load_batch_results
+from evaluation import align_entities
+from checkpoint import Checkpoint
+from context_cache import LocalCachedContentClient
+from kg_store import KGStore
+from replay_backend import parse_latency
+from results_io import write_results_stream
+from scoring import ScoringEngine, aggregate_scores
 
 ENV_PATH = os.path.expanduser(
     "~/Library/CloudStorage/Dropbox/secrets/.env"
 )
+JACRED_PATH = "/tmp/JacRED/"
 NUM_DOCS = 10
+CONCURRENCY = 1
+CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "llm_cache.sqlite")
+CACHE_MAX_MB = 512
+BATCH_REQUESTS_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "batch_requests.jsonl"
+)
+CHECKPOINT_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "results.checkpoint.jsonl"
+)
+
+# extraction_fn -> (section title, comparison-table label)
+CONDITIONS = {
+    "baseline": ("Condition 1: Baseline (One-shot)", "Baseline"),
+    "relation_split": ("Condition 2: RelSplit (Multi-Pass)", "RelSplit"),
+    "proposed": ("Condition 3: Generate + Verify (Two-Stage)", "Proposed"),
+    "entity_first": ("Condition 4: Entity-First RelSplit (Shared Entity Pass)", "EntityFirst"),
+    "relation_split_routed": ("Condition 5: RelSplit with Type-Aware Routing", "RelSplitRouted"),
+}
+DEFAULT_CONDITIONS = ["baseline", "relation_split"]
+
+# Distinguishes CALL_LOG records of repeated run_condition calls
+_condition_runs = count()
+
+
+def _extract(doc, few_shot, client, schema_info, extraction_fn, constraint_table,
+             chunk_chars=0):
+    """Run one extraction function on a single doc. Returns (entities, triples, stats)."""
+    if extraction_fn == "baseline" and chunk_chars > 0:
+        return run_baseline_chunked(doc, few_shot, client, schema_info, max_chars=chunk_chars)
+    elif extraction_fn == "baseline":
+        entities, triples = run_baseline(doc, few_shot, client, schema_info)
+        return entities, triples, {}
+    elif extraction_fn == "relation_split":
+        return run_relation_split(doc, few_shot, client, schema_info, constraint_table)
+    elif extraction_fn == "relation_split_routed":
+        return run_relation_split(
+            doc, few_shot, client, schema_info, constraint_table, route=True
+        )
+    elif extraction_fn == "proposed":
+        return run_proposed(doc, few_shot, client, schema_info, constraint_table)
+    elif extraction_fn == "entity_first":
+        return run_entity_first(doc, few_shot, client, schema_info, constraint_table)
+    raise ValueError(f"Unknown extraction_fn: {extraction_fn}")
+
+
+async def _extract_async(doc, few_shot, client, schema_info, extraction_fn, constraint_table,
+                         chunk_chars=0):
+    """Async counterpart of _extract."""
+    if extraction_fn == "baseline" and chunk_chars > 0:
+        return await run_baseline_chunked_async(
+            doc, few_shot, client, schema_info, max_chars=chunk_chars
+        )
+    elif extraction_fn == "baseline":
+        entities, triples = await run_baseline_async(doc, few_shot, client, schema_info)
+        return entities, triples, {}
+    elif extraction_fn == "relation_split":
+        return await run_relation_split_async(
+            doc, few_shot, client, schema_info, constraint_table
+        )
+    elif extraction_fn == "relation_split_routed":
+        return await run_relation_split_async(
+            doc, few_shot, client, schema_info, constraint_table, route=True
+        )
+    elif extraction_fn == "proposed":
+        return await asyncio.to_thread(
+            run_proposed, doc, few_shot, client, schema_info, constraint_table
+        )
+    elif extraction_fn == "entity_first":
+        return await run_entity_first_async(
+            doc, few_shot, client, schema_info, constraint_table
+        )
+    raise ValueError(f"Unknown extraction_fn: {extraction_fn}")
+
+
+def _score_doc(i, num_docs, doc, entities, triples, stats, engine):
+    """Align and score one doc's predictions, print a summary line, return doc result."""
+    title = doc["title"]
+    alignment = align_entities(entities, doc["vertexSet"])
+    doc_idx = engine.add_document(triples, doc.get("labels", []), alignment)
+    metrics = engine.doc_metrics(doc_idx, include_details=True)
+
+    print(
+        f"  [{i+1}/{num_docs}] {title}: "
+        f"P={metrics['precision']:.2f} R={metrics['recall']:.2f} F1={metrics['f1']:.2f} "
+        f"(TP={metrics['tp']} FP={metrics['fp']} FN={metrics['fn']})"
+    )
+
+    doc_result = {
+        "title": title,
+        "num_gold_entities": len(doc["vertexSet"]),
+        "num_gold_labels": len(doc.get("labels", [])),
+        "num_predicted": len(triples),
+        "num_entities_aligned": len(alignment),
+        **metrics,
+    }
+    if stats:
+        doc_result["stats"] = stats
+    return doc_result
+
+
+async def _run_docs_async(docs, few_shot, client, schema_info, extraction_fn,
+                          constraint_table, concurrency, finish, chunk_chars=0):
+    """Process docs concurrently (at most `concurrency` in flight); finish(i, ...) each."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def process(i, doc):
+        async with semaphore:
+            with call_tags(doc=doc["title"]):
+                entities, triples, stats = await _extract_async(
+                    doc, few_shot, client, schema_info, extraction_fn, constraint_table,
+                    chunk_chars,
+                )
+        finish(i, entities, triples, stats)
+
+    await asyncio.gather(*(process(i, doc) for i, doc in enumerate(docs)))
+
+
+def _extract_pack(pack_docs, few_shot, client, schema_info, chunk_chars=0):
+    """Baseline extraction for one pack. Returns (entities, triples, stats) per doc."""
+    titles = tuple(doc["title"] for doc in pack_docs)
+    if len(pack_docs) == 1:
+        with call_tags(doc=titles[0]):
+            return [_extract(pack_docs[0], few_shot, client, schema_info, "baseline", None,
+                             chunk_chars)]
+    with call_tags(doc=titles):
+        packed = run_baseline_packed(pack_docs, few_shot, client, schema_info)
+    return [(entities, triples, {"pack_size": len(pack_docs)}) for entities, triples in packed]
+
+
+async def _extract_pack_async(pack_docs, few_shot, client, schema_info, chunk_chars=0):
+    """Async counterpart of _extract_pack."""
+    titles = tuple(doc["title"] for doc in pack_docs)
+    if len(pack_docs) == 1:
+        with call_tags(doc=titles[0]):
+            return [await _extract_async(pack_docs[0], few_shot, client, schema_info,
+                                         "baseline", None, chunk_chars)]
+    with call_tags(doc=titles):
+        packed = await run_baseline_packed_async(pack_docs, few_shot, client, schema_info)
+    return [(entities, triples, {"pack_size": len(pack_docs)}) for entities, triples in packed]
+
+
+async def _run_packs_async(packs, docs, few_shot, client, schema_info, concurrency,
+                           chunk_chars, finish):
+    """Run packed baseline calls concurrently (at most `concurrency` in flight)."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def process(pack):
+        async with semaphore:
+            results = await _extract_pack_async(
+                [docs[i] for i in pack], few_shot, client, schema_info, chunk_chars
+            )
+        for i, result in zip(pack, results):
+            finish(i, *result)
+
+    await asyncio.gather(*(process(pack) for pack in packs))
 
 
-def run_condition(name, docs, few_shot, client, schema_info, extraction_fn, constraint_table=None):
+def _extract_packed(docs, few_shot, client, schema_info, pack_chars, concurrency=1,
+                    chunk_chars=0, finish=None):
+    """Baseline extraction with short docs packed into shared calls.
+
+    Docs left alone in a pack go through _extract, so long ones are still
+    chunked when chunk_chars is set. finish(i, entities, triples, stats) is
+    called for every doc as soon as its pack completes.
+    """
+    packs = pack_documents(docs, max_chars=pack_chars)
+    print(f"  Packed {len(docs)} docs into {len(packs)} calls")
+    finish = finish or (lambda i, entities, triples, stats: None)
+    if concurrency > 1:
+        asyncio.run(_run_packs_async(
+            packs, docs, few_shot, client, schema_info, concurrency, chunk_chars, finish
+        ))
+        return
+    for pack in packs:
+        results = _extract_pack(
+            [docs[i] for i in pack], few_shot, client, schema_info, chunk_chars
+        )
+        for i, result in zip(pack, results):
+            finish(i, *result)
+
+
+def _run_docs(docs, few_shot, client, schema_info, extraction_fn, constraint_table,
+              concurrency, pack_chars, chunk_chars, engine, on_result=None, kg_store=None):
+    """Extract and score every doc for one condition. Returns per-doc results in input order.
+
+    on_result(doc_result) is called as each doc is scored. With a kg_store,
+    each doc's entities and triples are upserted into it as they arrive.
+    """
+    per_doc_results = [None] * len(docs)
+
+    def finish(i, entities, triples, stats):
+        if kg_store is not None:
+            kg_store.add_document(
+                docs[i]["title"], extraction_fn, entities, triples, current_model()
+            )
+        doc_result = _score_doc(i, len(docs), docs[i], entities, triples, stats, engine)
+        if on_result is not None:
+            on_result(doc_result)
+        per_doc_results[i] = doc_result
+
+    if extraction_fn == "baseline" and pack_chars > 0:
+        _extract_packed(
+            docs, few_shot, client, schema_info, pack_chars, concurrency, chunk_chars, finish
+        )
+    elif concurrency > 1:
+        asyncio.run(_run_docs_async(
+            docs, few_shot, client, schema_info, extraction_fn,
+            constraint_table, concurrency, finish, chunk_chars,
+        ))
+    else:
+        for i, doc in enumerate(docs):
+            with call_tags(doc=doc["title"]):
+                entities, triples, stats = _extract(
+                    doc, few_shot, client, schema_info, extraction_fn, constraint_table,
+                    chunk_chars,
+                )
+            finish(i, entities, triples, stats)
+
+    return per_doc_results
+
+
+def _usage_block(records, tp, price_input=None, price_output=None):
+    """summarize_calls() plus tokens per true positive."""
+    usage = summarize_calls(records, price_input, price_output)
+    usage["tokens_per_tp"] = usage["total_tokens"] / tp if tp else None
+    return usage
+
+
+def _print_aggregate(agg):
+    usage = agg["usage"]
+    print(
+        f"  Aggregate: P={agg['precision']:.2f} R={agg['recall']:.2f} F1={agg['f1']:.2f} "
+        f"(TP={agg['tp']} FP={agg['fp']} FN={agg['fn']})"
+    )
+    print(
+        f"  Usage: {usage['calls']} calls, {usage['total_tokens']} tokens, "
+        f"p50={usage['latency_sec_p50'] or 0:.2f}s p95={usage['latency_sec_p95'] or 0:.2f}s"
+    )
+
+
+def run_condition(name, docs, few_shot, client, schema_info, extraction_fn,
+                  constraint_table=None, concurrency=1, pack_chars=0, chunk_chars=0,
+                  price_input=None, price_output=None, checkpoint=None, kg_store=None):
     """Run one experimental condition on all docs.
 
     Args:
@@ -27,62 +303,259 @@ def run_condition(name, docs, few_shot, client, schema_info, extraction_fn, cons
         few_shot: Few-shot example document.
         client: Gemini client.
         schema_info: Schema metadata dict.
-        extraction_fn: Either "baseline" or "relation_split".
-        constraint_table: Domain/range constraint table (required for relation_split).
+        extraction_fn: One of the CONDITIONS keys ("baseline", "relation_split", "proposed",
+            "entity_first", "relation_split_routed").
+        constraint_table: Domain/range constraint table (required for all but baseline).
+        concurrency: Number of docs processed at once. 1 runs the serial path;
+            larger values use the async path. Per-doc results keep input order.
+        pack_chars: If > 0, baseline packs consecutive docs into one call
+            while their combined text stays within this many characters.
+        chunk_chars: If > 0, baseline splits docs longer than this many
+            characters into overlapping sentence windows extracted concurrently.
+        price_input, price_output: USD per 1M input/output tokens; when both
+            are given, the usage blocks include cost_usd.
+        checkpoint: Optional Checkpoint. Each finished doc is appended to it,
+            docs it already holds for this condition are skipped, and the
+            aggregate is rebuilt from its contents.
+        kg_store: Optional KGStore the extracted entities and triples of
+            every doc are upserted into (provenance: doc, condition, model).
+
+    Each per-doc result and the aggregate carry a "usage" block (tokens,
+    latency p50/p95, retries, cost) built from the CALL_LOG records of
+    this run, which are removed from CALL_LOG when it finishes.
     """
     print(f"\n--- {name} ---")
-    per_doc_results = []
+    engine = ScoringEngine()
+    run_id = next(_condition_runs)
 
-    for i, doc in enumerate(docs):
-        title = doc["title"]
+    done = checkpoint.completed(extraction_fn) if checkpoint is not None else {}
+    todo = [doc for doc in docs if doc["title"] not in done]
+    if done:
+        print(f"  Resuming: {len(docs) - len(todo)}/{len(docs)} docs already in checkpoint")
 
-        if extraction_fn == "baseline":
-            entities, triples = run_baseline(doc, few_shot, client, schema_info)
-            stats = {}
-        elif extraction_fn == "relation_split":
-            entities, triples, stats = run_relation_split(
-                doc, few_shot, client, schema_info, constraint_table
-            )
-        else:
-            raise ValueError(f"Unknown extraction_fn: {extraction_fn}")
+    def on_result(doc_result):
+        calls = CALL_LOG.doc_records(doc_result["title"], condition_run=run_id)
+        doc_result["usage"] = summarize_calls(calls, price_input, price_output)
+        if checkpoint is not None:
+            checkpoint.append(extraction_fn, doc_result, calls)
 
-        alignment = align_entities(entities, doc["vertexSet"])
-        metrics = evaluate_relations(triples, doc.get("labels", []), alignment)
+    with call_tags(condition=extraction_fn, condition_run=run_id):
+        new_results = _run_docs(
+            todo, few_shot, client, schema_info, extraction_fn, constraint_table,
+            concurrency, pack_chars, chunk_chars, engine, on_result, kg_store,
+        )
 
-        print(
-            f"  [{i+1}/{len(docs)}] {title}: "
-            f"P={metrics['precision']:.2f} R={metrics['recall']:.2f} F1={metrics['f1']:.2f} "
-            f"(TP={metrics['tp']} FP={metrics['fp']} FN={metrics['fn']})"
+    # This run's records are summarized below; dropping them keeps CALL_LOG from
+    # growing across conditions (concurrent runs only touch their own run_id)
+    run_records = CALL_LOG.pop(condition_run=run_id)
+    if checkpoint is not None:
+        by_title = {**done, **{r["title"]: r for r in new_results}}
+        per_doc_results = [by_title[doc["title"]] for doc in docs]
+        agg = aggregate_scores(per_doc_results)
+        records = checkpoint.calls(extraction_fn)
+    else:
+        per_doc_results = new_results
+        agg = engine.score()
+        del agg["per_doc"]
+        records = run_records
+    agg["usage"] = _usage_block(records, agg["tp"], price_input, price_output)
+    _print_aggregate(agg)
+    return {"per_doc": per_doc_results, "aggregate": agg}
+
+
+def finalize_from_checkpoint(checkpoint, price_input=None, price_output=None):
+    """Rebuild run_condition-style results for every condition in a checkpoint.
+
+    Per-doc results follow the doc order recorded in the checkpoint config.
+    """
+    order = {title: i for i, title in enumerate(checkpoint.config.get("docs", []))}
+    condition_results = {}
+    for extraction_fn in checkpoint.conditions():
+        per_doc_results = sorted(
+            checkpoint.completed(extraction_fn).values(),
+            key=lambda r: order.get(r["title"], len(order)),
+        )
+        agg = aggregate_scores(per_doc_results)
+        agg["usage"] = _usage_block(
+            checkpoint.calls(extraction_fn), agg["tp"], price_input, price_output
         )
+        print(f"\n--- {CONDITIONS[extraction_fn][0]} ({len(per_doc_results)} docs) ---")
+        _print_aggregate(agg)
+        condition_results[extraction_fn] = {"per_doc": per_doc_results, "aggregate": agg}
+    return condition_results
 
-        doc_result = {
-            "title": title,
-            "num_gold_entities": len(doc["vertexSet"]),
-            "num_gold_labels": len(doc.get("labels", [])),
-            "num_predicted": len(triples),
-            "num_entities_aligned": len(alignment),
-            **metrics,
-        }
-        if stats:
-            doc_result["stats"] = stats
-        per_doc_results.append(doc_result)
 
-    agg = aggregate_results(per_doc_results)
-    print(
-        f"  Aggregate: P={agg['precision']:.2f} R={agg['recall']:.2f} F1={agg['f1']:.2f} "
-        f"(TP={agg['tp']} FP={agg['fp']} FN={agg['fn']})"
+def emit_batch_round(docs, few_shot, client, schema_info, conditions, constraint_table,
+                     pack_chars=0, chunk_chars=0):
+    """Run every condition against a BatchClient without scoring, collecting pending requests."""
+    for extraction_fn in conditions:
+        if extraction_fn == "baseline" and pack_chars > 0:
+            _extract_packed(docs, few_shot, client, schema_info, pack_chars,
+                            chunk_chars=chunk_chars)
+            continue
+        for doc in docs:
+            _extract(doc, few_shot, client, schema_info, extraction_fn, constraint_table,
+                     chunk_chars)
+    return len(client.pending)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--conditions", nargs="+", choices=list(CONDITIONS), default=DEFAULT_CONDITIONS,
+        help="Conditions to run (default: %(default)s)",
     )
-    return {"per_doc": per_doc_results, "aggregate": agg}
+    parser.add_argument(
+        "--concurrency", type=int, default=CONCURRENCY,
+        help="Number of documents processed concurrently (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--cache-path", default=CACHE_PATH,
+        help="SQLite file for the LLM response cache (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--cache-max-mb", type=int, default=CACHE_MAX_MB,
+        help="Cache size cap in MB; least recently used entries are evicted (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--no-cache", action="store_true",
+        help="Bypass the response cache entirely",
+    )
+    parser.add_argument(
+        "--refresh-cache", action="store_true",
+        help="Ignore cached responses but overwrite them with fresh ones",
+    )
+    parser.add_argument(
+        "--rpm", type=int, default=None,
+        help="Requests-per-minute quota for the model (default: unlimited)",
+    )
+    parser.add_argument(
+        "--tpm", type=int, default=None,
+        help="Tokens-per-minute quota for the model (default: unlimited)",
+    )
+    parser.add_argument(
+        "--pack-chars", type=int, default=0,
+        help="Baseline: pack consecutive short docs into one call up to this many "
+             "characters of document text (default: 0 = one call per doc)",
+    )
+    parser.add_argument(
+        "--chunk-chars", type=int, default=0,
+        help="Baseline: extract docs longer than this many characters as overlapping "
+             "sentence windows in parallel (default: 0 = whole doc per call)",
+    )
+    parser.add_argument(
+        "--price-input", type=float, default=None,
+        help="USD per 1M input tokens, for cost_usd in the usage blocks",
+    )
+    parser.add_argument(
+        "--price-output", type=float, default=None,
+        help="USD per 1M output (incl. thinking) tokens, for cost_usd in the usage blocks",
+    )
+    parser.add_argument(
+        "--context-cache", action="store_true",
+        help="Upload the shared system prompt + few-shot prefix once as a cached context",
+    )
+    parser.add_argument(
+        "--checkpoint", metavar="PATH", default=CHECKPOINT_PATH,
+        help="JSONL file each finished doc is appended to; an existing one is only "
+             "continued with --resume or replaced with --overwrite-checkpoint "
+             "(default: %(default)s)",
+    )
+    parser.add_argument(
+        "--resume", action="store_true",
+        help="Skip (condition, doc) pairs already in the checkpoint",
+    )
+    parser.add_argument(
+        "--overwrite-checkpoint", action="store_true",
+        help="Start the checkpoint afresh even if it holds a previous run's results",
+    )
+    parser.add_argument(
+        "--finalize", action="store_true",
+        help="Only rebuild results.json from the checkpoint, without running anything",
+    )
+    parser.add_argument(
+        "--kg-store", metavar="PATH", default=None,
+        help="Upsert every doc's extracted entities and triples into this SQLite KG store",
+    )
+    parser.add_argument(
+        "--record", metavar="PATH", default=None,
+        help="Append every live response to this recording (JSONL) for later --replay; "
+             "cached responses are refreshed so that every request is recorded",
+    )
+    parser.add_argument(
+        "--replay", metavar="PATH", nargs="+", default=None,
+        help="Run offline: answer every request from these recordings (no API key needed)",
+    )
+    parser.add_argument(
+        "--replay-latency", type=parse_latency, default=None,
+        help="With --replay: seconds to sleep per call, or 'recorded' to reproduce "
+             "each response's recorded latency (default: no delay)",
+    )
+    parser.add_argument(
+        "--batch-requests", metavar="PATH", default=None,
+        help="Batch mode: write requests still lacking a response to this JSONL file",
+    )
+    parser.add_argument(
+        "--batch-results", metavar="PATH", nargs="*", default=None,
+        help="Batch mode: ingest these batch result JSONL files (all rounds so far)",
+    )
+    return parser.parse_args()
+
+
+def _print_comparison(condition_results):
+    print("\n=== Comparison ===")
+    print(f"{'':>14} {'Precision':>10} {'Recall':>8} {'F1':>6} {'TP':>5} {'FP':>5} {'FN':>5}")
+    for extraction_fn, results in condition_results.items():
+        a = results["aggregate"]
+        label = CONDITIONS[extraction_fn][1]
+        print(f"{label:>14} {a['precision']:>10.2f} {a['recall']:>8.2f} {a['f1']:>6.2f} {a['tp']:>5} {a['fp']:>5} {a['fn']:>5}")
+
+
+def _save_results(output):
+    output_path = os.path.join(os.path.dirname(__file__), "results.json")
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(output, f, ensure_ascii=False, indent=2, default=str)
+    print(f"\nResults saved to {output_path}")
+    paths = write_results_stream(output, os.path.splitext(output_path)[0])
+    print(f"Streaming results: {paths['docs']}, {paths['summary']}")
+
+
+def finalize(args):
+    """Rebuild results.json from the checkpoint alone (e.g. after an interrupted run)."""
+    checkpoint = Checkpoint.load(args.checkpoint)
+    print(f"=== Finalizing from {args.checkpoint} ===")
+    condition_results = finalize_from_checkpoint(
+        checkpoint, args.price_input, args.price_output
+    )
+    _print_comparison(condition_results)
+    config = checkpoint.config
+    _save_results({
+        "experiment": {
+            "model": config["model"],
+            "num_docs": len(config["docs"]),
+            "few_shot_doc": config["few_shot_doc"],
+            "pack_chars": config["pack_chars"],
+            "chunk_chars": config["chunk_chars"],
+            "timestamp": datetime.now().isoformat(),
+            "finalized_from": args.checkpoint,
+        },
+        "conditions": condition_results,
+    })
 
 
 def main():
+    args = parse_args()
+    if args.finalize:
+        finalize(args)
+        return
+
     print("=== JacRED KG Extraction Experiment ===")
     print(f"Model: gemini-3-flash-preview")
     print(f"Timestamp: {datetime.now().isoformat()}")
 
     # Load data
     print("\nLoading data...")
-    data = load_jacred()
+    data = load_jacred(JACRED_PATH, lazy=True)
     dev_docs = select_dev_docs(data["dev"], n=NUM_DOCS)
     few_shot = select_few_shot(data["train"])
 
@@ -93,39 +566,100 @@ def main():
         n_rels = len(doc.get("labels", []))
         print(f"  - {doc['title']} (ents={n_ents}, rels={n_rels})")
 
-    # Initialize LLM
-    api_key = load_api_key(ENV_PATH)
-    client = create_client(api_key)
-
     schema_info = {
         "rel_info": data["rel_info"],
         "ent2id": data["ent2id"],
         "rel2id": data["rel2id"],
     }
 
-    # Build constraint table from training data
-    constraint_table = build_constraint_table(data["train"])
+    # Constraint index from training data (rebuilt only when train.json changes)
+    constraint_table = load_or_build_constraint_index(
+        data["train"], data["rel2id"], data["ent2id"],
+        path=os.path.join(JACRED_PATH, ".snapshot", "constraint_index.json"),
+        fingerprint=source_fingerprint(os.path.join(JACRED_PATH, "train.json")),
+    )
+
+    # Initialize LLM
+    cache = None
+    context_cache = None
+    batch_mode = args.batch_requests is not None or args.batch_results is not None
+    if batch_mode:
+        # Placeholder responses must never reach the response cache
+        configure_cache(None)
+        client = BatchClient(load_batch_results(args.batch_results or []))
+        pending = emit_batch_round(
+            dev_docs, few_shot, client, schema_info, args.conditions, constraint_table,
+            pack_chars=args.pack_chars, chunk_chars=args.chunk_chars,
+        )
+        if pending:
+            requests_path = args.batch_requests or BATCH_REQUESTS_PATH
+            client.write_pending(requests_path)
+            print(f"\nBatch mode: {pending} requests pending "
+                  f"({len(client.results)} responses ingested) -> {requests_path}")
+            print("Submit it as a batch job, then re-run with its results added to --batch-results.")
+            return
+        print(f"\nBatch mode: all {len(client.results)} responses available, scoring.")
+    else:
+        api_key = None if args.replay else load_api_key(ENV_PATH)
+        client = create_client(
+            api_key, record_path=args.record, replay_paths=args.replay,
+            replay_latency=args.replay_latency,
+        )
+        if args.replay:
+            # Every call should reach the replay backend (and its simulated latency)
+            configure_cache(None)
+        elif not args.no_cache:
+            cache = configure_cache(
+                args.cache_path, args.cache_max_mb * 1024 * 1024,
+                refresh=args.refresh_cache or args.record is not None,
+            )
+        if args.rpm or args.tpm:
+            configure_rate_limits(args.rpm, args.tpm)
+        if args.context_cache:
+            context_cache = configure_context_cache()
+            if args.replay:
+                # Emulate cached contents locally; the expanded requests match the recording
+                client = LocalCachedContentClient(client)
+
+    # Every finished doc is appended here, so an interrupted run can --resume
+    try:
+        checkpoint = Checkpoint(args.checkpoint, {
+            "model": MODEL,
+            "few_shot_doc": few_shot["title"],
+            "pack_chars": args.pack_chars,
+            "chunk_chars": args.chunk_chars,
+            "docs": [doc["title"] for doc in dev_docs],
+        }, resume=args.resume, overwrite=args.overwrite_checkpoint)
+    except FileExistsError as e:
+        sys.exit(f"{e}; pass --resume to continue it or --overwrite-checkpoint to start over")
+
+    kg_store = KGStore(args.kg_store) if args.kg_store else None
 
     # Run conditions
-    baseline_results = run_condition(
-        "Condition 1: Baseline (One-shot)",
-        dev_docs, few_shot, client, schema_info,
-        extraction_fn="baseline",
-    )
-    relsplit_results = run_condition(
-        "Condition 2: RelSplit (Multi-Pass)",
-        dev_docs, few_shot, client, schema_info,
-        extraction_fn="relation_split",
-        constraint_table=constraint_table,
-    )
+    condition_results = {}
+    try:
+        for extraction_fn in args.conditions:
+            condition_results[extraction_fn] = run_condition(
+                CONDITIONS[extraction_fn][0],
+                dev_docs, few_shot, client, schema_info,
+                extraction_fn=extraction_fn,
+                constraint_table=constraint_table,
+                concurrency=args.concurrency,
+                pack_chars=args.pack_chars,
+                chunk_chars=args.chunk_chars,
+                price_input=args.price_input,
+                price_output=args.price_output,
+                checkpoint=checkpoint,
+                kg_store=kg_store,
+            )
+    finally:
+        if context_cache is not None:
+            context_cache.clear(client)
+        if kg_store is not None:
+            print(f"\nKG store {kg_store.path}: {kg_store.counts()}")
+            kg_store.close()
 
-    # Comparison
-    b = baseline_results["aggregate"]
-    r = relsplit_results["aggregate"]
-    print("\n=== Comparison ===")
-    print(f"{'':>14} {'Precision':>10} {'Recall':>8} {'F1':>6} {'TP':>5} {'FP':>5} {'FN':>5}")
-    print(f"{'Baseline':>14} {b['precision']:>10.2f} {b['recall']:>8.2f} {b['f1']:>6.2f} {b['tp']:>5} {b['fp']:>5} {b['fn']:>5}")
-    print(f"{'RelSplit':>14} {r['precision']:>10.2f} {r['recall']:>8.2f} {r['f1']:>6.2f} {r['tp']:>5} {r['fp']:>5} {r['fn']:>5}")
+    _print_comparison(condition_results)
 
     # Save results
     output = {
@@ -133,18 +667,40 @@ def main():
             "model": "gemini-3-flash-preview",
             "num_docs": NUM_DOCS,
             "few_shot_doc": few_shot["title"],
+            "pack_chars": args.pack_chars,
+            "chunk_chars": args.chunk_chars,
             "timestamp": datetime.now().isoformat(),
         },
-        "conditions": {
-            "baseline": baseline_results,
-            "relation_split": relsplit_results,
-        },
+        "conditions": condition_results,
     }
 
-    output_path = os.path.join(os.path.dirname(__file__), "results.json")
-    with open(output_path, "w", encoding="utf-8") as f:
-        json.dump(output, f, ensure_ascii=False, indent=2, default=str)
-    print(f"\nResults saved to {output_path}")
+    if cache is not None:
+        cache_stats = cache.stats()
+        print(f"\nLLM cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses "
+              f"({cache_stats['entries']} entries, {cache_stats['bytes'] / 1e6:.1f} MB)")
+        output["experiment"]["llm_cache"] = cache_stats
+
+    if context_cache is not None:
+        context_stats = context_cache.stats()
+        print(f"\nContext cache: {context_stats['cached_calls']} cached calls, "
+              f"{context_stats['cached_token_ratio']:.0%} of input tokens served from cache")
+        output["experiment"]["context_cache"] = context_stats
+
+    if args.replay:
+        replay = client.inner if isinstance(client, LocalCachedContentClient) else client
+        print(f"\nReplay: {replay.served} responses served, {replay.misses} missing")
+        output["experiment"]["replay"] = {
+            "recordings": args.replay,
+            "latency": args.replay_latency,
+            "served": replay.served,
+            "misses": replay.misses,
+        }
+
+    utilization = SCHEDULER.utilization()
+    if utilization:
+        output["experiment"]["rate_limits"] = utilization
+
+    _save_results(output)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,366 @@
+"""Config-matrix ablation runner: many (model, thinking budget, temperature, condition) configs in one process.
+
+    python run_matrix.py                                   # README 6.4: 5 model configs x baseline/relation_split
+    python run_matrix.py --config gemini-2.0-flash:none:-:baseline gemini-2.5-flash:0:0.0:relation_split
+    python run_matrix.py --configs matrix.json --per-model 2 --concurrency 4 --rpm 1000
+
+A config is MODEL:THINKING_BUDGET:TEMPERATURE:CONDITION, where a thinking
+budget of "none" sends no thinking config (models without thinking) and a
+temperature of "-" keeps each call's own temperature. A --configs file is a
+JSON list of {"model", "thinking_budget", "temperature", "condition"}
+objects ("label" optional).
+
+JacRED, the dev docs, the few-shot example, its prompts and the constraint
+table are loaded once; all configs share one client, response cache and
+rate-limit scheduler. Configs run concurrently, at most --per-model at a
+time for each model, each with llm_client.model_settings() applied to
+every call it makes. The results of all configs go to one results file
+whose conditions are keyed by config label, so compare_results.py reads it
+as a single run.
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from data_loader import load_jacred, select_dev_docs, select_few_shot, source_fingerprint
+from constraint_index import load_or_build_constraint_index
+from call_accounting import call_tags
+from checkpoint import Checkpoint, has_results
+from extraction import _assembler
+from llm_client import (
+    SCHEDULER,
+    configure_cache,
+    configure_rate_limits,
+    create_client,
+    load_api_key,
+    model_settings,
+)
+from replay_backend import parse_latency
+from results_io import write_results_stream
+from run_experiment import (
+    CACHE_MAX_MB,
+    CACHE_PATH,
+    CONCURRENCY,
+    CONDITIONS,
+    DEFAULT_CONDITIONS,
+    ENV_PATH,
+    JACRED_PATH,
+    NUM_DOCS,
+    run_condition,
+)
+
+RESULTS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results_matrix.json")
+CHECKPOINT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "matrix_run")
+
+# The five model configurations of README 6.4
+DEFAULT_SETTINGS = [
+    ("gemini-3-flash-preview", 2048),
+    ("gemini-3-flash-preview", 0),
+    ("gemini-2.5-flash", 2048),
+    ("gemini-2.5-flash", 0),
+    ("gemini-2.0-flash", None),
+]
+
+
+def config_label(config: dict) -> str:
+    """e.g. "gemini-2.5-flash/t=0/relation_split" (plus "/T=0.0" with a temperature override)."""
+    budget = config["thinking_budget"]
+    label = f"{config['model']}/t={'none' if budget is None else budget}"
+    if config["temperature"] is not None:
+        label += f"/T={config['temperature']}"
+    return f"{label}/{config['condition']}"
+
+
+def make_config(model, thinking_budget=None, temperature=None, condition="baseline",
+                label=None) -> dict:
+    """A validated config dict with its label."""
+    if condition not in CONDITIONS:
+        raise ValueError(f"Unknown condition {condition!r} (choose from {list(CONDITIONS)})")
+    config = {
+        "model": model,
+        "thinking_budget": None if thinking_budget is None else int(thinking_budget),
+        "temperature": None if temperature is None else float(temperature),
+        "condition": condition,
+    }
+    config["label"] = label or config_label(config)
+    return config
+
+
+def parse_config(spec: str) -> dict:
+    """MODEL:THINKING_BUDGET:TEMPERATURE:CONDITION -> config dict."""
+    parts = spec.split(":")
+    if len(parts) != 4:
+        raise argparse.ArgumentTypeError(
+            f"{spec!r}: expected MODEL:THINKING_BUDGET:TEMPERATURE:CONDITION"
+        )
+    model, budget, temperature, condition = parts
+    try:
+        return make_config(
+            model,
+            None if budget.lower() == "none" else budget,
+            None if temperature == "-" else temperature,
+            condition,
+        )
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def load_configs(path: str) -> list[dict]:
+    with open(path, encoding="utf-8") as f:
+        return [make_config(**entry) for entry in json.load(f)]
+
+
+def default_configs(conditions=DEFAULT_CONDITIONS) -> list[dict]:
+    return [
+        make_config(model, budget, None, condition)
+        for model, budget in DEFAULT_SETTINGS
+        for condition in conditions
+    ]
+
+
+def _checkpoint_path(checkpoint_dir: str, label: str) -> str:
+    return os.path.join(checkpoint_dir, re.sub(r"[^\w.=-]+", "_", label) + ".jsonl")
+
+
+def run_config(config, docs, few_shot, client, schema_info, constraint_table,
+               gate, concurrency=1, checkpoint=None, price_input=None, price_output=None):
+    """Run one config's condition under its model settings, once gate (the model's slot) is free."""
+    settings = {"model": config["model"], "thinking_budget": config["thinking_budget"]}
+    if config["temperature"] is not None:
+        settings["temperature"] = config["temperature"]
+    with gate, model_settings(**settings), call_tags(config=config["label"]):
+        results = run_condition(
+            f"{config['label']} ({CONDITIONS[config['condition']][0]})",
+            docs, few_shot, client, schema_info,
+            extraction_fn=config["condition"],
+            constraint_table=constraint_table,
+            concurrency=concurrency,
+            price_input=price_input,
+            price_output=price_output,
+            checkpoint=checkpoint,
+        )
+    results["config"] = {k: v for k, v in config.items() if k != "label"}
+    return results
+
+
+def run_matrix(configs, docs, few_shot, client, schema_info, constraint_table,
+               per_model=1, concurrency=1, checkpoint_dir=None, resume=False,
+               overwrite=False, price_input=None, price_output=None) -> dict:
+    """Run every config concurrently (at most per_model at a time per model).
+
+    Returns {label: run_condition results + "config"} in config order. With
+    a checkpoint_dir each config appends to its own checkpoint there;
+    checkpoints holding results are only replaced with overwrite=True.
+    """
+    labels = [c["label"] for c in configs]
+    if len(set(labels)) != len(labels):
+        raise ValueError(f"Config labels must be unique: {labels}")
+    gates = {c["model"]: threading.BoundedSemaphore(per_model) for c in configs}
+    # One PromptAssembler (and its memoized prompt parts) serves every config
+    _assembler(few_shot, schema_info)
+
+    checkpoints = {}
+    if checkpoint_dir is not None:
+        os.makedirs(checkpoint_dir, exist_ok=True)
+        paths = {label: _checkpoint_path(checkpoint_dir, label) for label in labels}
+        if not resume and not overwrite:
+            # Checked up front so no config's checkpoint is truncated before one fails
+            existing = [path for path in paths.values() if has_results(path)]
+            if existing:
+                raise FileExistsError(f"Checkpoints already hold results: {existing}")
+        for config in configs:
+            checkpoints[config["label"]] = Checkpoint(
+                paths[config["label"]],
+                {**config, "few_shot_doc": few_shot["title"],
+                 "docs": [doc["title"] for doc in docs]},
+                resume=resume, overwrite=overwrite,
+            )
+
+    with ThreadPoolExecutor(max_workers=len(configs)) as executor:
+        futures = {
+            config["label"]: executor.submit(
+                copy_context().run, run_config, config, docs, few_shot, client,
+                schema_info, constraint_table, gates[config["model"]], concurrency,
+                checkpoints.get(config["label"]), price_input, price_output,
+            )
+            for config in configs
+        }
+        return {label: future.result() for label, future in futures.items()}
+
+
+def print_matrix(results: dict) -> None:
+    """One row per (model, budget, temperature) setting, P/R/F1 per condition and dF1 vs the first."""
+    settings: dict[tuple, dict] = {}
+    conditions: dict[str, None] = {}
+    for results_ in results.values():
+        c = results_["config"]
+        key = (c["model"], c["thinking_budget"], c["temperature"])
+        settings.setdefault(key, {})[c["condition"]] = results_["aggregate"]
+        conditions[c["condition"]] = None
+    conditions = list(conditions)
+
+    print("\n=== Matrix Comparison ===")
+    header = f"{'Model Config':<36}"
+    for condition in conditions:
+        name = CONDITIONS[condition][1]
+        header += f" {name + ' P':>16} {'R':>6} {'F1':>6}"
+    header += "".join(f" {'dF1 ' + CONDITIONS[c][1]:>20}" for c in conditions[1:])
+    print(header)
+    for (model, budget, temperature), aggregates in settings.items():
+        setting = f"{model} t={'none' if budget is None else budget}"
+        if temperature is not None:
+            setting += f" T={temperature}"
+        row = f"{setting:<36}"
+        for condition in conditions:
+            a = aggregates.get(condition)
+            if a is None:
+                row += f" {'-':>16} {'-':>6} {'-':>6}"
+            else:
+                row += f" {a['precision']:>16.3f} {a['recall']:>6.3f} {a['f1']:>6.3f}"
+        reference = aggregates.get(conditions[0])
+        for condition in conditions[1:]:
+            a = aggregates.get(condition)
+            if a is None or reference is None:
+                row += f" {'-':>20}"
+            else:
+                row += f" {a['f1'] - reference['f1']:>+20.3f}"
+        print(row)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--config", nargs="+", type=parse_config, default=None,
+        metavar="MODEL:BUDGET:TEMP:CONDITION", help="Configs to run",
+    )
+    parser.add_argument("--configs", metavar="PATH", default=None,
+                        help="JSON list of configs to run (added after --config)")
+    parser.add_argument(
+        "--conditions", nargs="+", choices=list(CONDITIONS), default=DEFAULT_CONDITIONS,
+        help="Without --config/--configs: conditions crossed with the README 6.4 "
+             "model settings (default: %(default)s)",
+    )
+    parser.add_argument("--per-model", type=int, default=1,
+                        help="Configs run at once per model (default: %(default)s)")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY,
+                        help="Documents processed concurrently per config (default: %(default)s)")
+    parser.add_argument("--rpm", type=int, default=None,
+                        help="Requests-per-minute quota for each model (default: unlimited)")
+    parser.add_argument("--tpm", type=int, default=None,
+                        help="Tokens-per-minute quota for each model (default: unlimited)")
+    parser.add_argument("--cache-path", default=CACHE_PATH,
+                        help="SQLite file for the LLM response cache (default: %(default)s)")
+    parser.add_argument("--no-cache", action="store_true", help="Bypass the response cache")
+    parser.add_argument("--checkpoint-dir", default=None,
+                        help=f"Per-config checkpoints (e.g. {os.path.basename(CHECKPOINT_DIR)}/); "
+                             "existing ones need --resume or --overwrite-checkpoint")
+    parser.add_argument("--resume", action="store_true",
+                        help="Skip docs already in each config's checkpoint")
+    parser.add_argument("--overwrite-checkpoint", action="store_true",
+                        help="Start the checkpoints afresh even if they hold earlier results")
+    parser.add_argument("--price-input", type=float, default=None,
+                        help="USD per 1M input tokens, for cost_usd in the usage blocks")
+    parser.add_argument("--price-output", type=float, default=None,
+                        help="USD per 1M output (incl. thinking) tokens, for cost_usd")
+    parser.add_argument("--replay", metavar="PATH", nargs="+", default=None,
+                        help="Run offline: answer every request from these recordings")
+    parser.add_argument("--replay-latency", type=parse_latency, default=None,
+                        help="With --replay: seconds per call, or 'recorded'")
+    parser.add_argument("--output", default=RESULTS_PATH,
+                        help="Consolidated results file (default: %(default)s)")
+    args = parser.parse_args()
+    if args.resume and args.checkpoint_dir is None:
+        args.checkpoint_dir = CHECKPOINT_DIR
+    return args
+
+
+def main():
+    args = parse_args()
+    configs = list(args.config or [])
+    if args.configs:
+        configs += load_configs(args.configs)
+    if not configs:
+        configs = default_configs(args.conditions)
+
+    print("=== JacRED KG Extraction Config Matrix ===")
+    print(f"Timestamp: {datetime.now().isoformat()}")
+    for config in configs:
+        print(f"  - {config['label']}")
+
+    print("\nLoading data...")
+    data = load_jacred(JACRED_PATH, lazy=True)
+    dev_docs = select_dev_docs(data["dev"], n=NUM_DOCS)
+    few_shot = select_few_shot(data["train"])
+    print(f"Dev docs: {len(dev_docs)}, few-shot: {few_shot['title']}")
+    schema_info = {
+        "rel_info": data["rel_info"],
+        "ent2id": data["ent2id"],
+        "rel2id": data["rel2id"],
+    }
+    constraint_table = load_or_build_constraint_index(
+        data["train"], data["rel2id"], data["ent2id"],
+        path=os.path.join(JACRED_PATH, ".snapshot", "constraint_index.json"),
+        fingerprint=source_fingerprint(os.path.join(JACRED_PATH, "train.json")),
+    )
+
+    api_key = None if args.replay else load_api_key(ENV_PATH)
+    client = create_client(api_key, replay_paths=args.replay, replay_latency=args.replay_latency)
+    cache = None
+    if args.replay or args.no_cache:
+        configure_cache(None)
+    else:
+        cache = configure_cache(args.cache_path, CACHE_MAX_MB * 1024 * 1024)
+    if args.rpm or args.tpm:
+        for model in dict.fromkeys(c["model"] for c in configs):
+            configure_rate_limits(args.rpm, args.tpm, model=model)
+
+    try:
+        results = run_matrix(
+            configs, dev_docs, few_shot, client, schema_info, constraint_table,
+            per_model=args.per_model, concurrency=args.concurrency,
+            checkpoint_dir=args.checkpoint_dir, resume=args.resume,
+            overwrite=args.overwrite_checkpoint,
+            price_input=args.price_input, price_output=args.price_output,
+        )
+    except FileExistsError as e:
+        sys.exit(f"{e}; pass --resume to continue them or --overwrite-checkpoint to start over")
+    print_matrix(results)
+
+    output = {
+        "experiment": {
+            "models": list(dict.fromkeys(c["model"] for c in configs)),
+            "configs": configs,
+            "num_docs": len(dev_docs),
+            "few_shot_doc": few_shot["title"],
+            "per_model": args.per_model,
+            "concurrency": args.concurrency,
+            "timestamp": datetime.now().isoformat(),
+        },
+        "conditions": results,
+    }
+    if cache is not None:
+        output["experiment"]["llm_cache"] = cache.stats()
+    utilization = SCHEDULER.utilization()
+    if utilization:
+        output["experiment"]["rate_limits"] = utilization
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(output, f, ensure_ascii=False, indent=2, default=str)
+    print(f"\nResults saved to {args.output}")
+    paths = write_results_stream(output, os.path.splitext(args.output)[0])
+    print(f"Streaming results: {paths['docs']}, {paths['summary']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -35,6 +35,95 @@ EXTRACTION_SCHEMA = {
     "required": ["entities", "relations"],
 }
 
+# Several documents extracted in one call; each entry carries the doc_id
+# given in the prompt plus the usual entities/relations
+PACKED_EXTRACTION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "documents": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "doc_id": {"type": "string"},
+                    **EXTRACTION_SCHEMA["properties"],
+                },
+                "required": ["doc_id", "entities", "relations"],
+            },
+        },
+    },
+    "required": ["documents"],
+}
+
+# Entity-only pass of entity-first extraction
+ENTITY_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "entities": EXTRACTION_SCHEMA["properties"]["entities"],
+    },
+    "required": ["entities"],
+}
+
+
+def build_relation_schema(
+    relations: list[str],
+    head_ids: list[str],
+    tail_ids: list[str],
+) -> dict:
+    """Relations-only schema over a fixed entity list (entity-first group passes).
+
+    head/tail are enums of the entity ids that may fill each role, so
+    references to unknown entities cannot be generated.
+    """
+    relation_items = EXTRACTION_SCHEMA["properties"]["relations"]["items"]
+    return {
+        "type": "object",
+        "properties": {
+            "relations": {
+                "type": "array",
+                "items": {
+                    **relation_items,
+                    "properties": {
+                        **relation_items["properties"],
+                        "head": {"type": "string", "enum": list(head_ids)},
+                        "relation": {"type": "string", "enum": list(relations)},
+                        "tail": {"type": "string", "enum": list(tail_ids)},
+                    },
+                },
+            },
+        },
+        "required": ["relations"],
+    }
+
+
+def build_group_extraction_schema(relations: list[str]) -> dict:
+    """EXTRACTION_SCHEMA with the relation P-code restricted to an enum.
+
+    Used for relation-group passes, so the model cannot spend output tokens
+    on relations outside the group. Entity types keep the full enum: the
+    document's entities are typed as they are, and relations whose
+    head/tail types the group does not allow are left to the domain/range
+    filter.
+    """
+    relation_items = EXTRACTION_SCHEMA["properties"]["relations"]["items"]
+    return {
+        **EXTRACTION_SCHEMA,
+        "properties": {
+            **EXTRACTION_SCHEMA["properties"],
+            "relations": {
+                "type": "array",
+                "items": {
+                    **relation_items,
+                    "properties": {
+                        **relation_items["properties"],
+                        "relation": {"type": "string", "enum": list(relations)},
+                    },
+                },
+            },
+        },
+    }
+
+
 VERIFICATION_SCHEMA = {
     "type": "object",
     "properties": {
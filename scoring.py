@@ -0,0 +1,215 @@
+"""Corpus-scale P/R/F1 scoring over integer-encoded (doc, head, tail, relation) keys."""
+
+from collections import Counter
+from itertools import compress, repeat
+from operator import and_, not_, rshift
+
+# Key layout: doc << DOC_SHIFT | head << HEAD_SHIFT | tail << TAIL_SHIFT | relation id
+DOC_SHIFT = 40
+HEAD_SHIFT = 28
+TAIL_SHIFT = 16
+VERTEX_MASK = (1 << 12) - 1
+REL_MASK = (1 << 16) - 1
+# Head/tail slot used for predictions whose entities are not aligned to gold
+UNALIGNED = VERTEX_MASK
+
+
+def _check_vertex(idx: int) -> int:
+    # Larger indices would read as UNALIGNED or spill into the neighbouring field
+    if not 0 <= idx < UNALIGNED:
+        raise ValueError(f"Vertex index {idx} does not fit the {UNALIGNED}-vertex key layout")
+    return idx
+
+
+def prf(tp: int, fp: int, fn: int) -> dict:
+    """Precision/recall/F1 dict from raw counts."""
+    precision = tp / (tp + fp) if (tp + fp) > 0 else 0.0
+    recall = tp / (tp + fn) if (tp + fn) > 0 else 0.0
+    f1 = 2 * precision * recall / (precision + recall) if (precision + recall) > 0 else 0.0
+    return {"precision": precision, "recall": recall, "f1": f1, "tp": tp, "fp": fp, "fn": fn}
+
+
+def _macro(rows: list[dict]) -> dict:
+    """Unweighted mean of precision/recall/F1 over rows."""
+    n = len(rows)
+    return {
+        metric: sum(row[metric] for row in rows) / n if n else 0.0
+        for metric in ("precision", "recall", "f1")
+    }
+
+
+def aggregate_scores(per_doc: list[dict]) -> dict:
+    """Combine per-doc results into micro, macro and per-relation scores.
+
+    Only needs each doc's tp/fp/fn and (optionally) its "per_relation"
+    counts, so it also works on results reloaded from disk.
+    """
+    totals = Counter()
+    relation_totals: dict[str, Counter] = {}
+    for d in per_doc:
+        totals.update({"tp": d["tp"], "fp": d["fp"], "fn": d["fn"]})
+        for relation, counts in d.get("per_relation", {}).items():
+            relation_totals.setdefault(relation, Counter()).update(counts)
+
+    per_relation = {
+        relation: prf(c["tp"], c["fp"], c["fn"])
+        for relation, c in sorted(relation_totals.items())
+    }
+    return {
+        **prf(totals["tp"], totals["fp"], totals["fn"]),
+        "macro": _macro(list(per_relation.values())),
+        "doc_macro": _macro([prf(d["tp"], d["fp"], d["fn"]) for d in per_doc]),
+        "per_relation": per_relation,
+    }
+
+
+class ScoringEngine:
+    """Accumulates predictions and gold labels for many docs and scores them in bulk.
+
+    Each (doc, head, tail, relation) is packed into one int, so TP/FP/FN for
+    the whole corpus come from set membership and Counter passes over flat
+    key lists. fp_details/fn_details are only built on request via details().
+    Counting matches evaluate_relations(): every predicted triple counts
+    (duplicates included), unaligned ones are false positives. Vertex
+    indices must be below UNALIGNED (4095) and a doc set may use at most
+    65536 relations; anything larger raises ValueError instead of
+    corrupting keys.
+    """
+
+    def __init__(self):
+        self._rel_ids: dict[str, int] = {}
+        self._relations: list[str] = []
+        self._preds: list[int] = []
+        self._gold: set[int] = set()
+        self._doc_spans: list[tuple[int, int]] = []
+        self._doc_gold: list[list[int]] = []
+        self._doc_triples: list[list] = []
+
+    def _rel_id(self, relation: str) -> int:
+        rel_id = self._rel_ids.get(relation)
+        if rel_id is None:
+            if len(self._relations) > REL_MASK:
+                raise ValueError(f"More than {REL_MASK + 1} relations do not fit the key layout")
+            rel_id = self._rel_ids[relation] = len(self._relations)
+            self._relations.append(relation)
+        return rel_id
+
+    def add_document(
+        self,
+        predicted_triples: list,
+        gold_labels: list[dict],
+        entity_alignment: dict[str, int],
+    ) -> int:
+        """Encode one doc's predictions and gold labels. Returns its doc index."""
+        doc = len(self._doc_spans)
+        base = doc << DOC_SHIFT
+        unaligned = (UNALIGNED << HEAD_SHIFT) | (UNALIGNED << TAIL_SHIFT)
+
+        # Keys are built before any state changes, so a ValueError leaves the engine intact
+        preds = []
+        for triple in predicted_triples:
+            h_idx = entity_alignment.get(triple.head)
+            t_idx = entity_alignment.get(triple.tail)
+            rel_id = self._rel_id(triple.relation)
+            if h_idx is None or t_idx is None:
+                preds.append(base | unaligned | rel_id)
+            else:
+                preds.append(
+                    base | (_check_vertex(h_idx) << HEAD_SHIFT)
+                    | (_check_vertex(t_idx) << TAIL_SHIFT) | rel_id
+                )
+        gold = {
+            base | (_check_vertex(label["h"]) << HEAD_SHIFT)
+            | (_check_vertex(label["t"]) << TAIL_SHIFT) | self._rel_id(label["r"])
+            for label in gold_labels
+        }
+
+        start = len(self._preds)
+        self._preds += preds
+        self._doc_spans.append((start, len(self._preds)))
+        self._gold |= gold
+        self._doc_gold.append(sorted(gold))
+        self._doc_triples.append(predicted_triples)
+        return doc
+
+    def __len__(self) -> int:
+        return len(self._doc_spans)
+
+    def _counts(self, preds: list[int], gold: set[int]):
+        """(tp_keys, fp_keys, fn_keys) for a key list against a gold set."""
+        hits = list(map(gold.__contains__, preds))
+        tp_keys = list(compress(preds, hits))
+        fp_keys = list(compress(preds, map(not_, hits)))
+        fn_keys = gold.difference(preds)
+        return tp_keys, fp_keys, fn_keys
+
+    def _by_doc(self, keys) -> Counter:
+        return Counter(map(rshift, keys, repeat(DOC_SHIFT)))
+
+    def _by_relation(self, keys) -> Counter:
+        return Counter(map(and_, keys, repeat(REL_MASK)))
+
+    def score(self) -> dict:
+        """Micro, macro (over relations and over docs), per-relation and per-doc scores."""
+        tp_keys, fp_keys, fn_keys = self._counts(self._preds, self._gold)
+
+        tp_doc, fp_doc, fn_doc = (self._by_doc(k) for k in (tp_keys, fp_keys, fn_keys))
+        per_doc = [prf(tp_doc[d], fp_doc[d], fn_doc[d]) for d in range(len(self))]
+
+        tp_rel, fp_rel, fn_rel = (self._by_relation(k) for k in (tp_keys, fp_keys, fn_keys))
+        per_relation = {
+            self._relations[r]: prf(tp_rel[r], fp_rel[r], fn_rel[r])
+            for r in sorted(set(tp_rel) | set(fp_rel) | set(fn_rel), key=self._relations.__getitem__)
+        }
+
+        return {
+            **prf(len(tp_keys), len(fp_keys), len(fn_keys)),
+            "macro": _macro(list(per_relation.values())),
+            "doc_macro": _macro(per_doc),
+            "per_relation": per_relation,
+            "per_doc": per_doc,
+        }
+
+    def doc_metrics(self, doc: int, include_details: bool = False) -> dict:
+        """Scores for one doc in evaluate_relations() form, plus per-relation counts."""
+        start, end = self._doc_spans[doc]
+        tp_keys, fp_keys, fn_keys = self._counts(self._preds[start:end], set(self._doc_gold[doc]))
+
+        tp_rel, fp_rel, fn_rel = (self._by_relation(k) for k in (tp_keys, fp_keys, fn_keys))
+        per_relation = {
+            self._relations[r]: {"tp": tp_rel[r], "fp": fp_rel[r], "fn": fn_rel[r]}
+            for r in sorted(set(tp_rel) | set(fp_rel) | set(fn_rel), key=self._relations.__getitem__)
+        }
+
+        metrics = prf(len(tp_keys), len(fp_keys), len(fn_keys))
+        if include_details:
+            metrics.update(self.details(doc))
+        metrics["per_relation"] = per_relation
+        return metrics
+
+    def details(self, doc: int) -> dict:
+        """Build fp_details/fn_details for one doc (same shape as evaluate_relations)."""
+        start, end = self._doc_spans[doc]
+        gold = set(self._doc_gold[doc])
+        fp_details = []
+        for triple, key in zip(self._doc_triples[doc], self._preds[start:end]):
+            if key in gold:
+                continue
+            aligned = (key >> HEAD_SHIFT) & VERTEX_MASK != UNALIGNED
+            fp_details.append({
+                "head": triple.head_name,
+                "relation": triple.relation,
+                "tail": triple.tail_name,
+                "reason": "wrong_relation" if aligned else "entity_not_aligned",
+            })
+        matched = gold.intersection(self._preds[start:end])
+        fn_details = [
+            {
+                "head_idx": (key >> HEAD_SHIFT) & VERTEX_MASK,
+                "tail_idx": (key >> TAIL_SHIFT) & VERTEX_MASK,
+                "relation": self._relations[key & REL_MASK],
+            }
+            for key in self._doc_gold[doc]
+            if key not in matched
+        ]
+        return {"fp_details": fp_details, "fn_details": fn_details}
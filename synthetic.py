@@ -0,0 +1,156 @@
+"""Synthetic JacRED-shaped documents, extraction outputs and triples for benchmarks.
+
+Everything is generated from a seeded random.Random, so a given size and
+seed always yields the same data. Sizes are per document (sentences,
+entities, mentions, gold labels), and synthetic_corpus / inflate_corpus
+scale the number of documents from a handful up to many times full JacRED.
+"""
+
+import random
+
+from extraction import Triple
+from prompts import RELATION_JAPANESE
+
+ENTITY_TYPES = ["PER", "ORG", "LOC", "ART", "DAT", "TIM", "MON", "%", "NUM"]
+RELATIONS = list(RELATION_JAPANESE)
+
+# Characters names are drawn from (kanji, katakana and full-width digits,
+# so NFKC normalization has work to do)
+_NAME_CHARS = "山田川本中村東京大学日本会社花子太郎アイウエオカキクケコサシスセソ０１２３４５６７８９"
+_FILLER_CHARS = "はのがをにでとへもやからまでより、"
+
+
+def _name(rng: random.Random, min_len: int = 2, max_len: int = 6) -> str:
+    return "".join(rng.choice(_NAME_CHARS) for _ in range(rng.randint(min_len, max_len)))
+
+
+def synthetic_document(
+    rng: random.Random,
+    title: str,
+    n_sents: int = 8,
+    n_entities: int = 15,
+    n_labels: int = 12,
+    max_mentions: int = 3,
+    sent_tokens: int = 20,
+) -> dict:
+    """One JacRED-format document (title, sents, vertexSet, labels)."""
+    vertex_set = []
+    for _ in range(n_entities):
+        name = _name(rng)
+        entity_type = rng.choice(ENTITY_TYPES)
+        mentions = []
+        for k in range(rng.randint(1, max_mentions)):
+            # Later mentions are often abbreviations of the first one
+            mention = name if k == 0 or len(name) < 3 else name[:rng.randint(2, len(name))]
+            sent_id = rng.randrange(n_sents)
+            mentions.append({"name": mention, "type": entity_type, "sent_id": sent_id,
+                             "pos": [0, 1]})
+        vertex_set.append(mentions)
+
+    sents = [
+        [rng.choice(_FILLER_CHARS) for _ in range(sent_tokens)] for _ in range(n_sents)
+    ]
+    for mentions in vertex_set:
+        for m in mentions:
+            tokens = sents[m["sent_id"]]
+            pos = rng.randrange(len(tokens) + 1)
+            tokens.insert(pos, m["name"])
+            m["pos"] = [pos, pos + 1]
+
+    labels = []
+    seen = set()
+    for _ in range(n_labels * 2):
+        if len(labels) >= n_labels or n_entities < 2:
+            break
+        h, t = rng.sample(range(n_entities), 2)
+        r = rng.choice(RELATIONS)
+        if (h, t, r) in seen:
+            continue
+        seen.add((h, t, r))
+        labels.append({"h": h, "t": t, "r": r, "evidence": [vertex_set[h][0]["sent_id"]]})
+
+    return {"title": title, "sents": sents, "vertexSet": vertex_set, "labels": labels}
+
+
+def synthetic_corpus(n_docs: int, seed: int = 0, **sizes) -> list[dict]:
+    """n_docs synthetic documents; sizes are passed on to synthetic_document."""
+    rng = random.Random(seed)
+    return [synthetic_document(rng, f"syn{i:07d}", **sizes) for i in range(n_docs)]
+
+
+def inflate_corpus(docs: list[dict], factor: int) -> list[dict]:
+    """Repeat docs factor times under fresh titles (e.g. 100x full JacRED)."""
+    return [
+        {**doc, "title": f"{doc['title']}#{k}"}
+        for k in range(factor) for doc in docs
+    ]
+
+
+def _perturb(rng: random.Random, name: str) -> str:
+    """A predicted surface form: exact, width/case variant, or partial overlap."""
+    roll = rng.random()
+    if roll < 0.6:
+        return name
+    if roll < 0.8:
+        # Half-width digits are NFKC-equal to the full-width originals
+        return name.translate(str.maketrans("０１２３４５６７８９", "0123456789")) + " "
+    if roll < 0.9 and len(name) > 2:
+        return name[:-1]
+    return name + _name(rng, 1, 2)
+
+
+def synthetic_extraction(
+    doc: dict,
+    rng: random.Random,
+    entity_recall: float = 0.8,
+    relation_recall: float = 0.6,
+    spurious: float = 0.3,
+) -> dict:
+    """An EXTRACTION_SCHEMA-shaped LLM result for doc.
+
+    Gold entities and relations are kept with the given recall (names
+    perturbed so every alignment pass is exercised); spurious entities and
+    relations are added in proportion `spurious`.
+    """
+    entities = []
+    gold_to_id = {}
+    for gold_idx, mentions in enumerate(doc["vertexSet"]):
+        if rng.random() < entity_recall:
+            ent_id = f"e{len(entities)}"
+            gold_to_id[gold_idx] = ent_id
+            entities.append({
+                "id": ent_id,
+                "name": _perturb(rng, rng.choice(mentions)["name"]),
+                "type": mentions[0]["type"],
+            })
+    for _ in range(int(len(doc["vertexSet"]) * spurious)):
+        entities.append({
+            "id": f"e{len(entities)}", "name": _name(rng), "type": rng.choice(ENTITY_TYPES),
+        })
+
+    relations = []
+    for label in doc.get("labels", []):
+        head, tail = gold_to_id.get(label["h"]), gold_to_id.get(label["t"])
+        if head is not None and tail is not None and rng.random() < relation_recall:
+            relations.append({"head": head, "relation": label["r"], "tail": tail,
+                              "evidence": "".join(doc["sents"][label["evidence"][0]])})
+    if len(entities) >= 2:
+        for _ in range(int(len(doc.get("labels", [])) * spurious)):
+            head, tail = rng.sample(entities, 2)
+            relations.append({"head": head["id"], "relation": rng.choice(RELATIONS),
+                              "tail": tail["id"], "evidence": ""})
+    return {"entities": entities, "relations": relations}
+
+
+def synthetic_triples(entities: list[dict], n: int, rng: random.Random) -> list[Triple]:
+    """n random triples over the given entities."""
+    triples = []
+    for _ in range(n):
+        head, tail = rng.sample(entities, 2)
+        triples.append(Triple(
+            head=head["id"], head_name=head["name"], head_type=head["type"],
+            relation=rng.choice(RELATIONS),
+            tail=tail["id"], tail_name=tail["name"], tail_type=tail["type"],
+            evidence="",
+        ))
+    return triples
@@ -0,0 +1,122 @@
+"""Cross-pass entity merging compared with the baseline (merge by normalized name)."""
+
+import pytest
+
+pytest.importorskip("google.genai")
+
+from extraction import Triple, _merge_entities_across_passes, _normalize_name
+
+
+def _baseline_merge(all_pass_entities, all_pass_triples):
+    """The original merge: first entity per normalized name wins, triples deduplicated."""
+    norm_to_entity = {}
+    id_remap = {}
+    for pass_idx, entities in enumerate(all_pass_entities):
+        for ent in entities:
+            norm = _normalize_name(ent["name"])
+            if norm not in norm_to_entity:
+                norm_to_entity[norm] = {
+                    "id": f"e{len(norm_to_entity)}", "name": ent["name"], "type": ent["type"],
+                }
+            id_remap[(pass_idx, ent["id"])] = norm_to_entity[norm]["id"]
+    seen = set()
+    triples = []
+    for pass_idx, pass_triples in enumerate(all_pass_triples):
+        for t in pass_triples:
+            key = (id_remap.get((pass_idx, t.head), t.head), t.relation,
+                   id_remap.get((pass_idx, t.tail), t.tail))
+            if key not in seen:
+                seen.add(key)
+                triples.append(key)
+    return list(norm_to_entity.values()), triples
+
+
+def _passes(*passes):
+    """[(head, head_type, relation, tail, tail_type), ...] per pass -> entities, triples."""
+    all_entities, all_triples = [], []
+    for spec in passes:
+        ids = {}
+        entities, triples = [], []
+        for head, head_type, relation, tail, tail_type in spec:
+            for name, ent_type in ((head, head_type), (tail, tail_type)):
+                if (name, ent_type) not in ids:
+                    ids[(name, ent_type)] = f"e{len(ids)}"
+                    entities.append({"id": ids[(name, ent_type)], "name": name, "type": ent_type})
+            triples.append(Triple(
+                ids[(head, head_type)], head, head_type, relation,
+                ids[(tail, tail_type)], tail, tail_type, "",
+            ))
+        all_entities.append(entities)
+        all_triples.append(triples)
+    return all_entities, all_triples
+
+
+def _merge(entities, triples):
+    merged, merged_triples = _merge_entities_across_passes(entities, triples)
+    return merged, [(t.head, t.relation, t.tail) for t in merged_triples]
+
+
+MIXED_TYPE_PASSES = [
+    # Same name, different type in each pass
+    [
+        [("東京", "LOC", "P17", "日本", "LOC")],
+        [("東京", "ORG", "P17", "日本", "LOC")],
+    ],
+    # A type flips between passes and back again
+    [
+        [("ソニー", "ORG", "P17", "日本", "LOC"), ("東京", "LOC", "P131", "日本", "LOC")],
+        [("ソニー", "PER", "P17", "日本", "LOC")],
+        [("ソニー", "ORG", "P159", "東京", "ORG"), ("東京", "LOC", "P17", "日本", "LOC")],
+    ],
+    # Case and width differences only
+    [
+        [("ＡＢＣ", "ORG", "P17", "日本", "LOC")],
+        [("abc", "MISC", "P17", "日本", "LOC")],
+    ],
+]
+
+
+@pytest.mark.parametrize("passes", MIXED_TYPE_PASSES)
+def test_mixed_type_passes_match_baseline(passes):
+    entities, triples = _passes(*passes)
+    assert _merge(entities, triples) == _baseline_merge(entities, triples)
+
+
+def test_input_triples_unchanged():
+    entities, triples = _passes(*MIXED_TYPE_PASSES[1])
+    before = [[(t.head, t.relation, t.tail) for t in pass_triples] for pass_triples in triples]
+    _merge(entities, triples)
+    assert [[(t.head, t.relation, t.tail) for t in pass_triples] for pass_triples in triples] == before
+
+
+def test_reported_mixed_type_example():
+    merged, triples = _merge(*_passes(*MIXED_TYPE_PASSES[0]))
+    assert len(merged) == 2
+    assert triples == [("e0", "P17", "e1")]
+
+
+def test_separator_variants_merge():
+    merged, triples = _merge(*_passes(
+        [("ジョー・ギブス", "PER", "P27", "ジャマイカ", "LOC")],
+        [("ジョー ギブス", "PER", "P27", "ジャマイカ", "LOC")],
+    ))
+    assert [e["name"] for e in merged] == ["ジョー・ギブス", "ジャマイカ"]
+    assert triples == [("e0", "P27", "e1")]
+
+
+def test_qualifier_merges_within_type():
+    merged, _ = _merge(*_passes(
+        [("ジョー・ギブス", "PER", "P27", "ジャマイカ", "LOC")],
+        [("ジョー・ギブス (音楽プロデューサー)", "PER", "P27", "ジャマイカ", "LOC")],
+    ))
+    assert [e["name"] for e in merged] == ["ジョー・ギブス", "ジャマイカ"]
+
+
+def test_qualifier_does_not_chain_across_types():
+    merged, triples = _merge(*_passes(
+        [("東京", "LOC", "P17", "日本", "LOC")],
+        [("東京", "ART", "P17", "日本", "LOC")],
+        [("東京 (曲)", "ART", "P175", "某歌手", "PER")],
+    ))
+    assert [e["name"] for e in merged] == ["東京", "日本", "東京 (曲)", "某歌手"]
+    assert triples == [("e0", "P17", "e1"), ("e2", "P175", "e3")]
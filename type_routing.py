@@ -0,0 +1,202 @@
+"""Type-aware relation-group routing: skip groups and P-codes a document cannot support.
+
+A cheap regex pre-pass guesses which entity types a document mentions, and
+the domain/range constraint table decides which relations have an allowed
+(head_type, tail_type) pair among them. A type that is wrongly detected only
+costs an unnecessary relation in the prompt, while a missed type drops
+relations, so detection errs towards recall; but a cue that fires on every
+article detects every type and routes nothing away.
+
+    python type_routing.py --split dev     # skip rate and gold recall on dev
+"""
+
+import argparse
+import os
+import re
+import weakref
+
+from constraint_index import ConstraintIndex, load_or_build_constraint_index
+from data_loader import doc_to_text, load_jacred, source_fingerprint
+from prompts import RELATION_GROUPS
+
+# Surface cues per entity type (JacRED documents are Wikipedia articles).
+# Only multi-character cues or cues anchored to a number/particle are used:
+# single characters such as 子, 国 or 作 occur in nearly every article and
+# would detect every type everywhere, so nothing would ever be skipped.
+TYPE_CUES = {
+    "PER": re.compile(
+        # Lifespan in the lead sentence: （1990年1月1日 - ） / （- 2020年3月4日）
+        r"[0-9０-９]{1,4}年[0-9０-９]{1,2}月[0-9０-９]{1,2}日\s*[-－–〜]|"
+        r"[-－–〜]\s*[0-9０-９]{1,4}年[0-9０-９]{1,2}月[0-9０-９]{1,2}日\s*[）)]|"
+        r"選手|監督|俳優|女優|歌手|声優|作家|小説家|漫画家|画家|詩人|作曲家|作詞家|"
+        r"指揮者|脚本家|演出家|政治家|議員|大臣|首相|大統領|天皇|皇帝|国王|王妃|将軍|"
+        r"博士|教授|社長|会長|棋士|力士|騎手|タレント|アナウンサー|ミュージシャン|"
+        r"生まれ|出生|出身|死去|逝去|没年|亡くな|卒業|入学|入団|退団|引退|就任|"
+        r"結婚|離婚|婚約|息子|長男|次男|三男|長女|次女|父親|母親|兄弟|姉妹|夫人|"
+        r"妻|養子|祖父|祖母|叔父|叔母|伯父|伯母|彼は|彼女|氏[はがのと]"
+    ),
+    "ORG": re.compile(
+        r"会社|企業|大学|高等学校|高校|中学校|小学校|学院|学園|協会|連盟|連合|機構|"
+        r"財団|法人|団体|組合|政党|与党|野党|政府|内閣|省庁|[一-龥ァ-ヺ]{1,8}(?:党|省|庁)[のはがにでと]|"
+        r"陸軍|海軍|空軍|軍団|部隊|師団|自衛隊|委員会|銀行|研究所|病院|放送局|"
+        r"テレビ局|新聞社|出版社|レーベル|クラブ|チーム|球団|バンド|グループ|ユニット|"
+        r"事務所|劇団|ホールディングス|製作所|メーカー|本社|子会社|株式|商社|創業|設立"
+    ),
+    "LOC": re.compile(
+        r"北海道|東京都|京都府|大阪府|[一-龥]{1,3}県|"
+        r"[一-龥ァ-ヺ]{1,6}(?:市|町|村|郡|区|州)(?:[のにでへはがと]|出身|生まれ|在住)|"
+        r"[一-龥ァ-ヺ]{1,5}川(?:[のにではがへ]|流域)|[一-龥ァ-ヺ]{1,5}山(?:[のにではがへ]|頂)|"
+        r"地方|地域|半島|諸島|列島|山脈|山地|平野|盆地|湖|海峡|海岸|駅|空港|港|"
+        r"城|寺院|神社|公園|首都|王国|共和国|連邦|"
+        r"日本|アメリカ|イギリス|フランス|ドイツ|中国|韓国|ロシア|イタリア|"
+        r"スペイン|カナダ|オーストラリア|インド|ブラジル|台湾|朝鮮|ヨーロッパ|アジア"
+    ),
+    "ART": re.compile(
+        r"『|《|作品|映画|小説|漫画|アニメ|ドラマ|番組|アルバム|シングル|楽曲|"
+        r"収録曲|ゲーム|ソフト|シリーズ|書籍|雑誌|賞|法律|条約|憲法|"
+        r"[一-龥]{1,8}法[のはがにでと]"
+    ),
+    "DAT": re.compile(
+        r"[0-9０-９〇一二三四五六七八九十百千]+\s*(?:年|月|日)|"
+        r"(?:明治|大正|昭和|平成|令和|紀元前)|世紀|年代"
+    ),
+    "TIM": re.compile(r"[0-9０-９]+\s*(?:時|分|秒)|午前|午後"),
+    "MON": re.compile(
+        r"[0-9０-９一二三四五六七八九十百千万億兆,，.]+\s*"
+        r"(?:円|ドル|ユーロ|ポンド|元|ウォン|フラン|ルーブル)|[$¥€£]\s*[0-9]"
+    ),
+    "%": re.compile(r"[0-9０-９.]+\s*(?:[%％]|パーセント)|[0-9０-９一二三四五六七八九十]割"),
+    "NUM": re.compile(
+        r"[0-9０-９]+\s*(?:人|名|個|回|位|冊|枚|台|件|種|巻|話|試合|得点|勝|敗|"
+        r"km|m|kg|cm)"
+    ),
+}
+
+
+# ConstraintIndex -> its dict table; entries go away with the index
+_tables: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+
+def _as_table(constraint_table):
+    """The dict form of a constraint table, converting a ConstraintIndex once per index."""
+    if not isinstance(constraint_table, ConstraintIndex):
+        return constraint_table
+    table = _tables.get(constraint_table)
+    if table is None:
+        table = _tables[constraint_table] = constraint_table.to_table()
+    return table
+
+
+def detect_entity_types(text: str) -> set[str]:
+    """Entity types whose surface cues occur in text."""
+    return {etype for etype, pattern in TYPE_CUES.items() if pattern.search(text)}
+
+
+def feasible_relations(
+    pcodes: list[str],
+    types: set[str],
+    constraint_table: dict[str, set[tuple[str, str]]] | ConstraintIndex,
+) -> list[str]:
+    """The P-codes with an allowed (head_type, tail_type) pair within types.
+
+    A relation unobserved in training is unconstrained and always feasible,
+    matching apply_domain_range_constraints().
+    """
+    constraint_table = _as_table(constraint_table)
+    feasible = []
+    for pcode in pcodes:
+        allowed = constraint_table.get(pcode)
+        if not allowed or any(h in types and t in types for h, t in allowed):
+            feasible.append(pcode)
+    return feasible
+
+
+def route_groups(
+    types: set[str],
+    valid_relations: set[str],
+    constraint_table: dict[str, set[tuple[str, str]]] | ConstraintIndex,
+) -> dict[str, list[str]]:
+    """{group_name: feasible P-codes} in RELATION_GROUPS order; infeasible groups are left out."""
+    constraint_table = _as_table(constraint_table)
+    routes = {}
+    for group_name, pcodes in RELATION_GROUPS.items():
+        pcodes = [p for p in pcodes if p in valid_relations]
+        feasible = feasible_relations(pcodes, types, constraint_table)
+        if feasible:
+            routes[group_name] = feasible
+    return routes
+
+
+def evaluate_routing(
+    docs,
+    valid_relations: set[str],
+    constraint_table: dict[str, set[tuple[str, str]]] | ConstraintIndex,
+) -> dict:
+    """Skip rate and gold-relation recall of routing over JacRED-format docs.
+
+    skip_rate is the share of group calls skipped and pruned_rate the share
+    of grouped relations left out of the remaining prompts; gold_recall is
+    the share of gold labels (of grouped relations) whose relation is still
+    routed. per_type compares detected types with the gold vertexSet types.
+    """
+    grouped = [p for pcodes in RELATION_GROUPS.values() for p in pcodes if p in valid_relations]
+    groups = skipped = relations = pruned = gold = kept = 0
+    type_counts = {etype: [0, 0, 0] for etype in TYPE_CUES}  # tp, fp, fn
+    for doc in docs:
+        types = detect_entity_types(doc_to_text(doc))
+        routes = route_groups(types, valid_relations, constraint_table)
+        routed = {p for pcodes in routes.values() for p in pcodes}
+        groups += len(RELATION_GROUPS)
+        skipped += len(RELATION_GROUPS) - len(routes)
+        relations += len(grouped)
+        pruned += len(grouped) - len(routed)
+        for label in doc.get("labels", []):
+            if label["r"] in grouped:
+                gold += 1
+                kept += label["r"] in routed
+
+        gold_types = {m["type"] for vertex in doc["vertexSet"] for m in vertex}
+        for etype, counts in type_counts.items():
+            counts[0] += etype in types and etype in gold_types
+            counts[1] += etype in types and etype not in gold_types
+            counts[2] += etype not in types and etype in gold_types
+
+    return {
+        "docs": len(docs),
+        "skip_rate": skipped / groups if groups else 0.0,
+        "pruned_rate": pruned / relations if relations else 0.0,
+        "gold_recall": kept / gold if gold else 1.0,
+        "per_type": {
+            etype: {
+                "precision": tp / (tp + fp) if tp + fp else None,
+                "recall": tp / (tp + fn) if tp + fn else None,
+            }
+            for etype, (tp, fp, fn) in type_counts.items()
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate type-aware routing on a JacRED split")
+    parser.add_argument("--jacred", default="/tmp/JacRED/", help="JacRED directory")
+    parser.add_argument("--split", choices=["train", "dev", "test"], default="dev")
+    args = parser.parse_args()
+
+    data = load_jacred(args.jacred, lazy=True)
+    constraint_table = load_or_build_constraint_index(
+        data["train"], data["rel2id"], data["ent2id"],
+        path=os.path.join(args.jacred, ".snapshot", "constraint_index.json"),
+        fingerprint=source_fingerprint(os.path.join(args.jacred, "train.json")),
+    )
+    report = evaluate_routing(data[args.split], set(data["rel_info"]), constraint_table)
+    print(f"{args.split}: {report['docs']} docs, skipped {report['skip_rate']:.1%} of group calls, "
+          f"pruned {report['pruned_rate']:.1%} of relations, "
+          f"gold relations still routed {report['gold_recall']:.1%}")
+    for etype, m in report["per_type"].items():
+        p = "-" if m["precision"] is None else f"{m['precision']:.2f}"
+        r = "-" if m["recall"] is None else f"{m['recall']:.2f}"
+        print(f"  {etype:>4}: detection P={p} R={r}")
+
+
+if __name__ == "__main__":
+    main()
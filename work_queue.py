@@ -0,0 +1,224 @@
+"""SQLite-backed task queue with leases, heartbeats and expiry for corpus workers.
+
+Workers on one or more machines share the database file. A task is leased
+to one worker at a time; the lease is extended by heartbeats and a lease
+that expires (worker crashed or lost) makes the task available again.
+Timestamps are wall-clock, so machines sharing a queue need synced clocks.
+"""
+
+import json
+import sqlite3
+import threading
+import time
+
+DEFAULT_LEASE_SEC = 300.0
+DEFAULT_MAX_ATTEMPTS = 3
+
+
+class WorkQueue:
+    """Tasks are (condition, doc_index, title) rows moving pending -> leased -> done/failed."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = sqlite3.connect(path, timeout=60, isolation_level=None, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS tasks ("
+            " id INTEGER PRIMARY KEY,"
+            " condition TEXT NOT NULL,"
+            " doc_index INTEGER NOT NULL,"
+            " title TEXT NOT NULL,"
+            " status TEXT NOT NULL DEFAULT 'pending',"
+            " owner TEXT,"
+            " lease_expires REAL,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " done_by TEXT,"
+            " error TEXT,"
+            " UNIQUE (condition, doc_index))"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)"
+        )
+
+    def _write(self, sql: str, params: tuple = ()) -> int:
+        """Run one write statement in an immediate transaction. Returns rowcount."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                rowcount = self._conn.execute(sql, params).rowcount
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return rowcount
+
+    def init(self, config: dict, tasks: list[tuple[str, int, str]]) -> int:
+        """Store the run config and add tasks (existing ones are kept). Returns tasks added.
+
+        Re-initializing an existing queue requires the same config.
+        """
+        config = json.loads(json.dumps(config, ensure_ascii=False))
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT value FROM meta WHERE key = 'config'"
+                ).fetchone()
+                if row is not None and json.loads(row[0]) != config:
+                    raise ValueError(
+                        f"Queue {self.path} was initialized with a different configuration: "
+                        f"{row[0]} != {config}"
+                    )
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO meta (key, value) VALUES ('config', ?)",
+                    (json.dumps(config, ensure_ascii=False),),
+                )
+                before = self._conn.total_changes
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO tasks (condition, doc_index, title) VALUES (?, ?, ?)",
+                    tasks,
+                )
+                added = self._conn.total_changes - before
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return added
+
+    def config(self) -> dict:
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'config'").fetchone()
+        if row is None:
+            raise ValueError(f"Queue {self.path} has not been initialized")
+        return json.loads(row[0])
+
+    def lease(
+        self,
+        worker: str,
+        lease_sec: float = DEFAULT_LEASE_SEC,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+    ) -> dict | None:
+        """Lease the next pending (or expired) task to worker. None when nothing is left."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                # A lease that expired on its last attempt will never be retried
+                self._conn.execute(
+                    "UPDATE tasks SET status = 'failed', owner = NULL, lease_expires = NULL,"
+                    " error = 'lease expired on the last attempt'"
+                    " WHERE status = 'leased' AND lease_expires < ? AND attempts >= ?",
+                    (now, max_attempts),
+                )
+                row = self._conn.execute(
+                    "SELECT id, condition, doc_index, title, attempts FROM tasks"
+                    " WHERE attempts < ? AND (status = 'pending'"
+                    "  OR (status = 'leased' AND lease_expires < ?))"
+                    " ORDER BY id LIMIT 1",
+                    (max_attempts, now),
+                ).fetchone()
+                if row is not None:
+                    self._conn.execute(
+                        "UPDATE tasks SET status = 'leased', owner = ?, lease_expires = ?,"
+                        " attempts = attempts + 1 WHERE id = ?",
+                        (worker, now + lease_sec, row[0]),
+                    )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        task_id, condition, doc_index, title, attempts = row
+        return {
+            "id": task_id,
+            "condition": condition,
+            "doc_index": doc_index,
+            "title": title,
+            "attempt": attempts + 1,
+        }
+
+    def heartbeat(self, task_id: int, worker: str, lease_sec: float = DEFAULT_LEASE_SEC) -> bool:
+        """Extend worker's lease on task. False if the lease was lost."""
+        return self._write(
+            "UPDATE tasks SET lease_expires = ? WHERE id = ? AND owner = ? AND status = 'leased'",
+            (time.time() + lease_sec, task_id, worker),
+        ) == 1
+
+    def complete(self, task_id: int, worker: str) -> bool:
+        """Mark task done by worker. False if worker no longer holds the lease."""
+        return self._write(
+            "UPDATE tasks SET status = 'done', done_by = ?, lease_expires = NULL"
+            " WHERE id = ? AND owner = ? AND status = 'leased'",
+            (worker, task_id, worker),
+        ) == 1
+
+    def fail(
+        self,
+        task_id: int,
+        worker: str,
+        error: str,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+    ) -> None:
+        """Release a failed task for retry, or mark it failed after max_attempts."""
+        self._write(
+            "UPDATE tasks SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END,"
+            " owner = NULL, lease_expires = NULL, error = ?"
+            " WHERE id = ? AND owner = ? AND status = 'leased'",
+            (max_attempts, error, task_id, worker),
+        )
+
+    def release(self, task_id: int, worker: str) -> None:
+        """Hand a leased task back unprocessed (e.g. on shutdown) without using up an attempt."""
+        self._write(
+            "UPDATE tasks SET status = 'pending', owner = NULL, lease_expires = NULL,"
+            " attempts = attempts - 1 WHERE id = ? AND owner = ? AND status = 'leased'",
+            (task_id, worker),
+        )
+
+    def counts(self) -> dict[str, int]:
+        """Number of tasks per status."""
+        rows = self._conn.execute("SELECT status, COUNT(*) FROM tasks GROUP BY status").fetchall()
+        return dict(rows)
+
+    def done_by(self) -> dict[tuple[str, str], str]:
+        """{(condition, title): worker} for completed tasks.
+
+        Only that worker's result counts; a worker whose lease expired may
+        still have written a (duplicate) result for the same task.
+        """
+        rows = self._conn.execute(
+            "SELECT condition, title, done_by FROM tasks WHERE status = 'done'"
+        ).fetchall()
+        return {(condition, title): worker for condition, title, worker in rows}
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+class Heartbeat:
+    """Background thread that keeps a lease alive while a task is processed."""
+
+    def __init__(self, queue: WorkQueue, task_id: int, worker: str,
+                 lease_sec: float = DEFAULT_LEASE_SEC):
+        self._queue = queue
+        self._task_id = task_id
+        self._worker = worker
+        self._lease_sec = lease_sec
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self.lost = False
+
+    def _run(self) -> None:
+        while not self._stop.wait(self._lease_sec / 3):
+            if not self._queue.heartbeat(self._task_id, self._worker, self._lease_sec):
+                self.lost = True
+                return
+
+    def __enter__(self) -> "Heartbeat":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._stop.set()
+        self._thread.join()